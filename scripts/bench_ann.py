@@ -0,0 +1,169 @@
+# scripts/bench_ann.py
+# ANN index 종류별 recall@k / 검색 latency / 메모리 벤치마크 (Flat 결과를 정답으로)
+# - 벡터: rag_embedding_cache에 저장된 벡터 (재인코딩 없음) 또는 --synthetic N
+# - mem_mb: 직렬화 크기 실측, x_flat: Flat 대비 압축 배율
+# - --mmap: 파일로 저장 후 load_index_for_serving(mmap)으로 로드한 index로 검색 (serving 모드 latency)
+# - 예) python scripts/bench_ann.py --db data/dart.duckdb --model jhgan/ko-sroberta-multitask --k 10
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import duckdb
+import faiss
+import numpy as np
+
+from src.embed import (
+    create_index,
+    index_nbytes,
+    iter_stored_vectors,
+    load_index_for_serving,
+    set_search_params,
+    TRAIN_MAX,
+)
+from src.encoders import normalize_embeddings
+
+
+def load_vectors(db_path: str, model_name: str) -> tuple:
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        ids, embs = [], []
+        for vec_ids, emb in iter_stored_vectors(con, model_name):
+            ids.append(vec_ids)
+            embs.append(emb)
+    finally:
+        con.close()
+    if not embs:
+        raise SystemExit(f"❌ 저장된 벡터 없음 (model={model_name})")
+    return np.concatenate(ids), np.concatenate(embs)
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> tuple:
+    # 군집 구조가 있는 가짜 임베딩 (균일 난수는 ANN에 비현실적으로 불리)
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return np.arange(n, dtype=np.int64), normalize_embeddings(x).astype(np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / float(truth.shape[0] * k)
+
+
+def timed_search(index: faiss.Index, q: np.ndarray, k: int) -> tuple:
+    t0 = time.perf_counter()
+    _, I = index.search(q, k)
+    return I, (time.perf_counter() - t0) * 1000.0 / len(q)
+
+
+def bench(
+    ids: np.ndarray,
+    x: np.ndarray,
+    kinds: List[str],
+    k: int,
+    n_queries: int,
+    nprobes: List[int],
+    efs: List[int],
+    seed: int = 0,
+    mmap: bool = False,
+) -> List[Dict]:
+    n, dim = x.shape
+    rng = np.random.default_rng(seed)
+    q = x[rng.choice(n, size=min(n_queries, n), replace=False)]
+    train_x = x[rng.choice(n, size=min(TRAIN_MAX, n), replace=False)]
+
+    # 정답: flat
+    gt_index = create_index("flat", dim, n)
+    gt_index.add_with_ids(x, ids)
+    truth, flat_ms = timed_search(gt_index, q, k)
+    flat_bytes = index_nbytes(gt_index)
+
+    out = [{
+        "kind": "flat", "param": "-", "recall": 1.0, "ms_per_query": flat_ms,
+        "build_s": 0.0, "mem_mb": flat_bytes / 1e6, "x_flat": 1.0,
+    }]
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ann_") if mmap else None
+
+    for kind in kinds:
+        if kind == "flat":
+            continue
+        t0 = time.perf_counter()
+        index = create_index(kind, dim, n, train_x)
+        index.add_with_ids(x, ids)
+        build_s = time.perf_counter() - t0
+        nbytes = index_nbytes(index)
+
+        if mmap:
+            path = os.path.join(tmp_dir, f"{kind}.index")
+            faiss.write_index(index, path)
+            index = load_index_for_serving(path, mmap=True)
+
+        if kind == "hnsw":
+            grid = [("efSearch", v) for v in efs]
+        elif kind.startswith("ivf"):
+            grid = [("nprobe", v) for v in nprobes]
+        else:
+            grid = [("-", None)]
+
+        for name, v in grid:
+            set_search_params(index, nprobe=v if name == "nprobe" else None, ef_search=v if name == "efSearch" else None)
+            found, ms = timed_search(index, q, k)
+            out.append({
+                "kind": kind, "param": "-" if v is None else f"{name}={v}", "recall": recall_at_k(found, truth, k),
+                "ms_per_query": ms, "build_s": build_s,
+                "mem_mb": nbytes / 1e6, "x_flat": flat_bytes / max(nbytes, 1),
+            })
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description="FAISS index 종류별 recall@k vs latency (Flat 기준)")
+    p.add_argument("--db", default=None, help="DuckDB 경로 (rag_embedding_cache 벡터 사용)")
+    p.add_argument("--model", default=None, help="임베딩 model_name (--db 사용 시 필수)")
+    p.add_argument("--synthetic", type=int, default=0, help="DB 대신 가짜 벡터 N개")
+    p.add_argument("--dim", type=int, default=768, help="--synthetic 벡터 차원")
+    p.add_argument("--kinds", default="sq8,ivf_flat,ivf_sq8,ivf_pq,hnsw", help="비교할 index 종류 (콤마)")
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--queries", type=int, default=1000)
+    p.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe 후보 (콤마)")
+    p.add_argument("--ef", default="16,64,128,256", help="HNSW efSearch 후보 (콤마)")
+    p.add_argument("--threads", type=int, default=0, help="faiss omp 스레드 (0=기본)")
+    p.add_argument("--mmap", action="store_true", help="load_index_for_serving mmap 로드 index로 검색 (serving 모드)")
+    args = p.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    if args.synthetic:
+        ids, x = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        if not (args.db and args.model):
+            raise SystemExit("❌ --db/--model 또는 --synthetic N 필요")
+        ids, x = load_vectors(args.db, args.model)
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    print(f"📦 vectors: n={len(x)} dim={x.shape[1]} k={args.k} queries={min(args.queries, len(x))}")
+
+    rows = bench(
+        ids, x, kinds, args.k, args.queries,
+        nprobes=[int(v) for v in args.nprobe.split(",")],
+        efs=[int(v) for v in args.ef.split(",")],
+        mmap=args.mmap,
+    )
+
+    print(f"{'kind':<10} {'param':<14} {'recall@' + str(args.k):>10} {'ms/query':>10} {'build_s':>9} {'mem_mb':>9} {'x_flat':>7}")
+    for r in rows:
+        print(f"{r['kind']:<10} {r['param']:<14} {r['recall']:>10.4f} {r['ms_per_query']:>10.3f} "
+              f"{r['build_s']:>9.2f} {r['mem_mb']:>9.1f} {r['x_flat']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# scripts/bench_encoders.py
+# 인코더 backend별 CPU 처리량 (chunks/s) + st 대비 cosine 일치도
+# - 텍스트: rag_text_chunks 샘플 (또는 --texts-file, 한 줄 = 1 chunk)
+# - bucketed=on/off: 토큰 길이 정렬 배치 효과 비교
+# - 예) python scripts/bench_encoders.py --db data/duckdb/dart.duckdb --model jhgan/ko-sroberta-multitask --n 2000
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import argparse
+import time
+from typing import List
+
+import duckdb
+import numpy as np
+
+from src.encoders import ENCODER_BACKENDS, make_encoder
+
+
+def load_texts(db_path: str, n: int, seed: int = 42) -> List[str]:
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        cols = [r[1] for r in con.execute("PRAGMA table_info('rag_text_chunks')").fetchall()]
+        col = "text_for_embed" if "text_for_embed" in cols else "text"
+        rows = con.execute(f"""
+          SELECT coalesce({col}, '')
+          FROM (SELECT {col} FROM rag_text_chunks) t
+          USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})
+        """).fetchall()
+    finally:
+        con.close()
+    return [r[0] for r in rows]
+
+
+def main():
+    p = argparse.ArgumentParser(description="encoder backend별 chunks/s (CPU)")
+    p.add_argument("--model", required=True)
+    p.add_argument("--db", default=None, help="DuckDB 경로 (rag_text_chunks 샘플)")
+    p.add_argument("--texts-file", default=None, help="한 줄 = 1 chunk 텍스트 파일")
+    p.add_argument("--n", type=int, default=2000, help="샘플 chunk 수")
+    p.add_argument("--backends", default=",".join(b for b in ENCODER_BACKENDS if b != "service"),
+                   help="비교할 backend (콤마, service는 embed_service 실행 중일 때만)")
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--no-unbucketed", action="store_true", help="bucketed=off 측정 생략")
+    args = p.parse_args()
+
+    if args.texts_file:
+        texts = [l.rstrip("\n") for l in open(args.texts_file, encoding="utf-8") if l.strip()][: args.n]
+    elif args.db:
+        texts = load_texts(args.db, args.n)
+    else:
+        raise SystemExit("❌ --db 또는 --texts-file 필요")
+    print(f"📦 texts: n={len(texts)} avg_chars={np.mean([len(t) for t in texts]):.0f}")
+
+    ref = None
+    results = []
+    skipped = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        t0 = time.perf_counter()
+        try:
+            enc = make_encoder(args.model, backend, batch_size=args.batch_size)
+        except Exception as e:
+            # 설치 안 된 extra / 떠 있지 않은 서비스 → 건너뛰고 나머지 backend는 계속 측정
+            print(f"⚠️ skip backend={backend}: {type(e).__name__}: {e}")
+            skipped.append(backend)
+            continue
+        load_s = time.perf_counter() - t0
+        try:
+            enc.encode(texts[: min(32, len(texts))])  # warmup
+
+            modes = [True] if args.no_unbucketed else [True, False]
+            for bucketed in modes:
+                t0 = time.perf_counter()
+                emb = enc.encode(texts, bucketed=bucketed)
+                sec = time.perf_counter() - t0
+
+                if ref is None:
+                    ref = emb
+                cos = np.sum(ref * emb, axis=1)
+                results.append({
+                    "backend": backend,
+                    "bucketed": "on" if bucketed else "off",
+                    "chunks_s": len(texts) / sec,
+                    "load_s": load_s,
+                    "cos_mean": float(cos.mean()),
+                    "cos_min": float(cos.min()),
+                })
+        finally:
+            enc.close()
+
+    print(f"{'backend':<10} {'bucketed':<8} {'chunks/s':>10} {'load_s':>8} {'cos_mean':>9} {'cos_min':>9}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['bucketed']:<8} {r['chunks_s']:>10.1f} {r['load_s']:>8.1f} "
+              f"{r['cos_mean']:>9.4f} {r['cos_min']:>9.4f}")
+    if skipped:
+        print(f"⏭️ skipped: {', '.join(skipped)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# scripts/run_backfill.py
+# 기존 DB에 ingest 시점 파생 컬럼을 채우는 일회성/주기성 백필 + 정합성 체크
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+load_dotenv()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Backfill ingest-time derived columns")
+    p.add_argument("--db-path", default=os.environ.get("DB_PATH", str(ROOT / "data" / "duckdb" / "dart.duckdb")))
+    p.add_argument("--label-norm", action="store_true", help="fs_line_items.label_norm 백필")
+    p.add_argument("--value-won", action="store_true", help="fs_facts.value_won / decimals 백필")
+    p.add_argument("--std-map", action="store_true", help="line_item_std_map(계정 매칭 결과) 백필")
+    p.add_argument("--all", action="store_true", help="NULL 행만이 아니라 전체 재계산")
+    p.add_argument("--check", action="store_true", help="SQL/Python 정규화 규칙 정합성 체크")
+    args = p.parse_args()
+
+    import duckdb
+    from src.ingest import backfill_label_norm, backfill_value_won
+    from src.calc import refresh_line_item_std_map
+    from src.validate import check_label_norm_consistency
+
+    con = duckdb.connect(str(args.db_path))
+    try:
+        if args.label_norm:
+            n = backfill_label_norm(con, only_missing=not args.all)
+            print(f"✅ label_norm backfilled: {n} rows")
+
+        if args.value_won:
+            n = backfill_value_won(con, only_missing=not args.all)
+            print(f"✅ value_won backfilled: {n} rows")
+
+        if args.std_map:
+            n = refresh_line_item_std_map(con, only_missing=not args.all)
+            print(f"✅ line_item_std_map matched: {n} line items")
+
+        if args.check:
+            qc = check_label_norm_consistency(con)
+            print("- label_norm missing :", qc["missing_cnt"])
+            print("- label_norm mismatch:", qc["mismatch_cnt"])
+            if qc["mismatch_cnt"] > 0:
+                print("⚠️ SQL/Python 정규화 결과가 다른 행 (top rows):")
+                print(qc["mismatch"].head(20))
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,28 +7,36 @@ sys.path.insert(0, str(ROOT))
 
 import argparse
 import json
-from typing import List
+from typing import List, Optional, Tuple
 
 import duckdb
 import pandas as pd
 
 from src.calc import (
     build_account_map_rules,
+    refresh_line_item_std_map,
     create_calc_views,
     create_metric_catalog,
-    load_fact_metrics,
-    update_benchmark_values,
-    update_benchmark_improved,
+    refresh_calc_tables,
+    load_fact_metrics_with_benchmark,
+    load_fact_metrics_batch,
+    build_fact_metrics_peer,
+    calc_result_fingerprint,
+    is_calc_result_fresh,
+    stamp_calc_result,
 )
+from src.ingest import backfill_label_norm, backfill_value_won
 from src.validate import (
+    CheckResult,
     fetch_fact_metrics,
+    fetch_peer_stats,
     fetch_metric_catalog,
-    fetch_ratio_requirements,
-    fetch_value_augmented,
+    fetch_validation_results,
+    fetch_accounting_violations,
+    run_accounting_qc,
+    run_sql_validation,
     validate_coverage,
     validate_catalog_alignment,
-    validate_raw_rows,
-    validate_ratio_rows,
 )
 
 
@@ -123,16 +131,36 @@ def assert_required_tables(con):
         )
 
 
-def ensure_calc_initialized(con):
+def ensure_calc_initialized(con, materialized: bool = False):
     """
     calc.py에서 계산에 필요한 매핑룰/뷰/카탈로그를 항상 준비.
     - idempotent: 매번 실행해도 동일 상태로 재구성됨
+    - materialized=True: 뷰 체인 대신 m_* 테이블을 쓰고, 변경된 report만 증분 갱신
     """
+    print("🧱 INIT: backfill fs_line_items.label_norm (NULL rows only)")
+    n = backfill_label_norm(con, only_missing=True)
+    if n:
+        print(f"✅ label_norm backfilled: {n} rows")
+
+    print("🧱 INIT: backfill fs_facts.value_won (NULL rows only)")
+    n = backfill_value_won(con, only_missing=True)
+    if n:
+        print(f"✅ value_won backfilled: {n} rows")
+
     print("🧱 INIT: build account_map_rules")
     build_account_map_rules(con)
 
+    print("🧱 INIT: refresh line_item_std_map (new line items / changed rules only)")
+    n = refresh_line_item_std_map(con, only_missing=True)
+    if n:
+        print(f"✅ line_item_std_map matched: {n} line items")
+
     print("🧱 INIT: create calc views (v_analysis_compare, v_value_augmented, v_financial_ratios, ratio_requirements...)")
-    create_calc_views(con)
+    create_calc_views(con, materialized=materialized)
+
+    if materialized:
+        print("🧱 INIT: refresh materialized calc tables")
+        refresh_calc_tables(con)
 
     print("🧱 INIT: create metric_catalog")
     create_metric_catalog(con)
@@ -144,9 +172,35 @@ def ensure_calc_initialized(con):
 # JSON 출력 유틸
 # ============================================================
 
-def export_metrics_json(con, corp_code: str, bsns_year: int, metrics_spec: List[str], out_path: str):
+def _to_opt_float(v):
+    return None if pd.isna(v) else float(v)
+
+
+def export_metrics_json(
+    con,
+    corp_code: str,
+    bsns_year: int,
+    metrics_spec: List[str],
+    out_path: str,
+    include_peer: bool = False,
+):
     df = fetch_fact_metrics(con, corp_code, bsns_year, metrics_spec)
 
+    # metric_key -> [peer group 통계...] (fact_metrics_peer가 만들어져 있을 때만)
+    peer_by_key = {}
+    if include_peer:
+        for _, p in fetch_peer_stats(con, corp_code, bsns_year, metrics_spec).iterrows():
+            peer_by_key.setdefault(p["metric_key"], []).append({
+                "peer_group": p["peer_group"],
+                "peer_n": int(p["peer_n"]),
+                "pct_rank": _to_opt_float(p["pct_rank"]),
+                "median": _to_opt_float(p["peer_median"]),
+                "q1": _to_opt_float(p["peer_q1"]),
+                "q3": _to_opt_float(p["peer_q3"]),
+                "iqr": _to_opt_float(p["peer_iqr"]),
+                "z_score": _to_opt_float(p["z_score"]),
+            })
+
     rows = []
     for _, r in df.iterrows():
         rows.append({
@@ -162,6 +216,8 @@ def export_metrics_json(con, corp_code: str, bsns_year: int, metrics_spec: List[
             "benchmark_value": None if pd.isna(r["benchmark_value"]) else float(r["benchmark_value"]),
             "benchmark_improved": None if pd.isna(r["benchmark_improved"]) else bool(r["benchmark_improved"]),
         })
+        if include_peer:
+            rows[-1]["peer"] = peer_by_key.get(r["metric_key"], [])
 
     payload = {"corp_code": corp_code, "bsns_year": bsns_year, "rows": rows}
 
@@ -178,14 +234,27 @@ def export_metrics_json(con, corp_code: str, bsns_year: int, metrics_spec: List[
 def run_validation(con, corp_code: str, bsns_year: int, metrics_spec: List[str]):
     df = fetch_fact_metrics(con, corp_code, bsns_year, metrics_spec)
     catalog = fetch_metric_catalog(con)
-    ratio_req = fetch_ratio_requirements(con)
-    value_aug = fetch_value_augmented(con, corp_code, bsns_year)
+
+    # raw yoy / ratio 재계산은 SQL 1회 → validation_results
+    run_sql_validation(con, corp_code, bsns_year, metrics_spec)
 
     checks = []
     checks += validate_coverage(df, metrics_spec)
     checks += validate_catalog_alignment(df, catalog)
-    checks += validate_raw_rows(df)
-    checks += validate_ratio_rows(df, ratio_req, value_aug)
+    checks += fetch_validation_results(con, corp_code, bsns_year, metrics_spec)
+
+    # 회계 항등식 위반은 WARN (파싱 오류 의심 report를 LLM 전에 표시)
+    report_ids = [r[0] for r in con.execute(
+        "SELECT report_id FROM reports WHERE corp_code = ? AND bsns_year = ?", [corp_code, bsns_year]
+    ).fetchall()]
+    if report_ids:
+        run_accounting_qc(con, report_ids)
+        for _, v in fetch_accounting_violations(con, report_ids).iterrows():
+            checks.append(CheckResult(
+                "WARN", None,
+                f"[identity] {v['identity']}@{v['fiscal_year']} off by {v['rel_err']:.2%} "
+                f"(lhs={v['lhs']}, rhs={v['rhs']}, tol={v['tol']})",
+            ))
 
     summary = {"PASS": 0, "WARN": 0, "FAIL": 0}
     for c in checks:
@@ -205,6 +274,63 @@ def run_validation(con, corp_code: str, bsns_year: int, metrics_spec: List[str])
     return summary, checks
 
 
+# ============================================================
+# 배치 모드 (여러 corp_code/bsns_year 한 번에)
+# ============================================================
+
+def fetch_target_pairs(con, bsns_year: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    benchmark_map에 등록된 (corp_code, year) 중 reports가 있는 pair 목록
+    """
+    rows = con.execute(
+        """
+        SELECT DISTINCT bm.corp_code, bm.year
+        FROM benchmark_map bm
+        WHERE bm.bench_corp_code IS NOT NULL
+          AND (? IS NULL OR bm.year = ?)
+          AND EXISTS (
+            SELECT 1 FROM reports r
+            WHERE r.corp_code = bm.corp_code
+              AND r.bsns_year = bm.year
+          )
+        ORDER BY 1, 2
+        """,
+        [bsns_year, bsns_year],
+    ).fetchall()
+    return [(str(c), int(y)) for (c, y) in rows]
+
+
+def run_batch(
+    con,
+    pairs: List[Tuple[str, int]],
+    metrics_spec: List[str],
+    out_dir: Optional[str],
+    include_peer: bool = False,
+):
+    """
+    pair별 반복 대신 set-based 적재 1회 → (옵션) pair별 JSON 출력
+    - pandas 검증은 pair 단위라 배치에서는 생략 (단건 모드로 재확인)
+    """
+    metrics_spec = _normalize_metrics_spec(metrics_spec)
+
+    print(f"🚀 BATCH: fact_metrics 적재 (pairs={len(pairs)})")
+    load_fact_metrics_batch(con, pairs, metrics_spec)
+
+    if out_dir:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        for corp_code, bsns_year in pairs:
+            export_metrics_json(
+                con,
+                corp_code=corp_code,
+                bsns_year=bsns_year,
+                metrics_spec=metrics_spec,
+                out_path=str(Path(out_dir) / f"metrics_{corp_code}_{bsns_year}.json"),
+                include_peer=include_peer,
+            )
+
+    print("🎉 run_calc.py (batch) completed successfully")
+
+
 # ============================================================
 # main
 # ============================================================
@@ -212,33 +338,68 @@ def run_validation(con, corp_code: str, bsns_year: int, metrics_spec: List[str])
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--db", required=True, help="duckdb file path")
-    ap.add_argument("--corp_code", required=True)
-    ap.add_argument("--bsns_year", type=int, required=True)
+    ap.add_argument("--corp_code", default=None)
+    ap.add_argument("--bsns_year", type=int, default=None)
     ap.add_argument("--metrics_spec", nargs="+", required=True, help="metric keys list")
     ap.add_argument("--out", default="metrics.json")
     ap.add_argument("--no_init", action="store_true", help="skip init (assumes views/catalog already exist)")
+    ap.add_argument("--materialized", action="store_true", help="use incrementally refreshed m_* tables instead of the view chain")
+    ap.add_argument("--peer", action="store_true", help="rebuild fact_metrics_peer (peer percentile/median/IQR/z-score) and add it to the JSON")
+    ap.add_argument("--force", action="store_true", help="recompute even if the input fingerprint is unchanged")
+    ap.add_argument("--pairs", nargs="+", default=None, help="batch mode: corp_code:bsns_year list")
+    ap.add_argument("--all_targets", action="store_true", help="batch mode: every benchmark_map pair that has reports (--bsns_year filters)")
+    ap.add_argument("--out_dir", default=None, help="batch mode: write metrics_<corp>_<year>.json per pair")
 
     args = ap.parse_args()
+    batch = bool(args.pairs) or args.all_targets
+    if not batch and (args.corp_code is None or args.bsns_year is None):
+        ap.error("--corp_code and --bsns_year are required (or use --pairs / --all_targets)")
     con = duckdb.connect(args.db, read_only=False)
 
     # ✅ 0) 초기화 보장
     if not args.no_init:
         assert_required_tables(con)
-        ensure_calc_initialized(con)
+        ensure_calc_initialized(con, materialized=args.materialized)
+
+    if args.peer:
+        print("🧱 PEER: build fact_metrics_peer (all corps / years)")
+        build_fact_metrics_peer(con)
+
+    if batch:
+        if args.pairs:
+            pairs = []
+            for p in args.pairs:
+                c, _, y = p.partition(":")
+                if not c or not y.isdigit():
+                    ap.error(f"invalid --pairs entry: {p} (expected corp_code:bsns_year)")
+                pairs.append((c, int(y)))
+        else:
+            pairs = fetch_target_pairs(con, args.bsns_year)
+        if not pairs:
+            raise SystemExit("❌ no target pairs")
+        run_batch(con, pairs, args.metrics_spec, args.out_dir, include_peer=args.peer)
+        return
 
     # ✅ 주입(요청 컨텍스트/메트릭 목록)
     inject_request_context(con, args.corp_code, args.bsns_year, store_prev_year=True)
     metrics_spec = inject_request_metrics(con, args.metrics_spec)
 
-    print("🚀 STEP 1: fact_metrics 적재 (target)")
-    load_fact_metrics(
-        con,
-        corp_code=args.corp_code,
-        bsns_year=args.bsns_year,
-        metrics_spec=metrics_spec,
-    )
+    # ✅ 입력 fingerprint가 지난 계산과 같으면 적재/벤치/검증 생략 → JSON만 출력
+    fingerprint = calc_result_fingerprint(con, args.corp_code, args.bsns_year, metrics_spec)
+    if not args.force and is_calc_result_fresh(con, args.corp_code, args.bsns_year, metrics_spec, fingerprint):
+        print(f"⏭️ inputs unchanged (fingerprint={fingerprint[:12]}) → skip calc, export only")
+        export_metrics_json(
+            con,
+            corp_code=args.corp_code,
+            bsns_year=args.bsns_year,
+            metrics_spec=metrics_spec,
+            out_path=args.out,
+            include_peer=args.peer,
+        )
+        print("🎉 run_calc.py completed successfully (cached)")
+        return
 
-    print("🚀 STEP 1.5: benchmark corp_code 조회")
+    print("🚀 STEP 1: benchmark corp_code 조회")
     bench_row = con.execute(
         """
         SELECT bench_corp_code
@@ -252,34 +413,17 @@ def main():
     if not bench_row or not bench_row[0]:
         raise SystemExit(f"❌ benchmark_map missing: corp={args.corp_code}, year={args.bsns_year}")
 
-    bench_corp_code = bench_row[0]
-    print("✅ benchmark selected:", bench_corp_code)
+    print("✅ benchmark selected:", bench_row[0])
 
-    print("🚀 STEP 1.6: fact_metrics 적재 (benchmark)")
-    load_fact_metrics(
-        con,
-        corp_code=bench_corp_code,
-        bsns_year=args.bsns_year,
-        metrics_spec=metrics_spec,
-    )
-
-    print("🚀 STEP 2: benchmark_value 채우기")
-    update_benchmark_values(
-        con,
-        corp_code=args.corp_code,
-        bsns_year=args.bsns_year,
-        metrics_spec=metrics_spec,
-    )
-
-    print("🚀 STEP 3: benchmark_improved 계산")
-    update_benchmark_improved(
+    print("🚀 STEP 2: fact_metrics 적재 (target + benchmark 값/개선 여부, INSERT 1회)")
+    load_fact_metrics_with_benchmark(
         con,
         corp_code=args.corp_code,
         bsns_year=args.bsns_year,
         metrics_spec=metrics_spec,
     )
 
-    print("🚀 STEP 4: 검증 파이프라인 실행")
+    print("🚀 STEP 3: 검증 파이프라인 실행")
     run_validation(
         con,
         corp_code=args.corp_code,
@@ -287,13 +431,16 @@ def main():
         metrics_spec=metrics_spec,
     )
 
-    print("🚀 STEP 5: JSON 출력")
+    stamp_calc_result(con, args.corp_code, args.bsns_year, metrics_spec, fingerprint)
+
+    print("🚀 STEP 4: JSON 출력")
     export_metrics_json(
         con,
         corp_code=args.corp_code,
         bsns_year=args.bsns_year,
         metrics_spec=metrics_spec,
         out_path=args.out,
+        include_peer=args.peer,
     )
 
     print("🎉 run_calc.py completed successfully")
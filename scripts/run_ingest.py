@@ -209,26 +209,27 @@ def main():
     # 4) (선택) QC
     if args.qc:
         import duckdb
-        from src.validate import validate_ingest_report, validate_market_tables
+        from src.validate import (
+            validate_ingest_report,
+            validate_market_tables,
+            fetch_market_qc,
+            run_accounting_qc,
+            fetch_accounting_violations,
+        )
 
         con = duckdb.connect(str(db_path))
         try:
             print("\n🧪 QC: market tables")
-            market_qc = validate_market_tables(con)
+            # 이번 실행에서 seed 했으면 seed가 건드린 (corp_code, year)만 재검사
+            market_qc = validate_market_tables(con, only_touched=bool(args.seed_market))
             print("- market_data_rows:", market_qc["market_data_rows"])
             print("- benchmark_map_rows:", market_qc["benchmark_map_rows"])
+            print("- incremental:", market_qc["incremental"])
 
-            if len(market_qc["dup_market"]) > 0:
-                print("⚠️ dup_market (top rows):")
-                print(market_qc["dup_market"].head(10))
-
-            if len(market_qc["dup_map"]) > 0:
-                print("⚠️ dup_map (top rows):")
-                print(market_qc["dup_map"].head(10))
-
-            if len(market_qc["missing_bench_in_market_data"]) > 0:
-                print("⚠️ missing_bench_in_market_data (top rows):")
-                print(market_qc["missing_bench_in_market_data"].head(10))
+            for check, n in market_qc["issues"].items():
+                if n > 0:
+                    print(f"⚠️ {check}: {n} (top rows)")
+                    print(fetch_market_qc(con, check, limit=10))
 
             print("\n🧪 QC: ingest target report")
             tgt = validate_ingest_report(con, target_report_id)
@@ -246,6 +247,21 @@ def main():
                 print(b["chunks"])
                 print("- fs_facts_cnt:", b["fs_facts_cnt"])
                 print("- note_links_cnt:", b["note_links_cnt"])
+
+            # 회계 항등식 QC는 calc 뷰(v_fin_long_mapped)가 있어야 함 (run_calc.py 1회 실행 후)
+            has_view = con.execute(
+                "SELECT 1 FROM information_schema.tables WHERE table_name='v_fin_long_mapped'"
+            ).fetchone()
+            if has_view:
+                rids = [r for r in (target_report_id, bench_report_id) if r]
+                print("\n🧪 QC: accounting identities")
+                print(run_accounting_qc(con, rids))
+                viol = fetch_accounting_violations(con, rids)
+                if len(viol) > 0:
+                    print("⚠️ identity violations (top rows):")
+                    print(viol.head(10))
+            else:
+                print("\nℹ️ v_fin_long_mapped 없음 → 회계 항등식 QC 생략 (run_calc.py 실행 후 다시 --qc)")
         finally:
             con.close()
 
@@ -1,17 +1,13 @@
 # src/calc.py
-import re
-from typing import List
+import ast
+import hashlib
+from typing import List, Tuple
 
+import pandas as pd
 
-# ============================================================
-# 0) label 정규화 함수 (ACCOUNT_MAP와 SQL norm 규칙 일치)
-# ============================================================
-
-def norm_label(s: str) -> str:
-    s = "" if s is None else str(s)
-    s = s.lower()
-    s = re.sub(r"[\s\.\,\-\(\)\/\[\]·•:;]+", "", s)
-    return s
+# label 정규화 함수는 ingest(fs_line_items.label_norm 적재)와 공유 → utils로 이동
+from .utils.normalize import norm_label
+from .utils.account_matcher import AccountMatcher
 
 
 # ============================================================
@@ -67,6 +63,21 @@ ACCOUNT_MAP = [
     ("CF", "DISPOSAL_LT_FIN_ASSETS", ["장기금융상품의 처분"]),
 ]
 
+# EXACT로 못 잡는 라벨 변형용 (norm_label 적용 후 문자열 기준, 패턴은 정규화 안 함)
+# - REGEX: re.match(".*?(?:pattern)") / LIKE: '%', '_' 전체 일치
+ACCOUNT_MAP_PATTERNS = [
+    # '(A)', '(손실)' 같은 접미 변형 — 손실 단독 라벨(부호 반대일 수 있음)은 매칭하지 않음
+    ("IS_CIS", "OP_PROFIT",      "REGEX", r"^영업이익(손실)?[a-z]?$"),
+    ("IS_CIS", "NET_INCOME",     "REGEX", r"^당기순이익(손실)?[a-z]?$"),
+    ("IS_CIS", "TAX_EXP",        "REGEX", r"^법인세(비용(수익)?|수익비용)[a-z]?$"),
+    ("IS_CIS", "PRE_TAX_INCOME", "REGEX", r"^법인세비용차감전(계속영업)?(순이익|이익)(손실)?[a-z]?$"),
+
+    # '…활동으로 인한/부터의/인한 순 현금흐름' (영업에서 창출된 현금 같은 하위 항목은 제외)
+    ("CF", "OCF",     "LIKE", "영업활동으로%현금흐름"),
+    ("CF", "ICF",     "LIKE", "투자활동으로%현금흐름"),
+    ("CF", "FCF_FIN", "LIKE", "재무활동으로%현금흐름"),
+]
+
 
 # ============================================================
 # 2) account_map_rules 적재
@@ -89,6 +100,18 @@ def build_account_map_rules(con):
                 "max_indent": None,
             })
 
+    for scope, std_key, match_type, pattern in ACCOUNT_MAP_PATTERNS:
+        rows.append({
+            "scope": scope,
+            "std_key": std_key,
+            "match_type": match_type,
+            "pattern_raw": pattern,
+            "pattern": pattern,
+            "priority": priority_by_type[match_type],
+            "min_indent": None,
+            "max_indent": None,
+        })
+
     # dedup by PK
     dedup = {}
     for r in rows:
@@ -126,15 +149,98 @@ def build_account_map_rules(con):
     ])
 
 
+def create_line_item_std_map_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS line_item_std_map (
+      line_item_id VARCHAR PRIMARY KEY,
+      std_key VARCHAR,            -- NULL: 매칭 룰 없음 (재매칭 방지용으로 행은 남김)
+      match_type VARCHAR,
+      priority INTEGER,
+      pattern_raw VARCHAR,
+      rules_hash VARCHAR          -- 매칭 당시 account_map_rules 해시 (룰 변경 시 재매칭 대상)
+    );
+    """)
+
+
+def _account_rules_hash(rules: List[tuple]) -> str:
+    h = hashlib.sha1()
+    for r in sorted(rules, key=lambda x: tuple("" if v is None else str(v) for v in x)):
+        h.update("|".join("" if v is None else str(v) for v in r).encode("utf-8"))
+    return h.hexdigest()
+
+
+def refresh_line_item_std_map(con, only_missing: bool = True) -> int:
+    """
+    fs_line_items → line_item_std_map (line_item별 최종 std_key 1개)
+    - only_missing=True : 맵에 없거나 rules_hash가 현재 룰과 다른 행만 (마지막 calc 이후 ingest된 신규 line_item)
+    - only_missing=False: 전체 재매칭
+    account_map_rules가 아직 없으면(calc 초기화 전) 아무것도 하지 않음
+    반환: 새로 매칭(기록)한 line_item 수
+    """
+    create_line_item_std_map_table(con)
+
+    ok = con.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_name = 'account_map_rules'"
+    ).fetchone()
+    if not ok:
+        return 0
+
+    rules = con.execute("""
+      SELECT scope, std_key, match_type, pattern, pattern_raw, priority
+      FROM account_map_rules
+      WHERE is_active = TRUE
+    """).fetchall()
+    rules_hash = _account_rules_hash(rules)
+    matcher = AccountMatcher(rules)
+
+    if only_missing:
+        con.execute("DELETE FROM line_item_std_map WHERE rules_hash IS DISTINCT FROM ?", [rules_hash])
+    else:
+        con.execute("DELETE FROM line_item_std_map;")
+
+    items = con.execute("""
+      SELECT li.line_item_id, li.statement_type, li.label_norm
+      FROM fs_line_items li
+      WHERE li.label_norm IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM line_item_std_map m WHERE m.line_item_id = li.line_item_id)
+    """).fetchall()
+    if not items:
+        return 0
+
+    out = []
+    for line_item_id, statement_type, label_norm in items:
+        hit = matcher.match(statement_type, label_norm)
+        if hit is None:
+            out.append((line_item_id, None, None, None, None, rules_hash))
+        else:
+            out.append((line_item_id, hit[1], hit[2], hit[5], hit[4], rules_hash))
+
+    df = pd.DataFrame(
+        out,
+        columns=["line_item_id", "std_key", "match_type", "priority", "pattern_raw", "rules_hash"],
+    )
+    con.register("tmp_line_item_std_map", df)
+    try:
+        con.execute("""
+          INSERT INTO line_item_std_map
+          SELECT line_item_id, std_key, match_type, CAST(priority AS INTEGER), pattern_raw, rules_hash
+          FROM tmp_line_item_std_map
+        """)
+    finally:
+        con.unregister("tmp_line_item_std_map")
+
+    return len(out)
+
+
 # ============================================================
 # 3) 계산 파이프라인 뷰 생성 (v_fin_long_raw ~ v_financial_ratios)
 # ============================================================
+# 각 stage SQL의 {scope} 자리는
+#  - view 모드: 빈 문자열 (전체 DB 대상)
+#  - materialized 모드: calc_refresh_scope(report_id/corp_code)로 범위 제한 → 변경된 report만 재계산
 
-def create_calc_views(con):
-    # --- v_fin_long_raw ---
-    con.execute("DROP VIEW IF EXISTS v_fin_long_raw;")
-    con.execute(r"""
-    CREATE VIEW v_fin_long_raw AS
+# --- v_fin_long_raw ---
+_SQL_FIN_LONG_RAW = r"""
     SELECT
       rp.corp_code,
       rp.bsns_year,
@@ -144,19 +250,16 @@ def create_calc_views(con):
       li.ifrs_code,
       li.label_clean,
 
-      regexp_replace(
-        lower(coalesce(li.label_clean,'')),
-        '[\s\.\,\-\(\)\/\[\]·•:;]+',
-        '',
-        'g'
-      ) AS label_norm,
+      -- ingest 시점에 norm_label()로 적재된 값 (쿼리마다 regexp_replace 하지 않음)
+      li.label_norm,
 
       f.period_end,
       f.fiscal_year,
       f.value,
       f.unit_multiplier,
       f.currency,
-      (f.value * f.unit_multiplier) AS value_won,
+      -- ingest 시점에 value * unit_multiplier로 적재된 값 (backfill_value_won)
+      f.value_won,
 
       f.note_refs_raw,
       f.line_item_id,
@@ -168,43 +271,38 @@ def create_calc_views(con):
       ON li.line_item_id = f.line_item_id
     JOIN reports rp
       ON rp.report_id = f.report_id
-    WHERE f.value IS NOT NULL
-      AND f.unit_multiplier IS NOT NULL;
-    """)
+    WHERE f.value_won IS NOT NULL
+      {scope}
+"""
 
-    # --- v_fin_long_mapped ---
-    con.execute("DROP VIEW IF EXISTS v_fin_long_mapped;")
-    con.execute(r"""
-    CREATE VIEW v_fin_long_mapped AS
+# --- v_fin_long_mapped ---
+_SQL_FIN_LONG_MAPPED = r"""
     WITH base AS (
       SELECT
         f.*,
-        lower(regexp_replace(f.label_clean, '[\s\.\,\-\(\)\/\[\]·•:;]+', '', 'g')) AS label_norm2,
         rtr.indent_level AS indent
       FROM v_fin_long_raw f
       LEFT JOIN rag_table_rows rtr
         ON rtr.table_id = f.table_id
        AND rtr.row_idx  = f.row_idx
       WHERE f.label_clean IS NOT NULL
+        {scope}
     ),
     matched AS (
+      -- 룰 매칭은 calc 초기화 때 line_item 단위로 끝나 있음 (refresh_line_item_std_map) → 등호 조인
       SELECT
         b.*,
-        r.std_key,
-        r.priority,
-        r.pattern_raw AS matched_pattern_raw,
+        sm.std_key,
+        sm.priority,
+        sm.pattern_raw AS matched_pattern_raw,
         ROW_NUMBER() OVER (
           PARTITION BY b.corp_code, b.bsns_year, b.report_id, b.statement_type, b.fiscal_year, b.table_id, b.row_idx
-          ORDER BY
-            CASE WHEN r.priority IS NOT NULL THEN 0 ELSE 1 END ASC,
-            r.priority ASC NULLS LAST
+          ORDER BY sm.priority ASC NULLS LAST
         ) AS rn
       FROM base b
-      LEFT JOIN account_map_rules r
-        ON r.is_active = TRUE
-       AND r.scope = b.statement_type
-       AND r.match_type = 'EXACT'
-       AND r.pattern = b.label_norm2
+      LEFT JOIN line_item_std_map sm
+        ON sm.line_item_id = b.line_item_id
+       AND sm.std_key IS NOT NULL
     )
     SELECT
       corp_code,
@@ -216,7 +314,7 @@ def create_calc_views(con):
       fiscal_year,
       line_item_id,
       label_clean,
-      label_norm2 AS label_norm,
+      label_norm,
       indent,
       value_won,
       unit_multiplier,
@@ -225,13 +323,11 @@ def create_calc_views(con):
       matched_pattern_raw,
       priority
     FROM matched
-    WHERE rn = 1;
-    """)
+    WHERE rn = 1
+"""
 
-    # --- v_summary_all_years ---
-    con.execute("DROP VIEW IF EXISTS v_summary_all_years;")
-    con.execute(r"""
-    CREATE VIEW v_summary_all_years AS
+# --- v_summary_all_years ---
+_SQL_SUMMARY_ALL_YEARS = r"""
     WITH picked AS (
         SELECT
             corp_code,
@@ -241,120 +337,14 @@ def create_calc_views(con):
             max_by(value_won, abs(value_won)) AS val
         FROM v_fin_long_mapped
         WHERE std_key IS NOT NULL
+          {scope}
         GROUP BY 1, 2, 3, 4
     )
-    SELECT * FROM picked;
-    """)
-
-    # --- v_analysis_compare ---
-    con.execute("DROP VIEW IF EXISTS v_analysis_compare;")
-    con.execute(r"""
-    CREATE VIEW v_analysis_compare AS
-    SELECT
-        curr.corp_code,
-        curr.fiscal_year AS bsns_year,
-        curr.statement_type,
-        curr.std_key,
-        curr.val AS val_curr,
-        prev.val AS val_prev,
-        (curr.val - COALESCE(prev.val, 0)) AS diff_amt,
-        CASE
-            WHEN prev.val IS NOT NULL AND prev.val != 0
-            THEN (curr.val - prev.val) / abs(prev.val) * 100
-            ELSE NULL
-        END AS diff_rate
-    FROM v_summary_all_years curr
-    LEFT JOIN v_summary_all_years prev
-        ON curr.corp_code = prev.corp_code
-       AND curr.fiscal_year = prev.fiscal_year + 1
-       AND curr.std_key = prev.std_key
-       AND curr.statement_type = prev.statement_type;
-    """)
-
-    # --- ratio_requirements ---
-    con.execute("""
-    CREATE TABLE IF NOT EXISTS ratio_requirements (
-      ratio_key VARCHAR,
-      ratio_ko  VARCHAR,
-      item_key  VARCHAR,
-      role      VARCHAR,
-      required  BOOLEAN,
-      note      VARCHAR,
-      PRIMARY KEY (ratio_key, item_key, role)
-    );
-    """)
-    con.execute("DELETE FROM ratio_requirements;")
-
-    con.execute(r"""
-    INSERT INTO ratio_requirements (ratio_key, ratio_ko, item_key, role, required, note) VALUES
-    ('current_ratio', '유동비율', 'CURRENT_ASSETS', 'numerator',  TRUE,  '유동자산/유동부채'),
-    ('current_ratio', '유동비율', 'CURRENT_LIABILITIES', 'denominator', TRUE, NULL),
-
-    ('quick_ratio',   '당좌비율', 'CURRENT_ASSETS', 'numerator',  TRUE,  '(유동자산-재고자산)/유동부채'),
-    ('quick_ratio',   '당좌비율', 'INVENTORIES',    'subtract',   FALSE, '유동자산에서 차감'),
-    ('quick_ratio',   '당좌비율', 'CURRENT_LIABILITIES', 'denominator', TRUE, NULL),
-
-    ('cash_ratio',    '현금비율', 'CASH_EQ', 'numerator', TRUE, '현금및현금성자산/유동부채'),
-    ('cash_ratio',    '현금비율', 'CURRENT_LIABILITIES', 'denominator', TRUE, NULL),
-
-    ('long_term_debt_ratio', '장기부채비율', 'NON_CURRENT_LIABILITIES', 'numerator', TRUE, '장기부채/총자산'),
-    ('long_term_debt_ratio', '장기부채비율', 'TOTAL_ASSETS', 'denominator', TRUE, NULL),
-
-    ('total_debt_ratio', '총부채비율', 'TOTAL_LIABILITIES', 'numerator', TRUE, '총부채/총자산'),
-    ('total_debt_ratio', '총부채비율', 'TOTAL_ASSETS', 'denominator', TRUE, NULL),
+    SELECT * FROM picked
+"""
 
-    ('interest_coverage', '이자보상비율', 'OP_PROFIT', 'numerator', TRUE, '영업이익/이자비용'),
-    ('interest_coverage', '이자보상비율', 'INTEREST_EXP', 'denominator', TRUE, NULL),
-
-    ('cash_coverage_ocf', '현금보상비율(현금흐름)', 'OCF', 'numerator', TRUE, '영업현금흐름/이자비용'),
-    ('cash_coverage_ocf', '현금보상비율(현금흐름)', 'INTEREST_EXP', 'denominator', TRUE, NULL),
-
-    ('cash_coverage_op_dep', '현금보상비율(영업이익+감가상각)', 'OP_PROFIT', 'numerator', TRUE, '(영업이익+감가상각비)/이자비용'),
-    ('cash_coverage_op_dep', '현금보상비율(영업이익+감가상각)', 'DEPRECIATION', 'add', FALSE, '영업이익에 더함'),
-    ('cash_coverage_op_dep', '현금보상비율(영업이익+감가상각)', 'INTEREST_EXP', 'denominator', TRUE, NULL),
-
-    ('asset_turnover', '자산 회전율', 'REVENUE', 'numerator', TRUE, '매출/총자산'),
-    ('asset_turnover', '자산 회전율', 'TOTAL_ASSETS', 'denominator', TRUE, NULL),
-
-    ('inventory_turnover', '재고자산 회전율', 'COGS', 'numerator', TRUE, '매출원가/재고자산'),
-    ('inventory_turnover', '재고자산 회전율', 'INVENTORIES', 'denominator', TRUE, NULL),
-
-    ('ar_turnover', '매출채권 회전율', 'REVENUE', 'numerator', TRUE, '매출/매출채권'),
-    ('ar_turnover', '매출채권 회전율', 'AR', 'denominator', TRUE, NULL),
-
-    ('roe', 'ROE', 'NET_INCOME', 'numerator', TRUE, '순이익/자기자본'),
-    ('roe', 'ROE', 'EQUITY', 'denominator', TRUE, NULL),
-
-    ('roa', 'ROA', 'NET_INCOME', 'numerator', TRUE, '순이익/총자산'),
-    ('roa', 'ROA', 'TOTAL_ASSETS', 'denominator', TRUE, NULL),
-
-    ('roc', 'ROC', 'NOPAT', 'numerator', TRUE, '세후영업이익/(장기부채+자기자본)'),
-    ('roc', 'ROC', 'INVESTED_CAPITAL', 'denominator', TRUE, NULL),
-
-    ('per',  'PER',  'STOCK_PRICE',  'numerator', TRUE,  '주가/주당순이익'),
-    ('per',  'PER',  'EPS',          'denominator', TRUE,  NULL),
-
-    ('pbr',  'PBR',  'STOCK_PRICE',  'numerator', TRUE,  '주가/주당자기자본'),
-    ('pbr',  'PBR',  'BPS',          'denominator', TRUE,  NULL),
-
-    ('psr',  'PSR',  'STOCK_PRICE',  'numerator', TRUE,  '주가/주당매출'),
-    ('psr',  'PSR',  'SPS',          'denominator', TRUE,  NULL),
-
-    ('pcfr', 'PCFR', 'STOCK_PRICE',  'numerator', TRUE,  '주가/주당(세후 순이익+감가상각비)'),
-    ('pcfr', 'PCFR', 'CFPS',         'denominator', TRUE,  NULL),
-
-    ('net_margin', '순이익률', 'NET_INCOME', 'numerator',   TRUE, '당기순이익/매출액'),
-    ('net_margin', '순이익률', 'REVENUE',    'denominator', TRUE, NULL),
-
-    ('fin_leverage', '재무레버리지', 'TOTAL_ASSETS', 'numerator',   TRUE, '자산총계/자본총계'),
-    ('fin_leverage', '재무레버리지', 'EQUITY',       'denominator', TRUE, NULL)
-    ;
-    """)
-
-    # --- v_value_resolved ---
-    con.execute("DROP VIEW IF EXISTS v_value_resolved;")
-    con.execute(r"""
-    CREATE VIEW v_value_resolved AS
+# --- v_value_resolved ---
+_SQL_VALUE_RESOLVED = r"""
     WITH req AS (
       SELECT DISTINCT item_key AS std_key
       FROM ratio_requirements
@@ -378,8 +368,10 @@ def create_calc_views(con):
       GROUP BY std_key
     ),
     base_reports AS (
-      SELECT DISTINCT corp_code, bsns_year, report_id
-      FROM v_fin_long_mapped
+      SELECT DISTINCT m.corp_code, m.bsns_year, m.report_id
+      FROM v_fin_long_mapped m
+      WHERE TRUE
+        {scope}
     ),
     market_core AS (
       SELECT
@@ -404,13 +396,9 @@ def create_calc_views(con):
       JOIN std_scope s
         ON s.std_key = m.std_key
        AND s.scope   = m.statement_type
-      JOIN account_map_rules r
-        ON r.scope   = m.statement_type
-       AND r.std_key = m.std_key
-       AND r.match_type = 'EXACT'
-       AND r.pattern = m.label_norm
       WHERE m.std_key IS NOT NULL
         AND m.fiscal_year = m.bsns_year
+        {scope}
     ),
     base_vals AS (
       SELECT
@@ -455,39 +443,52 @@ def create_calc_views(con):
     LEFT JOIN market_core mk
       ON mk.corp_code = br.corp_code
      AND mk.bsns_year = br.bsns_year
-    ;
-    """)
+"""
+
+# --- v_value_augmented (dedup) ---
+# derived 계산 입력 (std_key → 소문자 컬럼으로 pivot)
+AUGMENTED_INPUT_KEYS = [
+    "OP_PROFIT", "TAX_EXP", "PRE_TAX_INCOME",
+    "LONG_TERM_DEBT", "NON_CURRENT_LIABILITIES", "TOTAL_LIABILITIES", "CURRENT_LIABILITIES",
+    "EQUITY", "TOTAL_ASSETS",
+    "NET_INCOME", "REVENUE", "DEPRECIATION",
+    "STOCK_PRICE", "SHARES_OUTSTANDING",
+]
 
-    # --- v_value_augmented (dedup) ---
-    con.execute("DROP VIEW IF EXISTS v_value_augmented;")
-    con.execute(r"""
-    CREATE VIEW v_value_augmented AS
+# derived 항목 → 입력 std_key (아래 derived CTE와 동일하게 유지, metric_lineage 전개용)
+DERIVED_INPUTS = {
+    "TAX_RATE":         ["TAX_EXP", "PRE_TAX_INCOME"],
+    "NOPAT":            ["OP_PROFIT", "TAX_EXP", "PRE_TAX_INCOME"],
+    "INVESTED_CAPITAL": ["LONG_TERM_DEBT", "NON_CURRENT_LIABILITIES", "TOTAL_LIABILITIES", "CURRENT_LIABILITIES", "EQUITY"],
+    "EPS":              ["NET_INCOME", "SHARES_OUTSTANDING"],
+    "BPS":              ["EQUITY", "SHARES_OUTSTANDING"],
+    "SPS":              ["REVENUE", "SHARES_OUTSTANDING"],
+    "CFPS":             ["NET_INCOME", "DEPRECIATION", "SHARES_OUTSTANDING"],
+}
+
+# fs_facts가 아니라 market_data에서 오는 항목
+MARKET_KEYS = ["STOCK_PRICE", "SHARES_OUTSTANDING"]
+
+
+def _pivot_columns(keys: List[str], lower: bool = False) -> str:
+    """std_key 목록 → `MAX(value_won) FILTER (...) AS col` 나열 (report당 1행 wide pivot)"""
+    return ",\n        ".join(
+        f"MAX(value_won) FILTER (WHERE std_key='{k}') AS " + (k.lower() if lower else f'"{k}"')
+        for k in keys
+    )
+
+
+_SQL_VALUE_AUGMENTED = r"""
     WITH base AS (
       SELECT
         corp_code,
         bsns_year,
         report_id,
 
-        MAX(value_won) FILTER (WHERE std_key='OP_PROFIT')               AS op_profit,
-        MAX(value_won) FILTER (WHERE std_key='TAX_EXP')                 AS tax_exp,
-        MAX(value_won) FILTER (WHERE std_key='PRE_TAX_INCOME')          AS pre_tax_income,
-
-        MAX(value_won) FILTER (WHERE std_key='LONG_TERM_DEBT')          AS long_term_debt,
-        MAX(value_won) FILTER (WHERE std_key='NON_CURRENT_LIABILITIES') AS non_current_liabilities,
-        MAX(value_won) FILTER (WHERE std_key='TOTAL_LIABILITIES')       AS total_liabilities,
-        MAX(value_won) FILTER (WHERE std_key='CURRENT_LIABILITIES')     AS current_liabilities,
-
-        MAX(value_won) FILTER (WHERE std_key='EQUITY')                  AS equity,
-        MAX(value_won) FILTER (WHERE std_key='TOTAL_ASSETS')            AS total_assets,
-
-        MAX(value_won) FILTER (WHERE std_key='NET_INCOME')              AS net_income,
-        MAX(value_won) FILTER (WHERE std_key='REVENUE')                 AS revenue,
-        MAX(value_won) FILTER (WHERE std_key='DEPRECIATION')            AS depreciation,
-
-        MAX(value_won) FILTER (WHERE std_key='STOCK_PRICE')             AS stock_price,
-        MAX(value_won) FILTER (WHERE std_key='SHARES_OUTSTANDING')      AS shares_outstanding
-
+        {augmented_pivot}
       FROM v_value_resolved
+      WHERE TRUE
+        {scope}
       GROUP BY corp_code, bsns_year, report_id
     ),
     derived AS (
@@ -552,6 +553,8 @@ def create_calc_views(con):
         note_text,
         2 AS prio
       FROM v_value_resolved
+      WHERE TRUE
+        {scope}
     ),
     derived_rows AS (
       SELECT corp_code, bsns_year, report_id, 'TAX_RATE' AS std_key, tax_rate AS value_won, NULL, NULL, NULL, 1 AS prio FROM derived
@@ -582,79 +585,504 @@ def create_calc_views(con):
       labels,
       note_refs,
       note_text
-    FROM dedup;
-    """)
-
-    # --- v_financial_ratios ---
-    con.execute("DROP VIEW IF EXISTS v_financial_ratios;")
-    con.execute(r"""
-    CREATE VIEW v_financial_ratios AS
-    WITH req AS (
-      SELECT ratio_key, ratio_ko, item_key, role, required
-      FROM ratio_requirements
-    ),
-    base AS (
-      SELECT DISTINCT corp_code, bsns_year, report_id
+    FROM dedup
+""".replace("{augmented_pivot}", _pivot_columns(AUGMENTED_INPUT_KEYS, lower=True))
+
+# --- v_financial_ratios ---
+# report당 1행 wide pivot(ratio 수식이 참조하는 item만) → 수식 컬럼 연산 → UNNEST로 long 변환
+# {ratio_pivot} / {ratio_rows}는 RATIO_FORMULAS 레지스트리에서 렌더링 (_stage_sql)
+_SQL_FINANCIAL_RATIOS = r"""
+    WITH wide AS (
+      SELECT
+        corp_code,
+        bsns_year,
+        report_id,
+        {ratio_pivot}
       FROM v_value_augmented
+      WHERE TRUE
+        {scope}
+      GROUP BY corp_code, bsns_year, report_id
     ),
-    grid AS (
-      SELECT
-        b.corp_code,
-        b.bsns_year,
-        b.report_id,
-        r.ratio_key,
-        r.ratio_ko,
-        r.item_key,
-        r.role,
-        r.required,
-        v.value_won
-      FROM base b
-      JOIN req r ON 1=1
-      LEFT JOIN v_value_augmented v
-        ON v.corp_code = b.corp_code
-       AND v.bsns_year = b.bsns_year
-       AND v.report_id = b.report_id
-       AND v.std_key = r.item_key
-    ),
-    agg AS (
+    calc AS (
       SELECT
         corp_code,
         bsns_year,
         report_id,
-        ratio_key,
-        any_value(ratio_ko) AS ratio_ko,
-
-        COALESCE(SUM(CASE WHEN role='numerator' THEN value_won END), 0)
-      + COALESCE(SUM(CASE WHEN role='add'       THEN value_won END), 0)
-      - COALESCE(SUM(CASE WHEN role='subtract'  THEN value_won END), 0) AS numerator,
-
-        COALESCE(SUM(CASE WHEN role='denominator' THEN value_won END), 0) AS denominator,
-
-        SUM(CASE WHEN required THEN 1 ELSE 0 END) AS required_cnt,
-        SUM(CASE WHEN required AND value_won IS NOT NULL THEN 1 ELSE 0 END) AS required_hit
-      FROM grid
-      GROUP BY corp_code, bsns_year, report_id, ratio_key
+        UNNEST([
+          {ratio_rows}
+        ]) AS r
+      FROM wide
     )
     SELECT
       corp_code,
       bsns_year,
       report_id,
-      ratio_key,
-      ratio_ko,
+      r.ratio_key,
+      r.ratio_ko,
       CASE
-        WHEN required_cnt = required_hit
-         AND denominator IS NOT NULL
-         AND denominator <> 0
-        THEN numerator / denominator
+        WHEN r.is_complete
+         AND r.denominator IS NOT NULL
+         AND r.denominator <> 0
+        THEN r.numerator / r.denominator
         ELSE NULL
       END AS ratio_value,
-      numerator,
-      denominator,
-      (required_cnt = required_hit) AS is_complete
-    FROM agg;
+      r.numerator,
+      r.denominator,
+      r.is_complete
+    FROM calc
+"""
+
+# --- v_metric_timeseries ---
+# (corp_code, metric_key)별 연도 시계열 1회 스캔: lag / CAGR / 3·5년 이동평균·표준편차
+# - 연도 공백이 있어도 RANGE 프레임(연도 값 기준)이라 N년 전 값을 정확히 가리킴
+# - 입력: raw(v_summary_all_years, 비교 연도 포함) + ratio(v_financial_ratios) + derived/market(v_value_augmented)
+TIMESERIES_AUGMENTED_KEYS = [
+    "TAX_RATE", "NOPAT", "INVESTED_CAPITAL", "EPS", "BPS", "SPS", "CFPS", "STOCK_PRICE",
+]
+
+_SQL_METRIC_TIMESERIES = r"""
+    WITH raw_series AS (
+      SELECT corp_code, fiscal_year AS bsns_year, std_key AS metric_key, val AS value
+      FROM v_summary_all_years
+      WHERE TRUE
+        {scope}
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY corp_code, fiscal_year, std_key
+        ORDER BY (val IS NOT NULL) DESC, abs(val) DESC, statement_type
+      ) = 1
+    ),
+    ratio_series AS (
+      SELECT corp_code, bsns_year, ratio_key AS metric_key, ratio_value AS value
+      FROM v_financial_ratios
+      WHERE TRUE
+        {scope}
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY corp_code, bsns_year, ratio_key
+        ORDER BY (ratio_value IS NOT NULL) DESC, abs(ratio_value) DESC, report_id DESC
+      ) = 1
+    ),
+    derived_series AS (
+      SELECT corp_code, bsns_year, std_key AS metric_key, value_won AS value
+      FROM v_value_augmented
+      WHERE std_key IN ({augmented_keys})
+        {scope}
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY corp_code, bsns_year, std_key
+        ORDER BY (value_won IS NOT NULL) DESC, abs(value_won) DESC, report_id DESC
+      ) = 1
+    ),
+    series AS (
+      SELECT * FROM raw_series
+      UNION ALL SELECT * FROM ratio_series
+      UNION ALL SELECT * FROM derived_series
+    ),
+    win AS (
+      SELECT
+        corp_code,
+        bsns_year,
+        metric_key,
+        value,
+        first(value) OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 1 PRECEDING AND 1 PRECEDING) AS value_lag1,
+        first(value) OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 3 PRECEDING AND 3 PRECEDING) AS value_lag3,
+        first(value) OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 5 PRECEDING AND 5 PRECEDING) AS value_lag5,
+        count(value)       OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 2 PRECEDING AND CURRENT ROW) AS n_3y,
+        avg(value)         OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 2 PRECEDING AND CURRENT ROW) AS avg_3y_raw,
+        stddev_samp(value) OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 2 PRECEDING AND CURRENT ROW) AS std_3y_raw,
+        count(value)       OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 4 PRECEDING AND CURRENT ROW) AS n_5y,
+        avg(value)         OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 4 PRECEDING AND CURRENT ROW) AS avg_5y_raw,
+        stddev_samp(value) OVER (PARTITION BY corp_code, metric_key ORDER BY bsns_year RANGE BETWEEN 4 PRECEDING AND CURRENT ROW) AS std_5y_raw
+      FROM series
+    )
+    SELECT
+      corp_code,
+      bsns_year,
+      metric_key,
+      value,
+      value_lag1,
+      value_lag3,
+      value_lag5,
+      -- CAGR: 시작/끝 값이 모두 양수일 때만 정의
+      CASE WHEN value > 0 AND value_lag3 > 0 THEN pow(value / value_lag3, 1.0 / 3) - 1 ELSE NULL END AS cagr_3y,
+      CASE WHEN value > 0 AND value_lag5 > 0 THEN pow(value / value_lag5, 1.0 / 5) - 1 ELSE NULL END AS cagr_5y,
+      -- 이동평균/표준편차: 창 안의 연도가 모두 채워졌을 때만
+      CASE WHEN n_3y = 3 THEN avg_3y_raw END AS avg_3y,
+      CASE WHEN n_3y = 3 THEN std_3y_raw END AS std_3y,
+      CASE WHEN n_5y = 5 THEN avg_5y_raw END AS avg_5y,
+      CASE WHEN n_5y = 5 THEN std_5y_raw END AS std_5y,
+      n_3y,
+      n_5y
+    FROM win
+""".replace("{augmented_keys}", ", ".join(f"'{k}'" for k in TIMESERIES_AUGMENTED_KEYS))
+
+# v_metric_timeseries의 통계 컬럼 → metric_catalog 키 접미사 / metric_type
+# ({base}__cagr_3y 처럼 base metric_key 뒤에 붙임)
+TIMESERIES_STATS = [
+    ("cagr_3y", "cagr",        "3년 CAGR"),
+    ("cagr_5y", "cagr",        "5년 CAGR"),
+    ("avg_3y",  "rolling_avg", "3년 평균"),
+    ("avg_5y",  "rolling_avg", "5년 평균"),
+    ("std_3y",  "volatility",  "3년 표준편차"),
+    ("std_5y",  "volatility",  "5년 표준편차"),
+]
+TIMESERIES_METRIC_TYPES = sorted({t for _, t, _ in TIMESERIES_STATS})
+
+# (view 이름, materialized 테이블, refresh 키, scope 필터 컬럼, SQL)
+# - refresh 키 report_id : 해당 report 단위로 DELETE → INSERT
+# - refresh 키 corp_code : fiscal_year가 여러 report에 걸치므로 회사 단위로 재계산
+CALC_STAGES = [
+    ("v_fin_long_raw",      "m_fin_long_raw",      "report_id", "f.report_id", _SQL_FIN_LONG_RAW),
+    ("v_fin_long_mapped",   "m_fin_long_mapped",   "report_id", "f.report_id", _SQL_FIN_LONG_MAPPED),
+    ("v_summary_all_years", "m_summary_all_years", "corp_code", "corp_code",   _SQL_SUMMARY_ALL_YEARS),
+    ("v_value_resolved",    "m_value_resolved",    "report_id", "m.report_id", _SQL_VALUE_RESOLVED),
+    ("v_value_augmented",   "m_value_augmented",   "report_id", "report_id",   _SQL_VALUE_AUGMENTED),
+    ("v_financial_ratios",  "m_financial_ratios",  "report_id", "report_id",   _SQL_FINANCIAL_RATIOS),
+    ("v_metric_timeseries", "m_metric_timeseries", "corp_code", "corp_code",   _SQL_METRIC_TIMESERIES),
+]
+
+
+def _stage_sql(sql: str, key: str, col: str, scoped: bool) -> str:
+    if "{ratio_pivot}" in sql:
+        sql = _render_ratio_sql(sql)
+    if not scoped:
+        return sql.replace("{scope}", "")
+    return sql.replace("{scope}", f"AND {col} IN (SELECT {key} FROM calc_refresh_scope)")
+
+
+# ============================================================
+# 3-0) ratio 수식 레지스트리 / 컴파일러
+# ============================================================
+# 수식 문법: (항 ± 항 ...) / (항 + 항 ...)
+#   - 항: std_key (필수) 또는 opt(std_key) (선택: 없으면 0 취급)
+#   - 필수 항이 하나라도 NULL이면 ratio_value = NULL
+# ratio_requirements(role: numerator/add/subtract/denominator)는 수식에서 파생 → validate.py 재계산과 동일 규칙
+
+RATIO_FORMULAS = {}
+
+
+def register_ratio(ratio_key: str, ratio_ko: str, formula: str, note: str = None, term_notes: dict = None):
+    """
+    ratio 정의 추가/교체. SQL 수정 없이 다음 create_calc_views()부터 반영.
+    (fact_metrics로 내보내려면 metric_catalog에도 metric_key가 있어야 함)
+    - note: 첫 분자 항(ratio 전체 설명), term_notes: {std_key: 설명} 나머지 항별 note
+    """
+    num, den = compile_ratio_formula(formula)
+    RATIO_FORMULAS[ratio_key] = {
+        "ratio_ko": ratio_ko,
+        "formula": formula,
+        "note": note,
+        "term_notes": dict(term_notes or {}),
+        "numerator": num,
+        "denominator": den,
+    }
+
+
+def _formula_terms(node, sign: int, out: list, formula: str):
+    """+/- 로 연결된 항을 (sign, std_key, required) 리스트로 평탄화"""
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        _formula_terms(node.left, sign, out, formula)
+        _formula_terms(node.right, sign if isinstance(node.op, ast.Add) else -sign, out, formula)
+    elif isinstance(node, ast.Name):
+        out.append((sign, node.id, True))
+    elif (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "opt"
+        and len(node.args) == 1
+        and isinstance(node.args[0], ast.Name)
+    ):
+        out.append((sign, node.args[0].id, False))
+    else:
+        raise ValueError(f"지원하지 않는 ratio 수식 항: {formula!r}")
+
+
+def compile_ratio_formula(formula: str):
+    """
+    '(CURRENT_ASSETS - opt(INVENTORIES)) / CURRENT_LIABILITIES'
+      → numerator [(1,'CURRENT_ASSETS',True), (-1,'INVENTORIES',False)], denominator [(1,'CURRENT_LIABILITIES',True)]
+    """
+    try:
+        tree = ast.parse(formula, mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"ratio 수식 파싱 실패: {formula!r}") from e
+
+    if not (isinstance(tree, ast.BinOp) and isinstance(tree.op, ast.Div)):
+        raise ValueError(f"ratio 수식은 '분자 / 분모' 형태여야 합니다: {formula!r}")
+
+    num, den = [], []
+    _formula_terms(tree.left, 1, num, formula)
+    _formula_terms(tree.right, 1, den, formula)
+    if any(sign < 0 for sign, _, _ in den):
+        raise ValueError(f"ratio 분모에는 '+'만 허용됩니다: {formula!r}")
+    return num, den
+
+
+def _ratio_requirement_rows() -> list:
+    rows = []
+    for ratio_key, spec in RATIO_FORMULAS.items():
+        for i, (sign, item, required) in enumerate(spec["numerator"]):
+            if sign < 0:
+                role = "subtract"
+            elif i == 0:
+                role = "numerator"
+            else:
+                role = "add"
+            note = spec["note"] if i == 0 else spec["term_notes"].get(item)
+            rows.append((ratio_key, spec["ratio_ko"], item, role, required, note))
+        for sign, item, required in spec["denominator"]:
+            rows.append((ratio_key, spec["ratio_ko"], item, "denominator", required, spec["term_notes"].get(item)))
+    return rows
+
+
+def _render_ratio_sql(sql: str) -> str:
+    items = sorted({item for spec in RATIO_FORMULAS.values() for _, item, _ in spec["numerator"] + spec["denominator"]})
+    pivot = _pivot_columns(items)
+
+    def _sum(terms):
+        expr = ""
+        for i, (sign, item, _) in enumerate(terms):
+            op = ("" if sign > 0 else "-") if i == 0 else (" + " if sign > 0 else " - ")
+            expr += f"{op}COALESCE(\"{item}\", 0)"
+        return expr or "0"
+
+    rows = []
+    for ratio_key, spec in RATIO_FORMULAS.items():
+        req = [item for _, item, required in spec["numerator"] + spec["denominator"] if required]
+        complete = " AND ".join(f"\"{k}\" IS NOT NULL" for k in req) or "TRUE"
+        key_lit = ratio_key.replace("'", "''")
+        ratio_ko = spec["ratio_ko"].replace("'", "''")
+        rows.append(
+            "{"
+            f"'ratio_key': '{key_lit}', "
+            f"'ratio_ko': '{ratio_ko}', "
+            f"'numerator': CAST({_sum(spec['numerator'])} AS DOUBLE), "
+            f"'denominator': CAST({_sum(spec['denominator'])} AS DOUBLE), "
+            f"'is_complete': ({complete})"
+            "}"
+        )
+
+    return sql.replace("{ratio_pivot}", pivot).replace("{ratio_rows}", ",\n          ".join(rows))
+
+
+register_ratio("current_ratio", "유동비율", "CURRENT_ASSETS / CURRENT_LIABILITIES", "유동자산/유동부채")
+register_ratio("quick_ratio", "당좌비율", "(CURRENT_ASSETS - opt(INVENTORIES)) / CURRENT_LIABILITIES", "(유동자산-재고자산)/유동부채",
+               term_notes={"INVENTORIES": "유동자산에서 차감"})
+register_ratio("cash_ratio", "현금비율", "CASH_EQ / CURRENT_LIABILITIES", "현금및현금성자산/유동부채")
+register_ratio("long_term_debt_ratio", "장기부채비율", "NON_CURRENT_LIABILITIES / TOTAL_ASSETS", "장기부채/총자산")
+register_ratio("total_debt_ratio", "총부채비율", "TOTAL_LIABILITIES / TOTAL_ASSETS", "총부채/총자산")
+register_ratio("interest_coverage", "이자보상비율", "OP_PROFIT / INTEREST_EXP", "영업이익/이자비용")
+register_ratio("cash_coverage_ocf", "현금보상비율(현금흐름)", "OCF / INTEREST_EXP", "영업현금흐름/이자비용")
+register_ratio("cash_coverage_op_dep", "현금보상비율(영업이익+감가상각)", "(OP_PROFIT + opt(DEPRECIATION)) / INTEREST_EXP", "(영업이익+감가상각비)/이자비용",
+               term_notes={"DEPRECIATION": "영업이익에 더함"})
+register_ratio("asset_turnover", "자산 회전율", "REVENUE / TOTAL_ASSETS", "매출/총자산")
+register_ratio("inventory_turnover", "재고자산 회전율", "COGS / INVENTORIES", "매출원가/재고자산")
+register_ratio("ar_turnover", "매출채권 회전율", "REVENUE / AR", "매출/매출채권")
+register_ratio("roe", "ROE", "NET_INCOME / EQUITY", "순이익/자기자본")
+register_ratio("roa", "ROA", "NET_INCOME / TOTAL_ASSETS", "순이익/총자산")
+register_ratio("roc", "ROC", "NOPAT / INVESTED_CAPITAL", "세후영업이익/(장기부채+자기자본)")
+register_ratio("per", "PER", "STOCK_PRICE / EPS", "주가/주당순이익")
+register_ratio("pbr", "PBR", "STOCK_PRICE / BPS", "주가/주당자기자본")
+register_ratio("psr", "PSR", "STOCK_PRICE / SPS", "주가/주당매출")
+register_ratio("pcfr", "PCFR", "STOCK_PRICE / CFPS", "주가/주당(세후 순이익+감가상각비)")
+register_ratio("net_margin", "순이익률", "NET_INCOME / REVENUE", "당기순이익/매출액")
+register_ratio("fin_leverage", "재무레버리지", "TOTAL_ASSETS / EQUITY", "자산총계/자본총계")
+
+
+def create_ratio_requirements(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS ratio_requirements (
+      ratio_key VARCHAR,
+      ratio_ko  VARCHAR,
+      item_key  VARCHAR,
+      role      VARCHAR,
+      required  BOOLEAN,
+      note      VARCHAR,
+      PRIMARY KEY (ratio_key, item_key, role)
+    );
+    """)
+    con.execute("DELETE FROM ratio_requirements;")
+    con.executemany(
+        "INSERT INTO ratio_requirements (ratio_key, ratio_ko, item_key, role, required, note) VALUES (?, ?, ?, ?, ?, ?)",
+        _ratio_requirement_rows(),
+    )
+
+
+def create_calc_views(con, materialized: bool = False):
+    """
+    materialized=False: 기존과 동일한 plain view 체인
+    materialized=True : stage마다 m_* 테이블을 두고 v_* 는 그 테이블을 읽는 얇은 view
+                        (채우기/갱신은 refresh_calc_tables)
+    """
+    create_ratio_requirements(con)
+    create_line_item_std_map_table(con)
+
+    for view, table, key, col, sql in CALC_STAGES:
+        if materialized:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM ({_stage_sql(sql, key, col, False)}) LIMIT 0;")
+            con.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM {table};")
+        else:
+            con.execute(f"DROP VIEW IF EXISTS {view};")
+            con.execute(f"CREATE VIEW {view} AS {_stage_sql(sql, key, col, False)};")
+
+    # --- v_analysis_compare ---
+    con.execute("DROP VIEW IF EXISTS v_analysis_compare;")
+    con.execute(r"""
+    CREATE VIEW v_analysis_compare AS
+    SELECT
+        curr.corp_code,
+        curr.fiscal_year AS bsns_year,
+        curr.statement_type,
+        curr.std_key,
+        curr.val AS val_curr,
+        prev.val AS val_prev,
+        (curr.val - COALESCE(prev.val, 0)) AS diff_amt,
+        CASE
+            WHEN prev.val IS NOT NULL AND prev.val != 0
+            THEN (curr.val - prev.val) / abs(prev.val) * 100
+            ELSE NULL
+        END AS diff_rate
+    FROM v_summary_all_years curr
+    LEFT JOIN v_summary_all_years prev
+        ON curr.corp_code = prev.corp_code
+       AND curr.fiscal_year = prev.fiscal_year + 1
+       AND curr.std_key = prev.std_key
+       AND curr.statement_type = prev.statement_type;
+    """)
+
+    # --- v_metric_timeseries_long (fact_metrics 적재용: 통계 컬럼 → {base}__{stat} 행) ---
+    stats_sql = ",\n          ".join(
+        f"{{'metric_key': metric_key || '__{stat}', 'value': {stat}}}" for stat, _, _ in TIMESERIES_STATS
+    )
+    con.execute("DROP VIEW IF EXISTS v_metric_timeseries_long;")
+    con.execute(f"""
+    CREATE VIEW v_metric_timeseries_long AS
+    SELECT
+      corp_code,
+      bsns_year,
+      u.s.metric_key AS metric_key,
+      u.s.value      AS value
+    FROM v_metric_timeseries,
+    UNNEST([
+          {stats_sql}
+    ]) AS u(s);
     """)
 
 
+# ============================================================
+# 3-1) materialized 모드: m_* 테이블 증분 갱신
+# ============================================================
+
+def _create_refresh_state_tables(con):
+    # report별 마지막 반영 시점 (reports.ingested_at 워터마크와 비교)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS calc_refresh_state (
+      report_id VARCHAR PRIMARY KEY,
+      corp_code VARCHAR,
+      ingested_at TIMESTAMP,
+      refreshed_at TIMESTAMP
+    );
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS calc_refresh_meta (
+      key VARCHAR PRIMARY KEY,
+      value VARCHAR
+    );
+    """)
+
+
+def _calc_inputs_fingerprint(con) -> str:
+    """
+    report와 무관하게 모든 stage 결과를 바꾸는 입력(stage SQL, 매핑룰, ratio 정의, market_data)의 해시.
+    값이 바뀌면 증분이 아니라 전체 재적재가 필요.
+    """
+    h = hashlib.sha1()
+    for view, table, key, col, sql in CALC_STAGES:
+        h.update(f"{view}|{table}|{key}|{col}|{_stage_sql(sql, key, col, False)}".encode("utf-8"))
+
+    for t in ("account_map_rules", "ratio_requirements", "market_data"):
+        v = con.execute(f"""
+          SELECT md5(coalesce(string_agg(CAST(x AS VARCHAR), '|' ORDER BY CAST(x AS VARCHAR)), ''))
+          FROM {t} x
+        """).fetchone()[0]
+        h.update(f"{t}={v}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def refresh_calc_tables(con, full: bool = False) -> dict:
+    """
+    create_calc_views(con, materialized=True) 이후 m_* 테이블 갱신.
+    - 신규/재-ingest report: reports.ingested_at > calc_refresh_state.ingested_at
+    - 삭제된 report: calc_refresh_state에는 있고 reports에는 없음
+    - 입력 fingerprint(룰/ratio 정의/market_data/stage SQL)가 바뀌면 전체 재적재
+    반환: {"mode": "full"|"incremental", "reports": n, "corps": n}
+    """
+    _create_refresh_state_tables(con)
+
+    # ingest 경로 밖에서 들어온 line_item도 매칭된 상태로 맞춘 뒤 갱신
+    refresh_line_item_std_map(con, only_missing=True)
+
+    fp = _calc_inputs_fingerprint(con)
+    row = con.execute("SELECT value FROM calc_refresh_meta WHERE key = 'inputs_fingerprint'").fetchone()
+    if not row or row[0] != fp:
+        full = True
+
+    if full:
+        # stage 스키마가 바뀌었을 수 있으므로 테이블을 다시 만든 뒤 전체 적재
+        for view, table, key, col, sql in CALC_STAGES:
+            con.execute(f"DROP TABLE IF EXISTS {table};")
+            con.execute(f"CREATE TABLE {table} AS {_stage_sql(sql, key, col, False)};")
+            con.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM {table};")
+
+        con.execute("DELETE FROM calc_refresh_state;")
+        con.execute("""
+          INSERT INTO calc_refresh_state
+          SELECT report_id, corp_code, ingested_at, CURRENT_TIMESTAMP
+          FROM reports
+        """)
+        con.execute("INSERT OR REPLACE INTO calc_refresh_meta VALUES ('inputs_fingerprint', ?)", [fp])
+
+        n_reports, n_corps = con.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT corp_code) FROM calc_refresh_state"
+        ).fetchone()
+        print(f"✅ calc tables rebuilt (full): reports={n_reports}, corps={n_corps}")
+        return {"mode": "full", "reports": int(n_reports), "corps": int(n_corps)}
+
+    con.execute("DROP TABLE IF EXISTS calc_refresh_scope;")
+    con.execute("""
+    CREATE TEMP TABLE calc_refresh_scope AS
+    SELECT r.report_id, r.corp_code
+    FROM reports r
+    LEFT JOIN calc_refresh_state s
+      ON s.report_id = r.report_id
+    WHERE s.report_id IS NULL
+       OR r.ingested_at IS DISTINCT FROM s.ingested_at
+    UNION
+    SELECT s.report_id, s.corp_code
+    FROM calc_refresh_state s
+    WHERE NOT EXISTS (SELECT 1 FROM reports r WHERE r.report_id = s.report_id);
+    """)
+
+    n_reports, n_corps = con.execute(
+        "SELECT COUNT(DISTINCT report_id), COUNT(DISTINCT corp_code) FROM calc_refresh_scope"
+    ).fetchone()
+
+    if n_reports:
+        for view, table, key, col, sql in CALC_STAGES:
+            con.execute(f"DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM calc_refresh_scope);")
+            con.execute(f"INSERT INTO {table} {_stage_sql(sql, key, col, True)};")
+
+        con.execute("DELETE FROM calc_refresh_state WHERE report_id IN (SELECT report_id FROM calc_refresh_scope);")
+        con.execute("""
+          INSERT INTO calc_refresh_state
+          SELECT r.report_id, r.corp_code, r.ingested_at, CURRENT_TIMESTAMP
+          FROM reports r
+          WHERE r.report_id IN (SELECT report_id FROM calc_refresh_scope)
+        """)
+
+    con.execute("DROP TABLE IF EXISTS calc_refresh_scope;")
+    print(f"✅ calc tables refreshed (incremental): reports={n_reports}, corps={n_corps}")
+    return {"mode": "incremental", "reports": int(n_reports), "corps": int(n_corps)}
+
+
 # ============================================================
 # 4) metric_catalog
 # ============================================================
@@ -665,7 +1093,7 @@ def create_metric_catalog(con):
     CREATE TABLE metric_catalog (
       metric_key VARCHAR PRIMARY KEY,
       metric_name_ko VARCHAR,
-      metric_type VARCHAR,        -- raw / ratio / derived / market
+      metric_type VARCHAR,        -- raw / ratio / derived / market / cagr / rolling_avg / volatility
       unit VARCHAR,               -- KRW / RATIO / TIMES / KRW_PER_SHARE ...
       polarity BOOLEAN            -- TRUE: higher_better, FALSE: lower_better, NULL: depends
     );
@@ -723,6 +1151,22 @@ def create_metric_catalog(con):
     ;
     """)
 
+    # 시계열 지표 (v_metric_timeseries): base metric마다 {base}__{stat}
+    # - cagr: 단위 RATIO, polarity는 base와 동일
+    # - rolling_avg: base 단위/polarity 그대로
+    # - volatility: base 단위, 낮을수록 안정적(FALSE)
+    con.executemany("""
+    INSERT INTO metric_catalog
+    SELECT
+      c.metric_key || '__' || ?,
+      c.metric_name_ko || ' ' || ?,
+      ?,
+      CASE WHEN ? = 'cagr' THEN 'RATIO' ELSE c.unit END,
+      CASE WHEN ? = 'volatility' THEN FALSE ELSE c.polarity END
+    FROM metric_catalog c
+    WHERE c.metric_type IN ('raw', 'ratio', 'derived', 'market');
+    """, [(stat, label, mtype, mtype, mtype) for stat, mtype, label in TIMESERIES_STATS])
+
 
 # ============================================================
 # 5) fact_metrics
@@ -750,250 +1194,675 @@ def create_fact_metrics_table(con):
     """)
 
 
-def load_fact_metrics(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> None:
+# ============================================================
+# 6) fact_metrics 통합 적재 (target + benchmark 값/개선 여부를 INSERT 1회로)
+# ============================================================
+# 범위: {pairs} (request_context 또는 request_pairs) ∪ 그 벤치 기업 pair, metric은 request_metrics
+# 벤치 값은 같은 statement의 vals를 self-join → UPDATE 왕복 없음
+
+def _dedup_values_cte(name: str, source: str, key_col: str, value_col: str) -> str:
     """
-    요청 범위(corp_code / bsns_year / metrics_spec)에 해당하는 지표만 fact_metrics에 적재
-    - SSOT: request_metrics TEMP 테이블
-    - ratio/derived/market은 report_id 중복 가능 → QUALIFY로 dedup 후 적재
+    ratio/derived 공통: report_id 중복 dedup(cur/prev) 후 YoY까지 붙인 {name} CTE.
+    dedup 규칙: NOT NULL 우선 → abs 큰 값 → report_id DESC
     """
-    if not metrics_spec:
-        raise ValueError("metrics_spec is empty")
+    return f"""
+    {name}_cur AS (
+      SELECT x.corp_code, x.bsns_year, x.{key_col} AS metric_key, x.{value_col} AS value
+      FROM {source} x
+      JOIN scope s
+        ON s.corp_code = x.corp_code
+       AND s.bsns_year = x.bsns_year
+      WHERE x.{key_col} IN (SELECT metric_key FROM request_metrics)
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY x.corp_code, x.bsns_year, x.{key_col}
+        ORDER BY (x.{value_col} IS NOT NULL) DESC, abs(x.{value_col}) DESC, x.report_id DESC
+      ) = 1
+    ),
+    {name}_prev AS (
+      SELECT x.corp_code, x.bsns_year, x.{key_col} AS metric_key, x.{value_col} AS value
+      FROM {source} x
+      JOIN scope s
+        ON s.corp_code = x.corp_code
+       AND s.bsns_year = x.bsns_year + 1
+      WHERE x.{key_col} IN (SELECT metric_key FROM request_metrics)
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY x.corp_code, x.bsns_year, x.{key_col}
+        ORDER BY (x.{value_col} IS NOT NULL) DESC, abs(x.{value_col}) DESC, x.report_id DESC
+      ) = 1
+    ),
+    {name} AS (
+      SELECT
+        c.corp_code,
+        c.bsns_year,
+        c.metric_key,
+        c.value,
+        p.value                AS value_prev,
+        (c.value - p.value)    AS yoy_abs,
+        CASE
+          WHEN p.value IS NOT NULL AND p.value != 0
+          THEN (c.value - p.value) / abs(p.value)
+          ELSE NULL
+        END AS yoy_pct
+      FROM {name}_cur c
+      LEFT JOIN {name}_prev p
+        ON p.corp_code = c.corp_code
+       AND p.bsns_year = c.bsns_year - 1
+       AND p.metric_key = c.metric_key
+    )"""
 
-    create_fact_metrics_table(con)
 
-    # 요청 범위만 clear
-    con.execute(
-        "DELETE FROM fact_metrics WHERE corp_code = ? AND bsns_year = ?",
-        [corp_code, bsns_year],
+def _fused_insert_sql(pairs_sql: str) -> str:
+    """
+    metric 유형별 값(raw / ratio / derived+market / 시계열)을 vals 하나로 모은 뒤
+    metric_catalog·benchmark_map과 조인해 fact_metrics에 INSERT (statement 1개)
+    - 유형별로 metric_catalog.metric_type이 맞는 행만 취함 → vals에서 (corp, year, key)가 겹치지 않음
+    - benchmark_corp_code는 벤치 값 행이 있을 때만 채움
+    """
+    ts_types = ", ".join(f"'{t}'" for t in TIMESERIES_METRIC_TYPES)
+    return f"""
+    WITH bm AS (
+      SELECT corp_code, year AS bsns_year, MIN(bench_corp_code) AS bench_corp_code
+      FROM benchmark_map
+      WHERE bench_corp_code IS NOT NULL
+      GROUP BY 1, 2
+    ),
+    pairs AS (
+      {pairs_sql}
+    ),
+    scope AS (
+      SELECT corp_code, bsns_year FROM pairs
+      UNION
+      SELECT bm.bench_corp_code, bm.bsns_year
+      FROM pairs rp
+      JOIN bm
+        ON bm.corp_code = rp.corp_code
+       AND bm.bsns_year = rp.bsns_year
+    ),
+    raw_vals AS (
+      SELECT
+        a.corp_code,
+        a.bsns_year,
+        a.std_key              AS metric_key,
+        a.val_curr             AS value,
+        a.val_prev             AS value_prev,
+        a.diff_amt             AS yoy_abs,
+        (a.diff_rate / 100.0)  AS yoy_pct
+      FROM v_analysis_compare a
+      JOIN scope s
+        ON s.corp_code = a.corp_code
+       AND s.bsns_year = a.bsns_year
+      WHERE a.std_key IN (SELECT metric_key FROM request_metrics)
+    ),
+    {_dedup_values_cte("ratio_vals", "v_financial_ratios", "ratio_key", "ratio_value")},
+    {_dedup_values_cte("aug_vals", "v_value_augmented", "std_key", "value_won")},
+    ts_vals AS (
+      SELECT
+        c.corp_code,
+        c.bsns_year,
+        c.metric_key,
+        c.value,
+        p.value                AS value_prev,
+        (c.value - p.value)    AS yoy_abs,
+        CASE
+          WHEN p.value IS NOT NULL AND p.value != 0
+          THEN (c.value - p.value) / abs(p.value)
+          ELSE NULL
+        END AS yoy_pct
+      FROM v_metric_timeseries_long c
+      JOIN scope s
+        ON s.corp_code = c.corp_code
+       AND s.bsns_year = c.bsns_year
+      LEFT JOIN v_metric_timeseries_long p
+        ON p.corp_code = c.corp_code
+       AND p.bsns_year = c.bsns_year - 1
+       AND p.metric_key = c.metric_key
+      WHERE c.metric_key IN (SELECT metric_key FROM request_metrics)
+    ),
+    vals AS (
+      SELECT x.* FROM raw_vals x
+      JOIN metric_catalog mc ON mc.metric_key = x.metric_key AND mc.metric_type = 'raw'
+      UNION ALL
+      SELECT x.* FROM ratio_vals x
+      JOIN metric_catalog mc ON mc.metric_key = x.metric_key AND mc.metric_type = 'ratio'
+      UNION ALL
+      SELECT x.* FROM aug_vals x
+      JOIN metric_catalog mc ON mc.metric_key = x.metric_key AND mc.metric_type IN ('derived', 'market')
+      UNION ALL
+      SELECT x.* FROM ts_vals x
+      JOIN metric_catalog mc ON mc.metric_key = x.metric_key AND mc.metric_type IN ({ts_types})
     )
+    INSERT INTO fact_metrics
+    SELECT
+      v.corp_code,
+      v.bsns_year,
+      v.metric_key,
+      mc.metric_name_ko,
+      mc.metric_type,
+      v.value,
+      v.value_prev,
+      v.yoy_abs,
+      v.yoy_pct,
+      mc.unit,
+      CASE WHEN b.metric_key IS NOT NULL THEN bm.bench_corp_code END AS benchmark_corp_code,
+      b.value AS benchmark_value,
+      CASE
+        WHEN b.value IS NULL THEN NULL
+        WHEN mc.polarity IS NULL THEN NULL
+        WHEN mc.polarity = TRUE  THEN (v.value >= b.value)
+        WHEN mc.polarity = FALSE THEN (v.value <= b.value)
+        ELSE NULL
+      END AS benchmark_improved
+    FROM vals v
+    JOIN metric_catalog mc
+      ON mc.metric_key = v.metric_key
+    LEFT JOIN bm
+      ON bm.corp_code = v.corp_code
+     AND bm.bsns_year = v.bsns_year
+    LEFT JOIN vals b
+      ON b.corp_code = bm.bench_corp_code
+     AND b.bsns_year = v.bsns_year
+     AND b.metric_key = v.metric_key;
+    """
 
-    # ----------------------------
-    # RAW
-    # ----------------------------
-    con.execute(
-        """
-        INSERT INTO fact_metrics
-        SELECT
-          a.corp_code,
-          a.bsns_year,
-          a.std_key                 AS metric_key,
-          mc.metric_name_ko,
-          'raw'                     AS metric_type,
-          a.val_curr                AS value,
-          a.val_prev                AS value_prev,
-          a.diff_amt                AS yoy_abs,
-          (a.diff_rate / 100.0)     AS yoy_pct,
-          mc.unit,
-          NULL, NULL, NULL
-        FROM v_analysis_compare a
-        JOIN metric_catalog mc
-          ON mc.metric_key = a.std_key
-        WHERE a.corp_code = ?
-          AND a.bsns_year = ?
-          AND mc.metric_type = 'raw'
-          AND EXISTS (SELECT 1 FROM request_metrics rm WHERE rm.metric_key = a.std_key);
-        """,
-        [corp_code, bsns_year],
-    )
 
-    # ----------------------------
-    # RATIO (dedup)
-    # ----------------------------
-    con.execute(
-        """
-        WITH cur_dedup AS (
-          SELECT
-            cur.corp_code,
-            cur.bsns_year,
-            cur.ratio_key,
-            cur.ratio_value,
-            cur.report_id
-          FROM v_financial_ratios cur
-          WHERE cur.corp_code = ?
-            AND cur.bsns_year = ?
-            AND EXISTS (SELECT 1 FROM request_metrics rm WHERE rm.metric_key = cur.ratio_key)
-          QUALIFY ROW_NUMBER() OVER (
-            PARTITION BY cur.corp_code, cur.bsns_year, cur.ratio_key
-            ORDER BY (cur.ratio_value IS NOT NULL) DESC, abs(cur.ratio_value) DESC, cur.report_id DESC
-          ) = 1
-        ),
-        prev_dedup AS (
-          SELECT
-            prev.corp_code,
-            prev.bsns_year,
-            prev.ratio_key,
-            prev.ratio_value,
-            prev.report_id
-          FROM v_financial_ratios prev
-          WHERE prev.corp_code = ?
-            AND prev.bsns_year = ? - 1
-          QUALIFY ROW_NUMBER() OVER (
-            PARTITION BY prev.corp_code, prev.bsns_year, prev.ratio_key
-            ORDER BY (prev.ratio_value IS NOT NULL) DESC, abs(prev.ratio_value) DESC, prev.report_id DESC
-          ) = 1
-        )
-        INSERT INTO fact_metrics
-        SELECT
-          c.corp_code,
-          c.bsns_year,
-          c.ratio_key                  AS metric_key,
-          mc.metric_name_ko,
-          'ratio'                      AS metric_type,
-          c.ratio_value                AS value,
-          p.ratio_value                AS value_prev,
-          (c.ratio_value - p.ratio_value) AS yoy_abs,
-          CASE
-            WHEN p.ratio_value IS NOT NULL AND p.ratio_value != 0
-            THEN (c.ratio_value - p.ratio_value) / abs(p.ratio_value)
-            ELSE NULL
-          END AS yoy_pct,
-          mc.unit,
-          NULL, NULL, NULL
-        FROM cur_dedup c
-        LEFT JOIN prev_dedup p
-          ON c.corp_code = p.corp_code
-         AND c.ratio_key = p.ratio_key
-        JOIN metric_catalog mc
-          ON mc.metric_key = c.ratio_key
-        WHERE mc.metric_type = 'ratio';
-        """,
-        [corp_code, bsns_year, corp_code, bsns_year],
-    )
+def _load_fact_metrics_fused(con, pairs_sql: str) -> int:
+    """pairs_sql(+벤치) 범위를 DELETE 후 INSERT 1회. 반환: 대상 pair의 적재 행 수"""
+    create_fact_metrics_table(con)
+    create_calc_result_cache_table(con)
+
+    cleared_sql = f"""
+        SELECT corp_code, bsns_year FROM ({pairs_sql})
+        UNION
+        SELECT bm.bench_corp_code, bm.year
+        FROM ({pairs_sql}) rp
+        JOIN benchmark_map bm
+          ON bm.corp_code = rp.corp_code
+         AND bm.year = rp.bsns_year
+    """
 
-    # ----------------------------
-    # DERIVED / MARKET (dedup)
-    # ----------------------------
-    con.execute(
-        """
-        WITH cur_dedup AS (
-          SELECT
-            cur.corp_code,
-            cur.bsns_year,
-            cur.std_key,
-            cur.value_won,
-            cur.report_id
-          FROM v_value_augmented cur
-          WHERE cur.corp_code = ?
-            AND cur.bsns_year = ?
-            AND EXISTS (SELECT 1 FROM request_metrics rm WHERE rm.metric_key = cur.std_key)
-          QUALIFY ROW_NUMBER() OVER (
-            PARTITION BY cur.corp_code, cur.bsns_year, cur.std_key
-            ORDER BY (cur.value_won IS NOT NULL) DESC, abs(cur.value_won) DESC, cur.report_id DESC
-          ) = 1
-        ),
-        prev_dedup AS (
-          SELECT
-            prev.corp_code,
-            prev.bsns_year,
-            prev.std_key,
-            prev.value_won,
-            prev.report_id
-          FROM v_value_augmented prev
-          WHERE prev.corp_code = ?
-            AND prev.bsns_year = ? - 1
-          QUALIFY ROW_NUMBER() OVER (
-            PARTITION BY prev.corp_code, prev.bsns_year, prev.std_key
-            ORDER BY (prev.value_won IS NOT NULL) DESC, abs(prev.value_won) DESC, prev.report_id DESC
-          ) = 1
-        )
-        INSERT INTO fact_metrics
-        SELECT
-          c.corp_code,
-          c.bsns_year,
-          c.std_key                    AS metric_key,
-          mc.metric_name_ko,
-          mc.metric_type,
-          c.value_won                  AS value,
-          p.value_won                  AS value_prev,
-          (c.value_won - p.value_won)  AS yoy_abs,
-          CASE
-            WHEN p.value_won IS NOT NULL AND p.value_won != 0
-            THEN (c.value_won - p.value_won) / abs(p.value_won)
-            ELSE NULL
-          END AS yoy_pct,
-          mc.unit,
-          NULL, NULL, NULL
-        FROM cur_dedup c
-        LEFT JOIN prev_dedup p
-          ON c.corp_code = p.corp_code
-         AND c.std_key   = p.std_key
-        JOIN metric_catalog mc
-          ON mc.metric_key = c.std_key
-        WHERE mc.metric_type IN ('derived','market');
-        """,
-        [corp_code, bsns_year, corp_code, bsns_year],
-    )
+    # 요청 범위(+벤치 pair)만 clear
+    con.execute(f"""
+    DELETE FROM fact_metrics f
+    WHERE EXISTS (
+      SELECT 1
+      FROM ({cleared_sql}) s
+      WHERE s.corp_code = f.corp_code
+        AND s.bsns_year = f.bsns_year
+    );
+    """)
+
+    # 다시 쓰는 pair의 캐시 무효화
+    # - 벤치로 적재된 행은 benchmark_* 컬럼이 NULL → 그 기업 자신의 캐시 결과와 달라짐
+    # - 대상 pair는 호출 측(run_calc)이 적재 후 다시 stamp
+    con.execute(f"""
+    DELETE FROM calc_result_cache c
+    WHERE EXISTS (
+      SELECT 1
+      FROM ({cleared_sql}) s
+      WHERE s.corp_code = c.corp_code
+        AND s.bsns_year = c.bsns_year
+    );
+    """)
+
+    con.execute(_fused_insert_sql(pairs_sql))
+    _load_metric_lineage(con, pairs_sql)
+
+    n = con.execute(f"""
+      SELECT COUNT(*)
+      FROM fact_metrics f
+      JOIN ({pairs_sql}) rp
+        ON rp.corp_code = f.corp_code
+       AND rp.bsns_year = f.bsns_year
+    """).fetchone()[0]
+    return int(n)
 
 
-def update_benchmark_values(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> str:
+def load_fact_metrics_with_benchmark(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> int:
     """
-    benchmark_map을 기반으로 fact_metrics에 benchmark_corp_code / benchmark_value 채우기
-    전제: 벤치 기업도 동일 metric_key로 fact_metrics가 이미 적재되어 있어야 함
+    target + benchmark 지표 값 / 벤치 값 / 개선 여부를 INSERT…SELECT 1회로 적재.
+    - 범위: request_context(corp_code, bsns_year) + request_metrics (run_calc.py에서 주입)
+    반환: target 적재 행 수
     """
     if not metrics_spec:
         raise ValueError("metrics_spec is empty")
 
-    row = con.execute(
-        """
-        SELECT bench_corp_code
-        FROM benchmark_map
-        WHERE corp_code = ?
-          AND year = ?
-        """,
-        [corp_code, bsns_year],
-    ).fetchone()
-
-    if not row or not row[0]:
-        raise RuntimeError(f"benchmark_map에 벤치 기업이 없습니다: corp_code={corp_code}, year={bsns_year}")
-
-    bench_corp_code = row[0]
-
-    con.execute(
-        """
-        UPDATE fact_metrics f
-        SET
-          benchmark_corp_code = ?,
-          benchmark_value = b.value
-        FROM fact_metrics b
-        WHERE f.corp_code = ?
-          AND f.bsns_year = ?
-          AND b.corp_code = ?
-          AND b.bsns_year = ?
-          AND f.metric_key = b.metric_key
-          AND EXISTS (SELECT 1 FROM request_metrics rm WHERE rm.metric_key = f.metric_key);
-        """,
-        [bench_corp_code, corp_code, bsns_year, bench_corp_code, bsns_year],
-    )
+    ctx = con.execute("SELECT corp_code, bsns_year FROM request_context").fetchall()
+    if ctx != [(corp_code, int(bsns_year))]:
+        raise RuntimeError(f"request_context 불일치: ctx={ctx}, corp_code={corp_code}, year={bsns_year}")
 
-    print(f"✅ benchmark_value updated: corp={corp_code}, year={bsns_year}, bench={bench_corp_code}")
-    return bench_corp_code
+    n = _load_fact_metrics_fused(con, "SELECT corp_code, bsns_year FROM request_context")
+    print(f"✅ fact_metrics loaded (target+benchmark fused): corp={corp_code}, year={bsns_year}, rows={n}")
+    return n
 
 
-def update_benchmark_improved(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> None:
+def load_fact_metrics_batch(con, pairs: List[Tuple[str, int]], metrics_spec: List[str]) -> int:
     """
-    metric_catalog.polarity 규칙으로 benchmark_improved 계산
+    여러 (corp_code, bsns_year)에 대해 fact_metrics를 한 번에 적재 (벤치 기업 포함).
+    - request_pairs / request_metrics TEMP 테이블로 범위 지정 (이 함수가 새로 만듦)
+    - 모든 metric 유형 + 벤치 값·개선 여부를 INSERT…SELECT 1회로 계산
+    반환: 적재된 fact_metrics 행 수
     """
     if not metrics_spec:
         raise ValueError("metrics_spec is empty")
+    if not pairs:
+        raise ValueError("pairs is empty")
 
-    con.execute(
-        """
-        UPDATE fact_metrics f
-        SET benchmark_improved =
-          CASE
-            WHEN f.benchmark_value IS NULL THEN NULL
-            WHEN mc.polarity IS NULL THEN NULL
-            WHEN mc.polarity = TRUE  THEN (f.value >= f.benchmark_value)
-            WHEN mc.polarity = FALSE THEN (f.value <= f.benchmark_value)
-            ELSE NULL
-          END
-        FROM metric_catalog mc
-        WHERE f.metric_key = mc.metric_key
-          AND f.corp_code = ?
-          AND f.bsns_year = ?
-          AND EXISTS (SELECT 1 FROM request_metrics rm WHERE rm.metric_key = f.metric_key);
-        """,
-        [corp_code, bsns_year],
+    con.execute("DROP TABLE IF EXISTS request_pairs;")
+    con.execute("""
+    CREATE TEMP TABLE request_pairs (
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      PRIMARY KEY (corp_code, bsns_year)
+    );
+    """)
+    con.executemany(
+        "INSERT OR IGNORE INTO request_pairs VALUES (?, ?)",
+        [(str(c), int(y)) for (c, y) in pairs],
     )
 
-    print("✅ benchmark_improved updated (request_metrics scope)")
+    con.execute("DROP TABLE IF EXISTS request_metrics;")
+    con.execute("CREATE TEMP TABLE request_metrics (metric_key VARCHAR PRIMARY KEY);")
+    con.executemany(
+        "INSERT OR IGNORE INTO request_metrics VALUES (?)",
+        [(str(m),) for m in metrics_spec],
+    )
+
+    n = _load_fact_metrics_fused(con, "SELECT corp_code, bsns_year FROM request_pairs")
+    print(f"✅ fact_metrics batch loaded: pairs={len(pairs)}, rows(target)={n}")
+    return n
+
+
+# ============================================================
+# 7) 계산 결과 fingerprint 캐시 (입력이 그대로면 재계산 생략)
+# ============================================================
+
+def create_calc_result_cache_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS calc_result_cache (
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      metrics_hash VARCHAR,       -- 정렬된 metrics_spec 해시
+      fingerprint VARCHAR,        -- calc_result_fingerprint()
+      computed_at TIMESTAMP,
+      produced_hash VARCHAR,      -- 적재 직후 fact_metrics에 있던 metric_key 집합 해시
+      PRIMARY KEY (corp_code, bsns_year, metrics_hash)
+    );
+    """)
+    con.execute("ALTER TABLE calc_result_cache ADD COLUMN IF NOT EXISTS produced_hash VARCHAR;")
+
+
+def _metrics_hash(metrics_spec: List[str]) -> str:
+    return hashlib.sha1("|".join(sorted(set(map(str, metrics_spec)))).encode("utf-8")).hexdigest()
+
+
+def _produced_metrics_hash(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> str:
+    """요청 metric 중 fact_metrics에 실제로 행이 있는 metric_key 집합 해시 (입력 없는 지표는 행이 없을 수 있음)"""
+    keys = [r[0] for r in con.execute("""
+      SELECT DISTINCT metric_key
+      FROM fact_metrics
+      WHERE corp_code = ? AND bsns_year = ?
+        AND metric_key IN (SELECT UNNEST(?))
+    """, [corp_code, int(bsns_year), list(metrics_spec)]).fetchall()]
+    return _metrics_hash(keys)
+
+
+def _table_md5(con, sql: str, params: list = None) -> str:
+    """sql 결과 행 전체를 정렬된 문자열로 이어 붙인 md5 (행 순서 무관)"""
+    return con.execute(f"""
+      SELECT md5(coalesce(string_agg(CAST(x AS VARCHAR), '|' ORDER BY CAST(x AS VARCHAR)), ''))
+      FROM ({sql}) x
+    """, params or []).fetchone()[0]
+
+
+def calc_result_fingerprint(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> str:
+    """
+    (corp_code, bsns_year, metrics_spec) 결과에 기여하는 입력 해시
+    - 대상/벤치 기업의 fs_facts (v_summary_all_years가 회사의 모든 report를 보므로 연도 무관 전체)
+    - 대상/벤치 기업의 market_data (당해/전년)
+    - benchmark_map 행, account_map_rules, ratio_requirements, metric_catalog
+    - stage SQL (계산 로직 자체가 바뀐 경우)
+    """
+    h = hashlib.sha1()
+    h.update(f"{corp_code}|{int(bsns_year)}|{_metrics_hash(metrics_spec)}".encode("utf-8"))
+
+    for view, table, key, col, sql in CALC_STAGES:
+        h.update(f"{view}|{_stage_sql(sql, key, col, False)}".encode("utf-8"))
+
+    bench = con.execute(
+        "SELECT bench_corp_code FROM benchmark_map WHERE corp_code = ? AND year = ?",
+        [corp_code, int(bsns_year)],
+    ).fetchall()
+    corps = sorted({corp_code} | {r[0] for r in bench if r[0]})
+    h.update(f"bench={corps}".encode("utf-8"))
+
+    parts = {
+        "fs_facts": _table_md5(con, """
+            SELECT f.*
+            FROM fs_facts f
+            JOIN reports r ON r.report_id = f.report_id
+            WHERE r.corp_code IN (SELECT UNNEST(?))
+        """, [corps]),
+        "market_data": _table_md5(con, """
+            SELECT *
+            FROM market_data
+            WHERE corp_code IN (SELECT UNNEST(?))
+              AND CAST(year AS INT) IN (?, ?)
+        """, [corps, int(bsns_year), int(bsns_year) - 1]),
+        "account_map_rules": _table_md5(con, "SELECT * FROM account_map_rules"),
+        "ratio_requirements": _table_md5(con, "SELECT * FROM ratio_requirements"),
+        "metric_catalog": _table_md5(con, "SELECT * FROM metric_catalog"),
+    }
+    for k in sorted(parts):
+        h.update(f"{k}={parts[k]}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def is_calc_result_fresh(con, corp_code: str, bsns_year: int, metrics_spec: List[str], fingerprint: str) -> bool:
+    """
+    캐시된 fingerprint가 같고 fact_metrics에 stamp 때와 같은 metric_key 집합이 남아 있으면 True
+    - 요청 metric 중 입력이 없어 행이 안 생긴 지표가 있어도 stamp 때와 같으면 hit
+    (다른 기업의 벤치로 행이 다시 적재되면 _load_fact_metrics_fused가 캐시 행을 지움)
+    """
+    create_calc_result_cache_table(con)
+    row = con.execute("""
+      SELECT fingerprint, produced_hash
+      FROM calc_result_cache
+      WHERE corp_code = ? AND bsns_year = ? AND metrics_hash = ?
+    """, [corp_code, int(bsns_year), _metrics_hash(metrics_spec)]).fetchone()
+    if not row or row[0] != fingerprint or row[1] is None:
+        return False
+    return row[1] == _produced_metrics_hash(con, corp_code, bsns_year, metrics_spec)
+
+
+def stamp_calc_result(con, corp_code: str, bsns_year: int, metrics_spec: List[str], fingerprint: str) -> None:
+    create_calc_result_cache_table(con)
+    con.execute("""
+      INSERT OR REPLACE INTO calc_result_cache
+        (corp_code, bsns_year, metrics_hash, fingerprint, computed_at, produced_hash)
+      VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+    """, [corp_code, int(bsns_year), _metrics_hash(metrics_spec), fingerprint,
+          _produced_metrics_hash(con, corp_code, bsns_year, metrics_spec)])
+
+
+# ============================================================
+# 8) peer group 통계 (fact_metrics_peer)
+# ============================================================
+# 단일 벤치 기업 대신, 같은 연도의 peer 집단 전체에 대한 분위/중앙값/IQR/z-score
+# - peer_group: 'ALL'(적재된 전체 기업) + 'scale:<market_data.scale>'
+#   (벤치 기업은 market_data.scale이 비어 있으므로 자신을 벤치로 둔 대상 기업의 scale을 따름)
+# - 값: v_metric_timeseries(raw/ratio/derived 시계열 값) + v_metric_timeseries_long(시계열 통계)
+# - universe 전체를 윈도우 함수 1회로 계산해서 테이블로 저장 → 요청마다 재스캔하지 않음
+
+def build_fact_metrics_peer(con) -> int:
+    """
+    fact_metrics_peer 전체 재생성. 반환: 행 수
+    pct_rank: 그룹 내 오름차순 percent_rank (0~1, polarity 무관)
+    """
+    con.execute("""
+    CREATE OR REPLACE TABLE fact_metrics_peer AS
+    WITH vals AS (
+      SELECT corp_code, bsns_year, metric_key, value
+      FROM v_metric_timeseries
+      WHERE value IS NOT NULL
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, value
+      FROM v_metric_timeseries_long
+      WHERE value IS NOT NULL
+    ),
+    corp_scale AS (
+      SELECT corp_code, CAST(year AS INT) AS bsns_year, MAX(scale) AS scale
+      FROM market_data
+      WHERE scale IS NOT NULL
+      GROUP BY 1, 2
+    ),
+    bench_scale AS (
+      SELECT bm.bench_corp_code AS corp_code, bm.year AS bsns_year, MIN(cs.scale) AS scale
+      FROM benchmark_map bm
+      JOIN corp_scale cs
+        ON cs.corp_code = bm.corp_code
+       AND cs.bsns_year = bm.year
+      WHERE bm.bench_corp_code IS NOT NULL
+      GROUP BY 1, 2
+    ),
+    grouped AS (
+      SELECT v.*, 'ALL' AS peer_group
+      FROM vals v
+      JOIN metric_catalog mc ON mc.metric_key = v.metric_key
+      UNION ALL
+      SELECT v.*, 'scale:' || COALESCE(cs.scale, bs.scale) AS peer_group
+      FROM vals v
+      JOIN metric_catalog mc ON mc.metric_key = v.metric_key
+      LEFT JOIN corp_scale cs
+        ON cs.corp_code = v.corp_code
+       AND cs.bsns_year = v.bsns_year
+      LEFT JOIN bench_scale bs
+        ON bs.corp_code = v.corp_code
+       AND bs.bsns_year = v.bsns_year
+      WHERE COALESCE(cs.scale, bs.scale) IS NOT NULL
+    ),
+    stats AS (
+      SELECT
+        corp_code,
+        bsns_year,
+        metric_key,
+        peer_group,
+        value,
+        COUNT(*)                    OVER g AS peer_n,
+        percent_rank()              OVER (PARTITION BY peer_group, bsns_year, metric_key ORDER BY value) AS pct_rank,
+        quantile_cont(value, 0.5)   OVER g AS peer_median,
+        quantile_cont(value, 0.25)  OVER g AS peer_q1,
+        quantile_cont(value, 0.75)  OVER g AS peer_q3,
+        avg(value)                  OVER g AS peer_mean,
+        stddev_samp(value)          OVER g AS peer_std
+      FROM grouped
+      WINDOW g AS (PARTITION BY peer_group, bsns_year, metric_key)
+    )
+    SELECT
+      corp_code,
+      bsns_year,
+      metric_key,
+      peer_group,
+      value,
+      peer_n,
+      pct_rank,
+      peer_median,
+      peer_q1,
+      peer_q3,
+      (peer_q3 - peer_q1) AS peer_iqr,
+      peer_mean,
+      peer_std,
+      CASE WHEN peer_std IS NOT NULL AND peer_std <> 0 THEN (value - peer_mean) / peer_std ELSE NULL END AS z_score,
+      CURRENT_TIMESTAMP AS built_at
+    FROM stats;
+    """)
+
+    n, n_groups = con.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT peer_group) FROM fact_metrics_peer"
+    ).fetchone()
+    print(f"✅ fact_metrics_peer built: rows={n}, peer_groups={n_groups}")
+    return int(n)
+
+
+# ============================================================
+# 9) metric_lineage (지표 → 기여 std_key → 원천 셀 → 주석 번호)
+# ============================================================
+# fact_metrics 적재와 같은 pass에서 대상 pair 범위만 DELETE → INSERT (_load_fact_metrics_fused)
+# - ratio: ratio_requirements(item_key/role), derived: DERIVED_INPUTS, 시계열({base}__{stat}): base 지표를 따름
+# - ratio 입력이 derived면(NOPAT 등) 한 단계 더 전개 → via_key에 derived 항목을 남김
+# - 원천 셀: v_fin_long_mapped(당기 fiscal_year) ↔ fs_facts(col_idx, note_nos) + note_links
+# - 셀이 없는 입력도 행을 남김 (location NULL) → trace에서 누락 입력이 드러남
+# retriever/섹션 빌더는 (corp_code, bsns_year, metric_key) 인덱스 조회 1회로 trace를 얻음
+
+def create_metric_lineage_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS metric_lineage (
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      metric_key VARCHAR,
+      role VARCHAR,            -- self / numerator / add / subtract / denominator / input
+      via_key VARCHAR,         -- 중간 derived 항목 (ratio → NOPAT → OP_PROFIT 이면 NOPAT)
+      std_key VARCHAR,
+      source VARCHAR,          -- fs_facts / market_data / NULL(값 없음)
+      report_id VARCHAR,
+      statement_type VARCHAR,
+      line_item_id VARCHAR,
+      table_id VARCHAR,
+      row_idx INTEGER,
+      col_idx INTEGER,
+      label_clean VARCHAR,
+      value_won DOUBLE,
+      note_nos INTEGER[]
+    );
+    """)
+    con.execute("""
+    CREATE INDEX IF NOT EXISTS idx_metric_lineage_key
+    ON metric_lineage (corp_code, bsns_year, metric_key);
+    """)
+
+
+def _lineage_insert_sql(pairs_sql: str) -> str:
+    ts_types = ", ".join(f"'{t}'" for t in TIMESERIES_METRIC_TYPES)
+    derived_deps = ",\n        ".join(
+        f"('{k}', '{item}')" for k, items in DERIVED_INPUTS.items() for item in items
+    )
+    market_keys = ", ".join(f"'{k}'" for k in MARKET_KEYS)
+    return f"""
+    INSERT INTO metric_lineage
+    WITH pairs AS (
+      {pairs_sql}
+    ),
+    req AS (
+      SELECT
+        f.corp_code,
+        f.bsns_year,
+        f.metric_key,
+        CASE
+          WHEN f.metric_type IN ({ts_types}) THEN split_part(f.metric_key, '__', 1)
+          ELSE f.metric_key
+        END AS base_key
+      FROM fact_metrics f
+      JOIN pairs p
+        ON p.corp_code = f.corp_code
+       AND p.bsns_year = f.bsns_year
+    ),
+    derived_deps AS (
+      SELECT * FROM (VALUES
+        {derived_deps}
+      ) t(metric_key, std_key)
+    ),
+    deps AS (
+      SELECT ratio_key AS metric_key, item_key AS std_key, role FROM ratio_requirements
+      UNION ALL
+      SELECT metric_key, std_key, 'input' AS role FROM derived_deps
+    ),
+    items AS (
+      SELECT
+        r.corp_code,
+        r.bsns_year,
+        r.metric_key,
+        COALESCE(d.role, 'self')         AS role,
+        COALESCE(d.std_key, r.base_key)  AS item_key
+      FROM req r
+      LEFT JOIN deps d
+        ON d.metric_key = r.base_key
+    ),
+    leaves AS (
+      SELECT
+        i.corp_code,
+        i.bsns_year,
+        i.metric_key,
+        i.role,
+        CASE WHEN dd.std_key IS NOT NULL THEN i.item_key END AS via_key,
+        COALESCE(dd.std_key, i.item_key)                     AS std_key
+      FROM items i
+      LEFT JOIN derived_deps dd
+        ON dd.metric_key = i.item_key
+    ),
+    notes AS (
+      SELECT report_id, line_item_id, list(DISTINCT note_no) AS note_nos
+      FROM note_links
+      WHERE note_no IS NOT NULL
+      GROUP BY 1, 2
+    ),
+    cells AS (
+      SELECT
+        m.corp_code,
+        m.bsns_year,
+        m.std_key,
+        m.report_id,
+        m.statement_type,
+        m.line_item_id,
+        m.table_id,
+        m.row_idx,
+        f.col_idx,
+        m.label_clean,
+        m.value_won,
+        list_sort(list_distinct(list_concat(COALESCE(f.note_nos, []), COALESCE(n.note_nos, [])))) AS note_nos
+      FROM v_fin_long_mapped m
+      JOIN pairs p
+        ON p.corp_code = m.corp_code
+       AND p.bsns_year = m.bsns_year
+      JOIN fs_facts f
+        ON f.report_id    = m.report_id
+       AND f.line_item_id = m.line_item_id
+       AND f.table_id     = m.table_id
+       AND f.row_idx      = m.row_idx
+       AND f.fiscal_year  = m.fiscal_year
+       AND f.value_won    = m.value_won
+      LEFT JOIN notes n
+        ON n.report_id    = m.report_id
+       AND n.line_item_id = m.line_item_id
+      WHERE m.std_key IS NOT NULL
+        AND m.fiscal_year = m.bsns_year
+    )
+    SELECT
+      l.corp_code,
+      l.bsns_year,
+      l.metric_key,
+      l.role,
+      l.via_key,
+      l.std_key,
+      CASE
+        WHEN c.line_item_id IS NOT NULL THEN 'fs_facts'
+        WHEN l.std_key IN ({market_keys}) THEN 'market_data'
+      END AS source,
+      c.report_id,
+      c.statement_type,
+      c.line_item_id,
+      c.table_id,
+      c.row_idx,
+      c.col_idx,
+      c.label_clean,
+      c.value_won,
+      c.note_nos
+    FROM leaves l
+    LEFT JOIN cells c
+      ON c.corp_code = l.corp_code
+     AND c.bsns_year = l.bsns_year
+     AND c.std_key   = l.std_key;
+    """
+
+
+def _load_metric_lineage(con, pairs_sql: str) -> int:
+    """pairs_sql 범위(벤치 제외)의 metric_lineage 재적재. 반환: 행 수"""
+    create_metric_lineage_table(con)
+
+    con.execute(f"""
+    DELETE FROM metric_lineage l
+    WHERE EXISTS (
+      SELECT 1 FROM ({pairs_sql}) p
+      WHERE p.corp_code = l.corp_code
+        AND p.bsns_year = l.bsns_year
+    );
+    """)
+    con.execute(_lineage_insert_sql(pairs_sql))
+
+    n = con.execute(f"""
+      SELECT COUNT(*)
+      FROM metric_lineage l
+      JOIN ({pairs_sql}) p
+        ON p.corp_code = l.corp_code
+       AND p.bsns_year = l.bsns_year
+    """).fetchone()[0]
+    print(f"✅ metric_lineage loaded: rows={n}")
+    return int(n)
@@ -2,20 +2,25 @@
 # DuckDB에 저장된 “텍스트 chunk”들을 벡터로 바꿔서 FAISS에 넣는 단계
 # ingest 단계에서 DuckDB에 rag_text_chunks에 III-2 / III-3에서 추출한 설명 텍스트가 저장됨.
 # 1. rag_text_chunks.text_for_embed 컬럼 읽기
-# 2. SentenceTransformer 같은 모델로 embedding
+# 2. SentenceTransformer 같은 모델로 embedding (backend: st / st_pool / onnx_int8, src/encoders.py)
 # 3. chunk_id → vec_id(int64)로 변환
 # 4. FAISS index에 (vec_id, embedding) 저장
+# 5. 정규화된 벡터는 rag_embedding_cache(model_name, sha1(text))에 1벌만 저장
+#    → 동일 텍스트(회계정책/면책 문구 등)는 한 번만 인코딩, FAISS id는 chunk별로 따로
+#    → rebuild / index 종류 변경은 저장된 벡터 load → add 만으로 끝남 (재인코딩 없음)
 
 from __future__ import annotations
 
+import math
 import os
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import duckdb
 import numpy as np
+import pandas as pd
 import faiss
-from sentence_transformers import SentenceTransformer
-from src.utils.ids import chunk_id_to_int64
+from src.encoders import ENCODER_BACKENDS, Encoder, default_backend, make_encoder
+from src.utils.ids import chunk_id_to_int64, sha1_hex, stable_id
 
 def _get_existing_cols(con: duckdb.DuckDBPyConnection, table: str) -> list[str]:
     rows = con.execute(f"PRAGMA table_info('{table}')").fetchall()
@@ -31,88 +36,356 @@ def load_or_create_faiss(index_path: str, dim: int) -> faiss.Index:
     return faiss.IndexIDMap2(base)
 
 
-def normalize_embeddings(x: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
-    return x / norms
+# ============================================================
+# ANN index factory
+# - flat     : 정확(brute force), float32 전체 메모리
+# - ivf_flat : 클러스터(nlist) 중 nprobe개만 탐색, 벡터는 float32 그대로
+# - ivf_pq   : IVF + PQ 압축 (벡터당 m bytes) → 수백만 chunk용
+# - hnsw     : 그래프 탐색 (efSearch), 가장 빠르지만 remove_ids 미지원 → auto에서는 선택하지 않음
+# - sq8      : flat + 8bit scalar quantization (float32 대비 1/4, 정확 탐색에 가까운 recall)
+# - ivf_sq8  : IVF + SQ8 (serving용 중간 지점)
+# flat / sq8 / hnsw는 IDMap2로 감싸서 vec_id(add_with_ids) 사용
+# IVF 계열은 IDMap2 없이 IVF 자체 id 사용 (inverted list가 id를 직접 보관, remove_ids도 IVF가 처리)
+#   → IDMap2로 감싸면 remove 후 IDMap2 위치 ↔ IVF 내부 id가 어긋나 오답 / 두 번째 remove에서 abort
+# ============================================================
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "ivf_sq8")
 
+FLAT_MAX_NTOTAL = 100_000       # 이 이하면 정확 검색으로 충분
+HNSW_M = 32
+PQ_NBITS = 8
+TRAIN_MAX = 200_000             # train 샘플 상한
+IVF_NPROBE_DIV = 16             # 기본 nprobe = nlist/16 (faiss 기본값 1은 recall이 크게 떨어짐)
+IVF_NPROBE_MIN = 8
 
-def build_or_update_faiss_from_db(
-    con: duckdb.DuckDBPyConnection,
-    index_path: str,
-    model_name: str,
-    batch_size: int = 128,
-    rebuild: bool = False,
-) -> None:
-    # text 컬럼 선택
-    text_col = "text_for_embed" if "text_for_embed" in _get_existing_cols(con, "rag_text_chunks") else "text"
 
-    model = SentenceTransformer(model_name)
-    dim = model.get_sentence_embedding_dimension()
+def _ivf_nlist(ntotal: int) -> int:
+    # 경험칙 4*sqrt(n), 클러스터당 train 점 39개 이상 확보
+    return int(max(1, min(4 * math.sqrt(max(ntotal, 1)), ntotal // 39)))
+
+
+def default_nprobe(nlist: int) -> int:
+    """IVF 기본 nprobe: nlist/16 (최소 8, nlist 이하)"""
+    return int(min(nlist, max(IVF_NPROBE_MIN, nlist // IVF_NPROBE_DIV)))
+
+
+def _pq_m(dim: int) -> int:
+    # sub-vector 당 8차원 전후, dim의 약수
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def estimate_index_bytes(kind: str, ntotal: int, dim: int) -> int:
+    """index 메모리 대략치 (벡터 + id map, IVF centroid / HNSW 링크 포함)"""
+    per_id = 16  # IDMap2 (id 배열 + 역방향 map). IVF는 list 안의 id 8 bytes만
+    if kind == "flat":
+        return ntotal * (4 * dim + per_id)
+    if kind == "hnsw":
+        return ntotal * (4 * dim + per_id + HNSW_M * 2 * 4 * 2)
+    if kind == "sq8":
+        return ntotal * (dim + per_id)
+    nlist = _ivf_nlist(ntotal)
+    if kind == "ivf_sq8":
+        return ntotal * (dim + 8) + nlist * 4 * dim
+    if kind == "ivf_flat":
+        return ntotal * (4 * dim + 8) + nlist * 4 * dim
+    if kind == "ivf_pq":
+        return ntotal * (_pq_m(dim) + 8) + nlist * 4 * dim
+    raise ValueError(f"unknown index kind: {kind} (choices: {INDEX_KINDS})")
+
 
-    # embeddings 메타 테이블 보장
+def choose_index_kind(ntotal: int, dim: int, mem_budget_mb: Optional[float] = None) -> str:
+    """
+    ntotal / 메모리 예산으로 index 종류 자동 선택
+    - 작으면 flat (정확)
+    - 그 이상은 ivf_flat, 예산 초과 시 ivf_pq
+    """
+    budget = None if mem_budget_mb is None else mem_budget_mb * 1024 * 1024
+    fits = lambda k: budget is None or estimate_index_bytes(k, ntotal, dim) <= budget
+    if ntotal <= FLAT_MAX_NTOTAL and fits("flat"):
+        return "flat"
+    if fits("ivf_flat"):
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def index_factory_string(kind: str, ntotal: int, dim: int) -> str:
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{HNSW_M}"
+    if kind == "sq8":
+        return "IDMap2,SQ8"
+    nlist = _ivf_nlist(ntotal)
+    if kind == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_pq":
+        return f"IVF{nlist},PQ{_pq_m(dim)}x{PQ_NBITS}"
+    raise ValueError(f"unknown index kind: {kind} (choices: {INDEX_KINDS})")
+
+
+def create_index(kind: str, dim: int, ntotal: int, train_x: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    factory로 빈 index 생성 (+ train 필요 시 train_x로 train)
+    - PQ는 codebook(2^nbits) train 점이 부족하면 ivf_flat으로 내림
+    - IVF는 기본 nprobe를 index에 저장 (write_index에 같이 기록됨)
+    """
+    if kind == "ivf_pq" and ntotal < (1 << PQ_NBITS) * 39:
+        kind = "ivf_flat"
+    index = faiss.index_factory(dim, index_factory_string(kind, ntotal, dim), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        if train_x is None or len(train_x) == 0:
+            raise ValueError(f"{kind} index는 train 벡터가 필요합니다")
+        index.train(np.ascontiguousarray(train_x, dtype=np.float32))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = default_nprobe(ivf.nlist)
+    return index
+
+
+# 하위 클래스 먼저 (IndexIVFScalarQuantizer / IndexIVFPQ는 IndexIVF 계열)
+_KIND_CLASSES = (
+    ("IndexHNSW", "hnsw"),
+    ("IndexIVFPQ", "ivf_pq"),
+    ("IndexIVFScalarQuantizer", "ivf_sq8"),
+    ("IndexIVFFlat", "ivf_flat"),
+    ("IndexScalarQuantizer", "sq8"),
+    ("IndexFlat", "flat"),
+)
+
+
+def index_kind_of(index: faiss.Index) -> Optional[str]:
+    """로드된 index의 종류 (IDMap2면 안쪽 index 기준). 모르는 종류면 None"""
+    base = index.index if hasattr(index, "id_map") else index
+    base = faiss.downcast_index(base)
+    for cls_name, kind in _KIND_CLASSES:
+        cls = getattr(faiss, cls_name, None)
+        if cls is not None and isinstance(base, cls):
+            return kind
+    return None
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """검색 정확도/속도 knob (IDMap2 감싼 index에도 적용). 해당 없는 index 종류면 무시"""
+    ps = faiss.ParameterSpace()
+    for name, v in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if v is None:
+            continue
+        try:
+            ps.set_index_parameter(index, name, int(v))
+        except RuntimeError:
+            pass
+
+
+def ensure_embeddings_table(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    rag_embedding_cache   : (model_name, sha1(text)) → 벡터 1벌 (회사/연도 간 동일 boilerplate 공유)
+    rag_text_embeddings   : chunk_id → vec_id / text_sha1 (FAISS id는 chunk별, 벡터는 캐시 참조)
+    rag_vector_tombstones : 삭제됐지만 FAISS 파일에는 아직 남아있는 vec_id (compaction 대기)
+    - 이전 DB(rag_text_embeddings.vector 보유)는 벡터를 캐시로 옮긴 뒤 컬럼 제거
+    """
+    con.execute("""
+      CREATE TABLE IF NOT EXISTS rag_embedding_cache (
+        model_name VARCHAR,
+        text_sha1 VARCHAR,
+        dim INTEGER,
+        vector FLOAT[],
+        created_at TIMESTAMP,
+        PRIMARY KEY (model_name, text_sha1)
+      )
+    """)
     con.execute("""
       CREATE TABLE IF NOT EXISTS rag_text_embeddings (
         chunk_id VARCHAR PRIMARY KEY,
         vec_id BIGINT,
         model_name VARCHAR,
         dim INTEGER,
-        created_at TIMESTAMP
+        created_at TIMESTAMP,
+        text_sha1 VARCHAR
       )
     """)
+    create_vector_tombstones_table(con)
+    cols = _get_existing_cols(con, "rag_text_embeddings")
+    if "text_sha1" not in cols:
+        con.execute("ALTER TABLE rag_text_embeddings ADD COLUMN text_sha1 VARCHAR")
+
+    if "vector" in cols:
+        text_col = _text_col(con)
+        con.execute(f"""
+          UPDATE rag_text_embeddings e
+          SET text_sha1 = sha1(coalesce(c.{text_col}, ''))
+          FROM rag_text_chunks c
+          WHERE c.chunk_id = e.chunk_id
+            AND e.text_sha1 IS NULL
+        """)
+        con.execute("""
+          INSERT OR IGNORE INTO rag_embedding_cache
+          SELECT model_name, text_sha1, ANY_VALUE(dim), ANY_VALUE(vector), MIN(created_at)
+          FROM rag_text_embeddings
+          WHERE vector IS NOT NULL AND text_sha1 IS NOT NULL
+          GROUP BY model_name, text_sha1
+        """)
+        con.execute("ALTER TABLE rag_text_embeddings DROP COLUMN vector")
+        print("♻️ rag_text_embeddings.vector → rag_embedding_cache 이전 완료")
+
+
+def _text_col(con: duckdb.DuckDBPyConnection) -> str:
+    return "text_for_embed" if "text_for_embed" in _get_existing_cols(con, "rag_text_chunks") else "text"
+
 
-    if rebuild:
-        # 새로 만들기
-        base = faiss.IndexFlatIP(dim)
-        index = faiss.IndexIDMap2(base)
+def stored_vector_dim(con: duckdb.DuckDBPyConnection, model_name: str) -> Optional[int]:
+    row = con.execute("""
+      SELECT MAX(dim)
+      FROM rag_embedding_cache
+      WHERE model_name = ?
+    """, [model_name]).fetchone()
+    return int(row[0]) if row and row[0] is not None else None
 
-        con.execute("DELETE FROM rag_text_embeddings WHERE model_name = ?", [model_name])
 
-        rows = con.execute(f"""
-          SELECT chunk_id, {text_col}
-          FROM rag_text_chunks
-          ORDER BY report_id, section_code, chunk_idx
-        """).fetchall()
+# 저장 벡터 출처: 텍스트 chunk / 주석 표 row (둘 다 rag_embedding_cache 벡터를 text_sha1로 참조)
+_VECTOR_SOURCES = {
+    "text": (
+        "rag_text_embeddings e JOIN rag_text_chunks c ON c.chunk_id = e.chunk_id",
+        "c.report_id, c.section_code, c.chunk_idx",
+    ),
+    "table_row": (
+        "rag_table_row_embeddings e JOIN rag_table_rows r ON r.table_id = e.table_id AND r.row_idx = e.row_idx",
+        "e.report_id, e.table_id, e.row_idx",
+    ),
+}
 
+
+def iter_stored_vectors(
+    con: duckdb.DuckDBPyConnection,
+    model_name: str,
+    chunk_ids: Optional[List[str]] = None,
+    batch_rows: int = 50_000,
+    source: str = "text",
+    vec_ids: Optional[List[int]] = None,
+):
+    """
+    저장된 벡터를 (vec_ids[int64], emb[float32, (n, dim)]) 배치로 반환.
+    - 원본(rag_text_chunks / rag_table_rows)에 남아있는 것만 (삭제된 report의 잔여 행 제외)
+    - 같은 text_sha1을 가진 chunk들은 캐시의 벡터 1벌을 각자의 vec_id로 받음
+    - chunk_ids(text) / vec_ids: 지정 시 해당 행만
+    """
+    from_sql, order_sql = _VECTOR_SOURCES[source]
+    chunk_filter = ""
+    params = [model_name]
+    if source == "text":
+        chunk_filter = "AND (CAST(? AS VARCHAR[]) IS NULL OR e.chunk_id IN (SELECT UNNEST(CAST(? AS VARCHAR[]))))"
+        params += [chunk_ids, chunk_ids]
+    vids = None if vec_ids is None else [int(v) for v in vec_ids]
+    params += [vids, vids]
+
+    cur = con.execute(f"""
+      SELECT e.vec_id, k.vector
+      FROM {from_sql}
+      JOIN rag_embedding_cache k
+        ON k.model_name = e.model_name
+       AND k.text_sha1 = e.text_sha1
+      WHERE e.model_name = ?
+        {chunk_filter}
+        AND (CAST(? AS BIGINT[]) IS NULL OR e.vec_id IN (SELECT UNNEST(CAST(? AS BIGINT[]))))
+      ORDER BY {order_sql}
+    """, params)
+    while True:
+        rows = cur.fetchmany(batch_rows)
         if not rows:
-            faiss.write_index(index, index_path)
-            print("✅ REBUILD: rag_text_chunks 비어있음 -> 빈 FAISS 저장")
-            return
+            break
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        emb = np.asarray([r[1] for r in rows], dtype=np.float32)
+        yield ids, emb
 
-        now_ts = con.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
-        print(f"🔁 REBUILD FAISS: {len(rows)} chunks (col={text_col})")
-
-        for i in range(0, len(rows), batch_size):
-            batch = rows[i:i + batch_size]
-            chunk_ids = [cid for (cid, _t) in batch]
-            texts = [t if t is not None else "" for (_cid, t) in batch]
-
-            emb = model.encode(
-                texts,
-                batch_size=min(len(texts), 64),
-                show_progress_bar=False,
-                convert_to_numpy=True
-            ).astype("float32")
-            emb = normalize_embeddings(emb)
-
-            vec_ids = np.array([chunk_id_to_int64(cid) for cid in chunk_ids], dtype=np.int64)
-            index.add_with_ids(emb, vec_ids)
-
-            for cid, vid in zip(chunk_ids, vec_ids.tolist()):
-                con.execute("""
-                    INSERT OR REPLACE INTO rag_text_embeddings
-                    (chunk_id, vec_id, model_name, dim, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (cid, int(vid), model_name, int(dim), now_ts))
-
-        faiss.write_index(index, index_path)
-        print(f"✅ FAISS rebuilt: {index_path} ntotal={index.ntotal}")
-        return
 
-    # --- update mode ---
-    index = load_or_create_faiss(index_path, dim)
+def add_stored_vectors(
+    con: duckdb.DuckDBPyConnection,
+    index: faiss.Index,
+    model_name: str,
+    chunk_ids: Optional[List[str]] = None,
+    source: str = "text",
+    vec_ids: Optional[List[int]] = None,
+) -> int:
+    """저장된 벡터를 index에 add (train이 필요한 index면 호출 전에 train). 반환: add한 개수"""
+    n = 0
+    for ids, emb in iter_stored_vectors(con, model_name, chunk_ids, source=source, vec_ids=vec_ids):
+        index.add_with_ids(emb, ids)
+        n += len(ids)
+    return n
 
+
+def stored_vec_ids(con: duckdb.DuckDBPyConnection, model_name: str, source: str = "text") -> np.ndarray:
+    from_sql, _ = _VECTOR_SOURCES[source]
+    rows = con.execute(f"SELECT e.vec_id FROM {from_sql} WHERE e.model_name = ?", [model_name]).fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64)
+
+
+def count_stored_vectors(con: duckdb.DuckDBPyConnection, model_name: str, source: str = "text") -> int:
+    from_sql, _ = _VECTOR_SOURCES[source]
+    return int(con.execute(f"""
+      SELECT COUNT(*)
+      FROM {from_sql}
+      WHERE e.model_name = ?
+    """, [model_name]).fetchone()[0])
+
+
+def sample_stored_vectors(
+    con: duckdb.DuckDBPyConnection,
+    model_name: str,
+    n: int,
+    seed: int = 42,
+    source: str = "text",
+) -> np.ndarray:
+    """
+    source index에 들어갈 벡터(텍스트 dedup)에서 n개 reservoir 샘플 → IVF/PQ train용
+    - 캐시 전체가 아니라 source 원본에 연결된 것만 (다른 source / 삭제된 report의 벡터 제외)
+    """
+    from_sql, _ = _VECTOR_SOURCES[source]
     rows = con.execute(f"""
-      SELECT chunk_id, {text_col}
+      SELECT vector
+      FROM (
+        SELECT k.vector
+        FROM (
+          SELECT DISTINCT e.text_sha1
+          FROM {from_sql}
+          WHERE e.model_name = ?
+        ) s
+        JOIN rag_embedding_cache k
+          ON k.model_name = ?
+         AND k.text_sha1 = s.text_sha1
+      ) t
+      USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})
+    """, [model_name, model_name]).fetchall()
+    return np.asarray([r[0] for r in rows], dtype=np.float32)
+
+
+def create_index_from_store(
+    con: duckdb.DuckDBPyConnection,
+    model_name: str,
+    dim: int,
+    index_kind: str = "auto",
+    mem_budget_mb: Optional[float] = None,
+    source: str = "text",
+) -> faiss.Index:
+    """저장된 벡터 전체로 새 index 생성 (종류 선택 → 샘플 train → add)"""
+    ntotal = count_stored_vectors(con, model_name, source)
+    kind = choose_index_kind(ntotal, dim, mem_budget_mb) if index_kind == "auto" else index_kind
+    train_x = None
+    if kind not in ("flat", "hnsw"):
+        train_x = sample_stored_vectors(con, model_name, min(TRAIN_MAX, max(ntotal, 1)), source=source)
+    index = create_index(kind, dim, ntotal, train_x)
+    n = add_stored_vectors(con, index, model_name, source=source)
+    print(f"🧱 FAISS index({source}): kind={kind} ntotal={n} (~{estimate_index_bytes(kind, n, dim) / 1e6:.1f}MB)")
+    return index
+
+
+def _pending_chunks(con: duckdb.DuckDBPyConnection, model_name: str, text_col: str) -> List[Tuple[str, str]]:
+    """아직 embeddings 행이 없는 chunk → (chunk_id, text_sha1). sha1은 utils.ids.sha1_hex와 동일"""
+    return con.execute(f"""
+      SELECT chunk_id, sha1(coalesce({text_col}, '')) AS text_sha1
       FROM rag_text_chunks
       WHERE chunk_id NOT IN (
         SELECT chunk_id
@@ -122,46 +395,810 @@ def build_or_update_faiss_from_db(
       ORDER BY report_id, section_code, chunk_idx
     """, [model_name]).fetchall()
 
+
+def _fill_cache(
+    con: duckdb.DuckDBPyConnection,
+    get_encoder,
+    model_name: str,
+    text_col: str,
+    dim: int,
+    batch_size: int,
+) -> Tuple[int, int]:
+    """
+    embeddings 행이 없는 chunk 중 캐시에 없는 텍스트만 (text_sha1 DISTINCT) 인코딩 → 캐시 저장
+    - 길이순으로 가져와 batch_size 블록 단위로 인코딩 (블록 안에서는 encoder가 토큰 길이로 다시 정렬)
+    반환: (대상 chunk 수, 실제 인코딩한 텍스트 수)
+    """
+    n_pending, = con.execute("""
+      SELECT COUNT(*)
+      FROM rag_text_chunks
+      WHERE chunk_id NOT IN (SELECT chunk_id FROM rag_text_embeddings WHERE model_name = ?)
+    """, [model_name]).fetchone()
+
+    rows = con.execute(f"""
+      WITH p AS (
+        SELECT sha1(coalesce({text_col}, '')) AS text_sha1, coalesce({text_col}, '') AS t
+        FROM rag_text_chunks
+        WHERE chunk_id NOT IN (SELECT chunk_id FROM rag_text_embeddings WHERE model_name = ?)
+      )
+      SELECT text_sha1, ANY_VALUE(t) AS txt
+      FROM p
+      WHERE text_sha1 NOT IN (SELECT text_sha1 FROM rag_embedding_cache WHERE model_name = ?)
+      GROUP BY text_sha1
+      ORDER BY length(txt), text_sha1
+    """, [model_name, model_name]).fetchall()
     if not rows:
-        faiss.write_index(index, index_path)
-        print("✅ UPDATE: new chunks 없음")
-        return
+        return int(n_pending), 0
+
+    _encode_missing(con, get_encoder, model_name, dim, rows, batch_size)
+    return int(n_pending), len(rows)
+
 
-    now_ts = con.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
-    print(f"🔎 new chunks: {len(rows)} (col={text_col})")
+def _encode_missing(
+    con: duckdb.DuckDBPyConnection,
+    get_encoder,
+    model_name: str,
+    dim: int,
+    rows: List[Tuple[str, str]],
+    batch_size: int,
+) -> None:
+    """[(text_sha1, text)] (길이순) → batch_size 블록 단위 인코딩 → rag_embedding_cache 일괄 insert"""
+    if not rows:
+        return
+    now_ts = con.execute("SELECT CAST(CURRENT_TIMESTAMP AS TIMESTAMP)").fetchone()[0]
+    encoder = get_encoder()
 
     for i in range(0, len(rows), batch_size):
         batch = rows[i:i + batch_size]
-        chunk_ids = [cid for (cid, _t) in batch]
-        texts = [t if t is not None else "" for (_cid, t) in batch]
+        hashes = [h for (h, _t) in batch]
+        texts = [t for (_h, t) in batch]
+
+        emb = encoder.encode(texts)
+
+        # encode 블록 단위로 한 번에 insert
+        df = pd.DataFrame({"text_sha1": hashes, "vector": list(emb)})
+        con.register("tmp_embed_cache", df)
+        try:
+            con.execute("""
+                INSERT OR REPLACE INTO rag_embedding_cache
+                (model_name, text_sha1, dim, vector, created_at)
+                SELECT ?, text_sha1, ?, CAST(vector AS FLOAT[]), ?
+                FROM tmp_embed_cache
+            """, [model_name, int(dim), now_ts])
+        finally:
+            con.unregister("tmp_embed_cache")
+
+
+def _link_pending(con: duckdb.DuckDBPyConnection, model_name: str, text_col: str, dim: int) -> List[str]:
+    """캐시에 벡터가 있는 미연결 chunk → rag_text_embeddings 행 생성. 반환: 연결한 chunk_id"""
+    pending = _pending_chunks(con, model_name, text_col)
+    if not pending:
+        return []
+    now_ts = con.execute("SELECT CAST(CURRENT_TIMESTAMP AS TIMESTAMP)").fetchone()[0]
+    df = pd.DataFrame(
+        [(cid, chunk_id_to_int64(cid), h) for (cid, h) in pending],
+        columns=["chunk_id", "vec_id", "text_sha1"],
+    )
+    con.register("tmp_embed_meta", df)
+    try:
+        con.execute("""
+            INSERT OR REPLACE INTO rag_text_embeddings
+            (chunk_id, vec_id, model_name, dim, created_at, text_sha1)
+            SELECT chunk_id, CAST(vec_id AS BIGINT), ?, ?, ?, text_sha1
+            FROM tmp_embed_meta
+        """, [model_name, int(dim), now_ts])
+    finally:
+        con.unregister("tmp_embed_meta")
+    return df["chunk_id"].tolist()
+
+
+def write_index_atomic(index: faiss.Index, index_path: str) -> None:
+    """임시 파일에 쓴 뒤 os.replace (쓰기 도중 죽어도 기존 index 파일은 온전)"""
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def build_or_update_faiss_from_db(
+    con: duckdb.DuckDBPyConnection,
+    index_path: str,
+    model_name: str,
+    batch_size: int = 1024,
+    rebuild: bool = False,
+    index_kind: str = "auto",
+    mem_budget_mb: Optional[float] = None,
+    compact_ratio: float = 0.1,
+    encoder_backend: Optional[str] = None,
+    encoder: Optional[Encoder] = None,
+) -> None:
+    """
+    batch_size: 인코딩/캐시 저장 블록 크기 (블록 안에서 토큰 길이 정렬 → padding 최소화)
+    encoder_backend: st | st_pool | onnx_int8 | service (None이면 EMBED_SERVICE_URL 있을 때 service, 아니면 st)
+      encoder를 직접 넘기면 그것을 사용 (close는 호출자)
+    compact_ratio: tombstone 수가 index ntotal의 이 비율을 넘으면 update 끝에 한 번에 remove (compaction)
+    index_kind: "auto" | flat | ivf_flat | ivf_pq | hnsw
+      - 새 index를 만들 때(rebuild / index 파일 없음)만 적용, 기존 파일 update는 그 종류 그대로
+      - auto: ntotal + mem_budget_mb로 choose_index_kind
+    """
+    encoder_backend = encoder_backend or default_backend()
+    if encoder is None and encoder_backend not in ENCODER_BACKENDS:
+        raise ValueError(f"unknown encoder backend: {encoder_backend} (choices: {', '.join(ENCODER_BACKENDS)})")
+    if index_kind != "auto" and index_kind not in INDEX_KINDS:
+        raise ValueError(f"unknown index kind: {index_kind} (choices: auto, {', '.join(INDEX_KINDS)})")
+
+    ensure_embeddings_table(con)
+
+    # text 컬럼 선택
+    text_col = _text_col(con)
+
+    get_encoder, close_encoder = _lazy_encoder(model_name, encoder_backend, encoder)
+    try:
+        _build_or_update(
+            con, index_path, model_name, get_encoder, text_col, batch_size,
+            rebuild, index_kind, mem_budget_mb, compact_ratio,
+        )
+    finally:
+        close_encoder()
+
+
+def _lazy_encoder(model_name: str, encoder_backend: str, encoder: Optional[Encoder]):
+    """
+    모델 로드는 인코딩할 텍스트가 있을 때만 (캐시만으로 끝나면 로드하지 않음)
+    반환: (get_encoder, close) — close는 여기서 만든 encoder만 정리 (multi-process pool 종료)
+    """
+    _enc: List[Encoder] = [encoder] if encoder is not None else []
+
+    def get_encoder() -> Encoder:
+        if not _enc:
+            _enc.append(make_encoder(model_name, encoder_backend))
+        return _enc[0]
+
+    def close() -> None:
+        if encoder is None and _enc:
+            _enc[0].close()
+
+    return get_encoder, close
+
+
+def _build_or_update(
+    con: duckdb.DuckDBPyConnection,
+    index_path: str,
+    model_name: str,
+    get_encoder,
+    text_col: str,
+    batch_size: int,
+    rebuild: bool,
+    index_kind: str,
+    mem_budget_mb: Optional[float],
+    compact_ratio: float,
+) -> None:
+    dim = stored_vector_dim(con, model_name)
+    if dim is None:
+        dim = get_encoder().dim
+
+    # DB 쓰기(캐시/메타)와 FAISS 파일 교체를 한 단위로:
+    # - 실패 시 ROLLBACK + 임시 파일 삭제 → 둘 다 이전 상태 유지
+    # - index 교체 후 COMMIT: 그 사이 죽으면 index만 앞서 있고, 다음 update가 미연결 chunk를 다시 add(remove 후)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if rebuild:
+            # 새로 만들기: 캐시에 있는 벡터는 그대로 add, 캐시에 없는 텍스트만 인코딩
+            con.execute("DELETE FROM rag_embedding_cache WHERE model_name = ? AND dim <> ?", [model_name, int(dim)])
+            con.execute("DELETE FROM rag_text_embeddings WHERE model_name = ?", [model_name])
+            con.execute("DELETE FROM rag_vector_tombstones WHERE model_name = ?", [model_name])
+
+            n_pending, n_encoded = _fill_cache(con, get_encoder, model_name, text_col, dim, batch_size)
+            _link_pending(con, model_name, text_col, dim)
+
+            print(f"🔁 REBUILD FAISS: chunks={n_pending}, encoded={n_encoded} (cache hit={n_pending - n_encoded}, col={text_col})")
+            index = create_index_from_store(con, model_name, dim, index_kind, mem_budget_mb)
+            write_index_atomic(index, index_path)
+            con.execute("COMMIT")
+            print(f"✅ FAISS rebuilt: {index_path} ntotal={index.ntotal}")
+            return
+
+        # --- update mode ---
+        n_pending, n_encoded = _fill_cache(con, get_encoder, model_name, text_col, dim, batch_size)
+        if n_pending:
+            print(f"🔎 new chunks: {n_pending}, encoded={n_encoded} (cache hit={n_pending - n_encoded}, col={text_col})")
+        new_ids = _link_pending(con, model_name, text_col, dim)
+
+        if not os.path.exists(index_path):
+            # index 파일이 없으면 저장된 벡터 전체(새 chunk 포함)로 복원
+            index = create_index_from_store(con, model_name, dim, index_kind, mem_budget_mb)
+            con.execute("DELETE FROM rag_vector_tombstones WHERE model_name = ?", [model_name])
+            print(f"♻️ FAISS restored from stored vectors: {index.ntotal}")
+        else:
+            index = load_or_create_faiss(index_path, dim)
+            if not new_ids and not _needs_compaction(con, index, model_name, compact_ratio):
+                con.execute("COMMIT")
+                print("✅ UPDATE: new chunks 없음")
+                return
+            index, rebuilt = _drop_stale_ids(con, index, model_name, dim, new_ids, index_kind, mem_budget_mb)
+            if not rebuilt:
+                add_stored_vectors(con, index, model_name, chunk_ids=new_ids)
+
+        index = maybe_compact(con, index, model_name, dim, compact_ratio, index_kind, mem_budget_mb)
+
+        write_index_atomic(index, index_path)
+        con.execute("COMMIT")
+        print(f"✅ FAISS updated: {index_path} ntotal={index.ntotal}")
+
+    except BaseException:
+        try:
+            con.execute("ROLLBACK")
+        except Exception:
+            pass
+        if os.path.exists(f"{index_path}.tmp"):
+            os.remove(f"{index_path}.tmp")
+        raise
 
-        emb = model.encode(
-            texts,
-            batch_size=min(len(texts), 64),
-            show_progress_bar=False,
-            convert_to_numpy=True
-        ).astype("float32")
-        emb = normalize_embeddings(emb)
 
-        vec_ids = np.array([chunk_id_to_int64(cid) for cid in chunk_ids], dtype=np.int64)
+# ============================================================
+# 삭제 / compaction / 정합성
+# - delete_vectors: DB 메타만 지우고 vec_id는 tombstone으로 (FAISS 파일은 건드리지 않음)
+#   → report 범위 검색은 rag_text_embeddings 기준이라 tombstone은 바로 검색에서 빠짐
+# - compaction: tombstone이 쌓이면 remove_ids 한 번 (O(ntotal) 1회), HNSW처럼 remove 불가면 저장 벡터로 재구성
+# - vec_id는 64bit hash라 bitmap 대신 DuckDB 테이블(집합)로 관리
+# ============================================================
+def create_vector_tombstones_table(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("""
+      CREATE TABLE IF NOT EXISTS rag_vector_tombstones (
+        model_name VARCHAR,
+        vec_id BIGINT,
+        deleted_at TIMESTAMP,
+        PRIMARY KEY (model_name, vec_id)
+      )
+    """)
+
+
+def delete_vectors(con: duckdb.DuckDBPyConnection, report_id: str, model_name: Optional[str] = None) -> int:
+    """report_id의 chunk 임베딩 메타 삭제 + vec_id tombstone 기록. 반환: tombstone 수 (캐시 벡터는 공유라 유지)"""
+    create_vector_tombstones_table(con)
+    model_sql = "" if model_name is None else "AND e.model_name = ?"
+    params = [report_id] + ([] if model_name is None else [model_name])
+
+    n = con.execute(f"""
+      INSERT OR IGNORE INTO rag_vector_tombstones
+      SELECT e.model_name, e.vec_id, CAST(CURRENT_TIMESTAMP AS TIMESTAMP)
+      FROM rag_text_embeddings e
+      JOIN rag_text_chunks c ON c.chunk_id = e.chunk_id
+      WHERE c.report_id = ? {model_sql}
+    """, params).fetchone()[0]
+    con.execute(f"""
+      DELETE FROM rag_text_embeddings e
+      WHERE e.chunk_id IN (SELECT chunk_id FROM rag_text_chunks WHERE report_id = ?)
+        {model_sql}
+    """, params)
+    return int(n)
+
+
+def _index_ids(index: faiss.Index) -> np.ndarray:
+    """index에 들어있는 vec_id 전체 (IDMap2: id_map, IVF: inverted list의 id)"""
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        raise ValueError(f"vec_id를 읽을 수 없는 index: {type(index).__name__}")
+    invlists = ivf.invlists
+    out = []
+    for list_no in range(ivf.nlist):
+        n = invlists.list_size(list_no)
+        if n:
+            out.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), n).copy())
+    return np.concatenate(out).astype(np.int64) if out else np.zeros(0, dtype=np.int64)
+
+
+def _is_idmap_ivf(index: faiss.Index) -> bool:
+    """예전 형식(IDMap2,IVF…) 파일: remove_ids가 id를 어긋나게 하므로 remove 대신 재구성"""
+    return hasattr(index, "id_map") and faiss.try_extract_index_ivf(index.index) is not None
+
+
+def _tombstone_ids(con: duckdb.DuckDBPyConnection, model_name: str) -> np.ndarray:
+    rows = con.execute("SELECT vec_id FROM rag_vector_tombstones WHERE model_name = ?", [model_name]).fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64)
+
+
+def _remove_or_rebuild(
+    con: duckdb.DuckDBPyConnection,
+    index: faiss.Index,
+    ids: np.ndarray,
+    model_name: str,
+    dim: int,
+    index_kind: str,
+    mem_budget_mb: Optional[float],
+    source: str = "text",
+) -> Tuple[faiss.Index, bool]:
+    """
+    ids를 한 번에 remove. remove 미지원 index(HNSW) / 예전 IDMap2,IVF 파일은 저장 벡터(현재 DB 기준)로 재구성
+    - 재구성은 기존 index 종류 그대로 (알 수 없는 종류일 때만 index_kind)
+    반환: (index, 재구성 여부) — 재구성이면 DB에 연결된 벡터가 이미 전부 들어있음
+    """
+    if len(ids) == 0:
+        return index, False
+    if not _is_idmap_ivf(index):
+        try:
+            index.remove_ids(np.ascontiguousarray(ids, dtype=np.int64))
+            return index, False
+        except RuntimeError:
+            pass
+    kind = index_kind_of(index) or index_kind
+    print(f"⚠️ remove_ids 불가 index → 저장 벡터로 재구성 (kind={kind})")
+    return create_index_from_store(con, model_name, dim, kind, mem_budget_mb, source), True
+
+
+def _drop_stale_ids(
+    con: duckdb.DuckDBPyConnection,
+    index: faiss.Index,
+    model_name: str,
+    dim: int,
+    new_chunk_ids: List[str],
+    index_kind: str,
+    mem_budget_mb: Optional[float],
+) -> Tuple[faiss.Index, bool]:
+    """
+    새로 연결된 chunk의 vec_id가 index에 이미 있으면(재-ingest된 report의 tombstone, 중단된 실행 잔여) 먼저 제거
+    - 배치마다 remove_ids 하던 것을 교집합만 1회로
+    """
+    if not new_chunk_ids:
+        return index, False
+    new_vec, _ = _vec_ids_for_chunks(con, model_name, new_chunk_ids)
+    stale = np.intersect1d(new_vec, _index_ids(index))
+    if len(stale) == 0:
+        return index, False
+    index, rebuilt = _remove_or_rebuild(con, index, stale, model_name, dim, index_kind, mem_budget_mb)
+    con.execute("""
+      DELETE FROM rag_vector_tombstones
+      WHERE model_name = ? AND vec_id IN (SELECT UNNEST(CAST(? AS BIGINT[])))
+    """, [model_name, stale.tolist()])
+    return index, rebuilt
+
+
+def _vec_ids_for_chunks(con: duckdb.DuckDBPyConnection, model_name: str, chunk_ids: List[str]) -> Tuple[np.ndarray, List[str]]:
+    rows = con.execute("""
+      SELECT vec_id, chunk_id
+      FROM rag_text_embeddings
+      WHERE model_name = ?
+        AND chunk_id IN (SELECT UNNEST(CAST(? AS VARCHAR[])))
+    """, [model_name, list(chunk_ids)]).fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64), [r[1] for r in rows]
+
+
+def _needs_compaction(con: duckdb.DuckDBPyConnection, index: faiss.Index, model_name: str, compact_ratio: float) -> bool:
+    n_tomb = con.execute("SELECT COUNT(*) FROM rag_vector_tombstones WHERE model_name = ?", [model_name]).fetchone()[0]
+    return n_tomb > 0 and n_tomb >= compact_ratio * max(index.ntotal, 1)
 
-        # 같은 id가 이미 있으면 제거 후 add (안정)
+
+def maybe_compact(
+    con: duckdb.DuckDBPyConnection,
+    index: faiss.Index,
+    model_name: str,
+    dim: int,
+    compact_ratio: float = 0.1,
+    index_kind: str = "auto",
+    mem_budget_mb: Optional[float] = None,
+    force: bool = False,
+) -> faiss.Index:
+    """tombstone이 compact_ratio 이상 쌓였으면(force면 항상) 한 번에 제거하고 tombstone 비움"""
+    if not force and not _needs_compaction(con, index, model_name, compact_ratio):
+        return index
+    tomb = _tombstone_ids(con, model_name)
+    before = index.ntotal
+    index, _ = _remove_or_rebuild(con, index, tomb, model_name, dim, index_kind, mem_budget_mb)
+    con.execute("DELETE FROM rag_vector_tombstones WHERE model_name = ?", [model_name])
+    print(f"🧹 FAISS compaction: tombstones={len(tomb)} ntotal {before} → {index.ntotal}")
+    return index
+
+
+def check_faiss_consistency(
+    con: duckdb.DuckDBPyConnection,
+    index_path: str,
+    model_name: str,
+    fix: bool = False,
+) -> dict:
+    """
+    FAISS id ↔ rag_text_embeddings 대조
+    - missing_in_index : DB에 있는데 index에 없음
+    - orphan_in_index  : index에 있는데 DB에도 tombstone에도 없음 (delete 후 기록 누락 / 중단된 실행)
+    - tombstoned       : tombstone인데 index에 남아있음 (정상, compaction 대기)
+    - duplicate_ids    : 같은 vec_id가 index에 2번 이상
+    fix=True: orphan/tombstone/중복 제거 + missing add → 원자적 저장
+    """
+    ensure_embeddings_table(con)
+    index = faiss.read_index(index_path)
+    ids = _index_ids(index)
+    uniq, counts = np.unique(ids, return_counts=True)
+
+    db_ids = np.array([r[0] for r in con.execute("""
+      SELECT e.vec_id
+      FROM rag_text_embeddings e
+      JOIN rag_text_chunks c ON c.chunk_id = e.chunk_id
+      WHERE e.model_name = ?
+    """, [model_name]).fetchall()], dtype=np.int64)
+    tomb = _tombstone_ids(con, model_name)
+
+    missing = np.setdiff1d(db_ids, uniq)
+    extra = np.setdiff1d(uniq, db_ids)
+    tombstoned = np.intersect1d(extra, tomb)
+    orphan = np.setdiff1d(extra, tomb)
+    dup = uniq[counts > 1]
+
+    out = {
+        "index_ntotal": int(index.ntotal),
+        "db_rows": int(len(db_ids)),
+        "missing_in_index": int(len(missing)),
+        "orphan_in_index": int(len(orphan)),
+        "tombstoned": int(len(tombstoned)),
+        "duplicate_ids": int(len(dup)),
+        "fixed": False,
+    }
+    if not fix or not (len(missing) or len(orphan) or len(tombstoned) or len(dup)):
+        return out
+
+    dim = index.d
+    con.execute("BEGIN TRANSACTION")
+    try:
+        drop = np.union1d(np.union1d(orphan, tombstoned), dup)
+        index, _ = _remove_or_rebuild(con, index, drop, model_name, dim, "auto", None)
+        con.execute("DELETE FROM rag_vector_tombstones WHERE model_name = ?", [model_name])
+
+        # 중복 제거로 빠진 id + 원래 없던 id를 저장 벡터로 다시 add
+        readd = np.setdiff1d(db_ids, _index_ids(index))
+        if len(readd):
+            chunk_ids = [r[0] for r in con.execute("""
+              SELECT chunk_id FROM rag_text_embeddings
+              WHERE model_name = ? AND vec_id IN (SELECT UNNEST(CAST(? AS BIGINT[])))
+            """, [model_name, readd.tolist()]).fetchall()]
+            add_stored_vectors(con, index, model_name, chunk_ids=chunk_ids)
+
+        write_index_atomic(index, index_path)
+        con.execute("COMMIT")
+    except BaseException:
         try:
-            index.remove_ids(vec_ids)
+            con.execute("ROLLBACK")
         except Exception:
             pass
+        raise
+    out["fixed"] = True
+    out["index_ntotal"] = int(index.ntotal)
+    print(f"🔧 FAISS consistency fixed: {out}")
+    return out
+
+
+# ============================================================
+# report 범위 검색
+# - RAG 질의는 항상 report_id 범위 → 전체 top-k 후 post-filter 하지 않음
+# - 범위 내 벡터가 exact_max 이하: 저장 벡터(캐시)로 정확 top-k (numpy 내적, corpus 크기와 무관)
+# - 그보다 크면: FAISS search + IDSelectorBatch(범위 vec_id) → 범위 안에서만 top-k
+# ============================================================
+def report_vec_ids(
+    con: duckdb.DuckDBPyConnection,
+    report_ids: List[str],
+    model_name: str,
+) -> Tuple[np.ndarray, List[str]]:
+    rows = con.execute("""
+      SELECT e.vec_id, e.chunk_id
+      FROM rag_text_embeddings e
+      JOIN rag_text_chunks c ON c.chunk_id = e.chunk_id
+      WHERE e.model_name = ?
+        AND c.report_id IN (SELECT UNNEST(CAST(? AS VARCHAR[])))
+    """, [model_name, list(report_ids)]).fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64), [r[1] for r in rows]
+
+
+def _search_params(index: faiss.Index, sel, nprobe: Optional[int], ef_search: Optional[int]):
+    # SearchParameters*의 기본값(nprobe=1, efSearch=16)이 index 설정을 덮어쓰므로 지정 안 하면 index 값을 그대로
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel)
+        if nprobe is None:
+            # nprobe 기본값 저장 전에 만든 index(nprobe=1)는 기본값으로
+            nprobe = ivf.nprobe if ivf.nprobe > 1 else default_nprobe(ivf.nlist)
+        params.nprobe = int(nprobe)
+        return params
+    inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=sel)
+        params.efSearch = int(ef_search if ef_search is not None else inner.hnsw.efSearch)
+        return params
+    return faiss.SearchParameters(sel=sel)
+
+
+def search_reports(
+    con: duckdb.DuckDBPyConnection,
+    query_emb: np.ndarray,
+    report_ids: List[str],
+    model_name: str,
+    k: int = 8,
+    index: Optional[faiss.Index] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    exact_max: int = 20_000,
+) -> List[Tuple[str, float]]:
+    """
+    질의 벡터 1개(정규화된 float32) → report_ids 범위 내 top-k [(chunk_id, score)]
+    - index가 None이면 항상 정확 검색 (저장 벡터)
+    """
+    vec_ids, chunk_ids = report_vec_ids(con, report_ids, model_name)
+    return _search_scope(con, query_emb, vec_ids, chunk_ids, model_name, k, index,
+                         nprobe, ef_search, exact_max, source="text")
+
+
+def _search_scope(
+    con: duckdb.DuckDBPyConnection,
+    query_emb: np.ndarray,
+    vec_ids: np.ndarray,
+    keys: list,
+    model_name: str,
+    k: int,
+    index: Optional[faiss.Index],
+    nprobe: Optional[int],
+    ef_search: Optional[int],
+    exact_max: int,
+    source: str,
+) -> list:
+    """범위(vec_ids ↔ keys) 안에서 top-k [(key, score)]"""
+    if len(vec_ids) == 0:
+        return []
+    q = np.asarray(query_emb, dtype=np.float32).reshape(1, -1)
+    k = min(int(k), len(vec_ids))
+    id2key = dict(zip(vec_ids.tolist(), keys))
+
+    if index is None or len(vec_ids) <= exact_max:
+        ids, scores = [], []
+        for v_ids, emb in iter_stored_vectors(con, model_name, source=source, vec_ids=vec_ids.tolist()):
+            ids.append(v_ids)
+            scores.append(emb @ q[0])
+        if not ids:
+            return []
+        ids = np.concatenate(ids)
+        scores = np.concatenate(scores)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(id2key[int(ids[i])], float(scores[i])) for i in top]
+
+    sel = faiss.IDSelectorBatch(vec_ids)
+    D, I = index.search(q, k, params=_search_params(index, sel, nprobe, ef_search))
+    return [(id2key[int(i)], float(d)) for d, i in zip(D[0], I[0]) if i != -1 and int(i) in id2key]
+
+
+# ============================================================
+# 주석 표 row 임베딩 (텍스트 chunk와 별도 index)
+# - row 직렬화: "행 경로 | 헤더: 값 ; 헤더: 값" (retrieve.notes_table_row_texts)
+# - 메타: rag_table_row_embeddings (table_id, row_idx) → vec_id / text_sha1, 벡터는 rag_embedding_cache 공유
+# - report 삭제 시 메타는 delete_report에서 삭제, index의 잔여 id는 다음 update에서 한 번에 remove
+# ============================================================
+def ensure_table_row_embeddings_table(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("""
+      CREATE TABLE IF NOT EXISTS rag_table_row_embeddings (
+        table_id VARCHAR,
+        row_idx INTEGER,
+        report_id VARCHAR,
+        vec_id BIGINT,
+        model_name VARCHAR,
+        dim INTEGER,
+        text_sha1 VARCHAR,
+        row_text VARCHAR,
+        created_at TIMESTAMP,
+        PRIMARY KEY (model_name, table_id, row_idx)
+      )
+    """)
+
 
-        index.add_with_ids(emb, vec_ids)
+def table_row_vec_id(table_id: str, row_idx: int) -> int:
+    return chunk_id_to_int64(stable_id(table_id, str(int(row_idx))))
 
-        for cid, vid in zip(chunk_ids, vec_ids.tolist()):
+
+def _link_table_rows(
+    con: duckdb.DuckDBPyConnection,
+    model_name: str,
+    dim: int,
+    tables_per_batch: int = 500,
+) -> List[int]:
+    """아직 row 임베딩 메타가 없는 주석 표 → row 직렬화 + 메타 insert. 반환: 새 vec_id"""
+    from src.retrieve import notes_table_row_texts
+
+    tables = con.execute("""
+      SELECT rt.table_id, rs.report_id
+      FROM rag_tables rt
+      JOIN report_sections rs ON rs.section_id = rt.section_id
+      WHERE rs.section_type = 'notes'
+        AND rt.table_id NOT IN (
+          SELECT table_id FROM rag_table_row_embeddings WHERE model_name = ?
+        )
+      ORDER BY rs.report_id, rt.table_id
+    """, [model_name]).fetchall()
+    if not tables:
+        return []
+
+    now_ts = con.execute("SELECT CAST(CURRENT_TIMESTAMP AS TIMESTAMP)").fetchone()[0]
+    report_of = dict(tables)
+    new_ids: List[int] = []
+    for i in range(0, len(tables), tables_per_batch):
+        tids = [t for t, _r in tables[i:i + tables_per_batch]]
+        rows = notes_table_row_texts(con, tids)
+        if not rows:
+            continue
+        df = pd.DataFrame(
+            [(tid, ridx, report_of[tid], table_row_vec_id(tid, ridx), sha1_hex(txt), txt)
+             for (tid, ridx, txt) in rows],
+            columns=["table_id", "row_idx", "report_id", "vec_id", "text_sha1", "row_text"],
+        )
+        con.register("tmp_row_meta", df)
+        try:
             con.execute("""
-                INSERT OR REPLACE INTO rag_text_embeddings
-                (chunk_id, vec_id, model_name, dim, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (cid, int(vid), model_name, int(dim), now_ts))
+                INSERT OR REPLACE INTO rag_table_row_embeddings
+                (table_id, row_idx, report_id, vec_id, model_name, dim, text_sha1, row_text, created_at)
+                SELECT table_id, CAST(row_idx AS INTEGER), report_id, CAST(vec_id AS BIGINT), ?, ?, text_sha1, row_text, ?
+                FROM tmp_row_meta
+            """, [model_name, int(dim), now_ts])
+        finally:
+            con.unregister("tmp_row_meta")
+        new_ids.extend(df["vec_id"].astype("int64").tolist())
+    return new_ids
+
+
+def build_or_update_table_row_faiss(
+    con: duckdb.DuckDBPyConnection,
+    index_path: str,
+    model_name: str,
+    batch_size: int = 1024,
+    rebuild: bool = False,
+    index_kind: str = "auto",
+    mem_budget_mb: Optional[float] = None,
+    encoder_backend: Optional[str] = None,
+    encoder: Optional[Encoder] = None,
+) -> None:
+    """주석 표 row 임베딩 → 별도 FAISS index (텍스트 chunk index와 같은 캐시/원자적 저장 규칙)"""
+    encoder_backend = encoder_backend or default_backend()
+    ensure_embeddings_table(con)
+    ensure_table_row_embeddings_table(con)
+    get_encoder, close_encoder = _lazy_encoder(model_name, encoder_backend, encoder)
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        dim = stored_vector_dim(con, model_name) or get_encoder().dim
+        if rebuild:
+            con.execute("DELETE FROM rag_table_row_embeddings WHERE model_name = ?", [model_name])
+
+        new_ids = _link_table_rows(con, model_name, dim)
+
+        rows = con.execute("""
+          SELECT text_sha1, ANY_VALUE(row_text) AS txt
+          FROM rag_table_row_embeddings
+          WHERE model_name = ?
+            AND text_sha1 NOT IN (SELECT text_sha1 FROM rag_embedding_cache WHERE model_name = ?)
+          GROUP BY text_sha1
+          ORDER BY length(txt), text_sha1
+        """, [model_name, model_name]).fetchall()
+        print(f"🔎 table rows: new={len(new_ids)}, encode={len(rows)} (cache hit={len(new_ids) - len(rows)})")
+        _encode_missing(con, get_encoder, model_name, dim, rows, batch_size)
+
+        if rebuild or not os.path.exists(index_path):
+            index = create_index_from_store(con, model_name, dim, index_kind, mem_budget_mb, source="table_row")
+        else:
+            index = load_or_create_faiss(index_path, dim)
+            in_index = _index_ids(index)
+            # 삭제된 report의 row + 다시 들어온 row의 이전 벡터를 한 번에 제거
+            stale = np.union1d(
+                np.setdiff1d(in_index, stored_vec_ids(con, model_name, "table_row")),
+                np.intersect1d(in_index, np.array(new_ids, dtype=np.int64)),
+            )
+            index, rebuilt = _remove_or_rebuild(con, index, stale, model_name, dim,
+                                                index_kind, mem_budget_mb, source="table_row")
+            if not rebuilt and new_ids:
+                add_stored_vectors(con, index, model_name, source="table_row", vec_ids=new_ids)
+            if len(stale):
+                print(f"🧹 table row index: removed {len(stale)} stale ids")
+
+        write_index_atomic(index, index_path)
+        con.execute("COMMIT")
+        print(f"✅ table row FAISS: {index_path} ntotal={index.ntotal}")
+
+    except BaseException:
+        try:
+            con.execute("ROLLBACK")
+        except Exception:
+            pass
+        if os.path.exists(f"{index_path}.tmp"):
+            os.remove(f"{index_path}.tmp")
+        raise
+    finally:
+        close_encoder()
+
+
+def search_table_row_vectors(
+    con: duckdb.DuckDBPyConnection,
+    query_emb: np.ndarray,
+    report_ids: List[str],
+    model_name: str,
+    k: int = 8,
+    index: Optional[faiss.Index] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    exact_max: int = 20_000,
+) -> List[Tuple[Tuple[str, int], float]]:
+    """질의 벡터 → report_ids 범위 내 표 row top-k [((table_id, row_idx), score)]"""
+    rows = con.execute("""
+      SELECT e.vec_id, e.table_id, e.row_idx
+      FROM rag_table_row_embeddings e
+      JOIN rag_table_rows r ON r.table_id = e.table_id AND r.row_idx = e.row_idx
+      WHERE e.model_name = ?
+        AND e.report_id IN (SELECT UNNEST(CAST(? AS VARCHAR[])))
+    """, [model_name, list(report_ids)]).fetchall()
+    vec_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    keys = [(r[1], int(r[2])) for r in rows]
+    return _search_scope(con, query_emb, vec_ids, keys, model_name, k, index,
+                         nprobe, ef_search, exact_max, source="table_row")
+
+
+# ============================================================
+# serving
+# - section worker마다 read_index로 전체를 RAM에 올리지 않도록 IO_FLAG_MMAP_IFC로 열기
+#   → 같은 파일을 여는 프로세스끼리 OS page cache 공유 (읽기 전용)
+# - IO_FLAG_MMAP은 IVF inverted list만 mmap → flat/sq8/hnsw는 codes가 프로세스마다 RAM에 복사됨
+#   IO_FLAG_MMAP_IFC는 flat codes(flat/sq8/hnsw storage)와 IVF inverted list 모두 mmap
+#   (IDMap2 id_map, HNSW 그래프 등 나머지는 작음)
+# - export_serving_index: 저장 벡터로 압축 index(sq8 1/4, ivf_pq ~1/32) 별도 파일 생성
+#   → 메모리 ↔ recall 트레이드오프는 scripts/bench_ann.py로 측정
+# ============================================================
+_SERVING_INDEXES: dict = {}
+# IO_FLAG_MMAP_IFC 없는 예전 faiss 빌드면 IO_FLAG_MMAP (IVF만 공유)
+_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def load_index_for_serving(index_path: str, mmap: bool = True) -> faiss.Index:
+    """
+    읽기 전용 검색용 index (프로세스 내 캐시, 파일 mtime이 바뀌면 다시 로드)
+    - mmap 미지원 index 종류/빌드면 일반 read_index로 대체
+    """
+    key = (os.path.abspath(index_path), bool(mmap))
+    mtime = os.path.getmtime(index_path)
+    hit = _SERVING_INDEXES.get(key)
+    if hit is not None and hit[0] == mtime:
+        return hit[1]
+
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, _MMAP_FLAG | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"⚠️ mmap 로드 불가 → 일반 로드 ({e})")
+    if index is None:
+        index = faiss.read_index(index_path)
+
+    _SERVING_INDEXES[key] = (mtime, index)
+    return index
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """직렬화 크기 (= 디스크/메모리 사용량 근사)"""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def export_serving_index(
+    con: duckdb.DuckDBPyConnection,
+    model_name: str,
+    out_path: str,
+    index_kind: str = "sq8",
+) -> dict:
+    """저장 벡터 → 압축 serving index 파일 (원본 index는 그대로, 재인코딩 없음)"""
+    if index_kind not in INDEX_KINDS:
+        raise ValueError(f"unknown index kind: {index_kind} (choices: {', '.join(INDEX_KINDS)})")
+    ensure_embeddings_table(con)
+    dim = stored_vector_dim(con, model_name)
+    if dim is None:
+        raise ValueError(f"저장된 벡터 없음 (model={model_name})")
 
-    faiss.write_index(index, index_path)
-    print(f"✅ FAISS updated: {index_path} ntotal={index.ntotal}")
+    index = create_index_from_store(con, model_name, dim, index_kind)
+    write_index_atomic(index, out_path)
+    out = {
+        "kind": index_kind,
+        "ntotal": int(index.ntotal),
+        "bytes": index_nbytes(index),
+        "flat_bytes": estimate_index_bytes("flat", int(index.ntotal), dim),
+    }
+    print(f"📦 serving index: {out_path} {out}")
+    return out
 
 
 # ============================================================
@@ -172,8 +1209,11 @@ def embed_build_or_update(
     db_path: str,
     index_path: str,
     model_name: str,
-    batch_size: int = 128,
+    batch_size: int = 1024,
     rebuild: bool = False,
+    index_kind: str = "auto",
+    mem_budget_mb: Optional[float] = None,
+    encoder_backend: Optional[str] = None,
 ) -> None:
     con = duckdb.connect(db_path)
     try:
@@ -183,6 +1223,9 @@ def embed_build_or_update(
             model_name=model_name,
             batch_size=batch_size,
             rebuild=rebuild,
+            index_kind=index_kind,
+            mem_budget_mb=mem_budget_mb,
+            encoder_backend=encoder_backend,
         )
     finally:
         con.close()
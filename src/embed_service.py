@@ -0,0 +1,176 @@
+# src/embed_service.py
+# 로컬 임베딩 서비스: 모델을 한 번만 로드해 두고 여러 프로세스(embed / section build / streamlit)가 HTTP로 인코딩
+# - POST /encode {"model": ..., "texts": [...]} → {"n", "dim", "vectors_b64"} (정규화 float32, little-endian)
+# - GET  /health → {"model", "backend", "dim"}
+# - 동시 요청은 window_ms 동안 모아서 encoder.encode 1회 (max_batch 텍스트까지)
+# - 실행: python -m src.embed_service --model jhgan/ko-sroberta-multitask --port 8765
+#   클라이언트: EMBED_SERVICE_URL=http://127.0.0.1:8765 → encoders.default_backend()가 "service"
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import numpy as np
+
+from .encoders import ENCODER_BACKENDS, Encoder, make_encoder
+
+
+class _Request:
+    __slots__ = ("texts", "done", "out", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.out: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    요청 큐 → 단일 worker 스레드가 window_ms 동안 모은 요청을 한 번에 인코딩 → 요청별로 잘라서 반환
+    (모델은 스레드 1개만 사용: torch/onnx 내부 병렬화에 맡김)
+    """
+
+    def __init__(self, encoder: Encoder, window_ms: float = 10.0, max_batch: int = 512):
+        self.encoder = encoder
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.q: "queue.Queue[_Request]" = queue.Queue()
+        self.n_batches = 0
+        self.n_texts = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts: List[str]) -> np.ndarray:
+        req = _Request(texts)
+        self.q.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.out
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self.q.get()]
+            n = len(batch[0].texts)
+            deadline = time.monotonic() + self.window
+            while n < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    r = self.q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(r)
+                n += len(r.texts)
+
+            texts = [t for r in batch for t in r.texts]
+            try:
+                emb = self.encoder.encode(texts)
+            except BaseException as e:
+                for r in batch:
+                    r.error = e
+                    r.done.set()
+                continue
+
+            self.n_batches += 1
+            self.n_texts += len(texts)
+            off = 0
+            for r in batch:
+                r.out = emb[off:off + len(r.texts)]
+                off += len(r.texts)
+                r.done.set()
+
+
+def _make_handler(batcher: MicroBatcher, model_name: str, backend: str):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send(404, {"error": "not found"})
+            self._send(200, {
+                "model": model_name, "backend": backend, "dim": batcher.encoder.dim,
+                "batches": batcher.n_batches, "texts": batcher.n_texts,
+            })
+
+        def do_POST(self):
+            if self.path != "/encode":
+                return self._send(404, {"error": "not found"})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError:
+                return self._send(400, {"error": "invalid json"})
+            if req.get("model") not in (None, model_name):
+                return self._send(400, {"error": f"model mismatch: service={model_name}, request={req.get('model')}"})
+            texts = req.get("texts") or []
+            if not isinstance(texts, list):
+                return self._send(400, {"error": "texts must be a list"})
+            try:
+                emb = batcher.submit([t if t is not None else "" for t in texts])
+            except Exception as e:
+                return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            emb = np.ascontiguousarray(emb, dtype="<f4")
+            self._send(200, {
+                "n": int(emb.shape[0]), "dim": int(batcher.encoder.dim),
+                "vectors_b64": base64.b64encode(emb.tobytes()).decode("ascii"),
+            })
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def serve(
+    model_name: str,
+    backend: str = "st",
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    window_ms: float = 10.0,
+    max_batch: int = 512,
+) -> None:
+    if backend == "service":
+        raise ValueError("service backend로 서비스를 띄울 수 없습니다")
+    t0 = time.perf_counter()
+    encoder = make_encoder(model_name, backend)
+    print(f"🧠 model loaded: {model_name} backend={backend} dim={encoder.dim} ({time.perf_counter() - t0:.1f}s)")
+
+    batcher = MicroBatcher(encoder, window_ms=window_ms, max_batch=max_batch)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(batcher, model_name, backend))
+    print(f"🚀 embed service: http://{host}:{port} (window={window_ms}ms, max_batch={max_batch})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        encoder.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="로컬 임베딩 서비스 (모델 1회 로드 + micro-batching)")
+    p.add_argument("--model", required=True)
+    p.add_argument("--backend", default="st", choices=[b for b in ENCODER_BACKENDS if b != "service"])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--window_ms", type=float, default=10.0, help="요청 모으는 시간 창")
+    p.add_argument("--max_batch", type=int, default=512, help="한 번에 인코딩할 최대 텍스트 수")
+    args = p.parse_args()
+    serve(args.model, args.backend, args.host, args.port, args.window_ms, args.max_batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# src/encoders.py
+# 텍스트 → 정규화된 float32 벡터 인코더 (embed.py / retrieve.py 공용)
+# - st        : SentenceTransformer 단일 프로세스 (기존 동작)
+# - st_pool   : sentence-transformers multi-process pool (CPU 코어 수만큼 worker)
+# - onnx_int8 : ONNX Runtime + dynamic int8 양자화 (GPU 없는 ingest 서버용)
+# - service   : src/embed_service.py 로컬 서비스 클라이언트 (모델 로드 없음, EMBED_SERVICE_URL)
+# 공통: 전체 입력을 토큰 길이로 정렬 → 비슷한 길이끼리 배치 (padding 최소화) → 원래 순서로 복원
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ENCODER_BACKENDS = ("st", "st_pool", "onnx_int8", "service")
+
+
+def default_backend() -> str:
+    """EMBED_SERVICE_URL이 있으면 서비스, 없으면 프로세스 내 SentenceTransformer"""
+    return "service" if os.environ.get("EMBED_SERVICE_URL") else "st"
+
+
+def normalize_embeddings(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x / norms
+
+
+class Encoder:
+    """backend 공통 인터페이스: encode(texts) → (n, dim) 정규화 float32"""
+
+    backend = "base"
+
+    def __init__(self, model_name: str, batch_size: int = 64):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = None
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """padding 최소화용 정렬 키. tokenizer가 없으면 글자 수"""
+        tok = getattr(self.model, "tokenizer", None)
+        if tok is None:
+            return np.array([len(t) for t in texts])
+        enc = tok(texts, add_special_tokens=True, truncation=True,
+                  max_length=getattr(self.model, "max_seq_length", None) or 512)
+        return np.array([len(ids) for ids in enc["input_ids"]])
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=min(len(texts), self.batch_size),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+    def encode(self, texts: List[str], bucketed: bool = True) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if not bucketed:
+            return normalize_embeddings(np.asarray(self._encode_batch(texts), dtype=np.float32))
+
+        order = np.argsort(self.token_lengths(texts), kind="stable")
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        step = self._bucket_size()
+        for i in range(0, len(order), step):
+            idx = order[i:i + step]
+            out[idx] = self._encode_batch([texts[j] for j in idx])
+        return normalize_embeddings(out)
+
+    def _bucket_size(self) -> int:
+        return self.batch_size
+
+    def close(self) -> None:
+        pass
+
+
+class STEncoder(Encoder):
+    backend = "st"
+
+    def __init__(self, model_name: str, batch_size: int = 64, device: Optional[str] = None):
+        super().__init__(model_name, batch_size)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=device)
+
+
+class STPoolEncoder(Encoder):
+    """
+    multi-process pool: 정렬된 입력을 chunk_size 단위로 worker에 분배
+    - 길이 정렬 후 넘기므로 각 worker chunk도 비슷한 길이끼리
+    """
+    backend = "st_pool"
+
+    def __init__(self, model_name: str, batch_size: int = 64, processes: Optional[int] = None, chunk_size: int = 256):
+        super().__init__(model_name, batch_size)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        n = processes or max(1, (os.cpu_count() or 2) // 2)
+        self.chunk_size = chunk_size
+        self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * n)
+
+    def _bucket_size(self) -> int:
+        # pool 한 번에 여러 chunk를 넘겨야 worker가 동시에 돈다
+        return self.chunk_size * len(self.pool["processes"]) * 4
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode_multi_process(
+            texts, self.pool, batch_size=self.batch_size, chunk_size=self.chunk_size,
+        )
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+class OnnxInt8Encoder(Encoder):
+    """
+    sentence-transformers ONNX backend + dynamic int8 양자화
+    - 첫 실행 때 onnx export → qint8 파일 생성 (cache_dir/<model>/onnx/), 이후 재사용
+    - quant_config: avx512_vnni / avx512 / avx2 / arm64 (CPU에 맞게)
+    """
+    backend = "onnx_int8"
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        cache_dir: str = "data/models",
+        quant_config: str = "avx2",
+    ):
+        super().__init__(model_name, batch_size)
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        local_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        qfile = f"model_qint8_{quant_config}.onnx"
+        qpath = os.path.join(local_dir, "onnx", qfile)
+
+        if not os.path.exists(qpath):
+            base = SentenceTransformer(model_name, backend="onnx", device="cpu")
+            base.save_pretrained(local_dir)
+            export_dynamic_quantized_onnx_model(base, quant_config, local_dir)
+            print(f"📦 ONNX int8 export: {qpath}")
+
+        self.model = SentenceTransformer(
+            local_dir, backend="onnx", device="cpu",
+            model_kwargs={"file_name": f"onnx/{qfile}"},
+        )
+
+
+class ServiceEncoder(Encoder):
+    """
+    embed_service 클라이언트 (표준 라이브러리 HTTP)
+    - 길이 bucket 배치/정규화는 서비스 쪽에서
+    - request_size 단위로 나눠 보냄 (큰 rebuild도 payload 제한 없이)
+    """
+    backend = "service"
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        url: Optional[str] = None,
+        timeout: float = 600.0,
+        request_size: int = 2048,
+    ):
+        super().__init__(model_name, batch_size)
+        self.url = (url or os.environ.get("EMBED_SERVICE_URL") or "http://127.0.0.1:8765").rstrip("/")
+        self.timeout = timeout
+        self.request_size = request_size
+        health = self._call("GET", "/health")
+        if health.get("model") != model_name:
+            raise ValueError(f"embed service model mismatch: service={health.get('model')}, requested={model_name}")
+        self._dim = int(health["dim"])
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def _call(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(
+            self.url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"embed service {path} {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"embed service 연결 실패 ({self.url}): {e.reason}") from e
+
+    def encode(self, texts: List[str], bucketed: bool = True) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), self.request_size):
+            res = self._call("POST", "/encode", {"model": self.model_name, "texts": texts[i:i + self.request_size]})
+            emb = np.frombuffer(base64.b64decode(res["vectors_b64"]), dtype="<f4")
+            out.append(emb.reshape(int(res["n"]), int(res["dim"])))
+        if not out:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate(out).astype(np.float32, copy=False)
+
+
+_ENCODERS: Dict[tuple, Encoder] = {}
+
+
+def make_encoder(model_name: str, backend: Optional[str] = None, **kwargs) -> Encoder:
+    backend = backend or default_backend()
+    if backend == "service":
+        return ServiceEncoder(model_name, **kwargs)
+    if backend == "st":
+        return STEncoder(model_name, **kwargs)
+    if backend == "st_pool":
+        return STPoolEncoder(model_name, **kwargs)
+    if backend == "onnx_int8":
+        return OnnxInt8Encoder(model_name, **kwargs)
+    raise ValueError(f"unknown encoder backend: {backend} (choices: {', '.join(ENCODER_BACKENDS)})")
+
+
+def get_encoder(model_name: str, backend: Optional[str] = None) -> Encoder:
+    """프로세스 내 1회 로드 (질의 인코딩처럼 반복 호출되는 곳용)"""
+    backend = backend or default_backend()
+    key = (model_name, backend)
+    if key not in _ENCODERS:
+        _ENCODERS[key] = make_encoder(model_name, backend)
+    return _ENCODERS[key]
@@ -7,12 +7,13 @@ from typing import Iterable, List, Dict, Optional, Tuple
 
 import duckdb
 import numpy as np
+import pandas as pd
 from bs4 import BeautifulSoup
 
 from .utils.ids import stable_id, sha1_hex
 from .utils.normalize import (
     NBSP, FULLWIDTH_SPACE,
-    normalize_space, split_note_refs, parse_num, normalize_corp_code
+    normalize_space, split_note_refs, parse_num, normalize_corp_code, norm_label
 )
 from .utils.html import (
     strip_html_keep_lines, remove_tables_html,
@@ -66,7 +67,8 @@ def init_db(con: duckdb.DuckDBPyConnection):
       bsns_year INTEGER,
       rcept_no VARCHAR,
       report_date DATE,
-      source_url VARCHAR
+      source_url VARCHAR,
+      ingested_at TIMESTAMP    -- calc materialized 모드의 증분 갱신 워터마크
     );
     """)
 
@@ -159,7 +161,43 @@ def init_db(con: duckdb.DuckDBPyConnection):
       vec_id BIGINT,
       model_name VARCHAR,
       dim INTEGER,
-      created_at TIMESTAMP
+      created_at TIMESTAMP,
+      text_sha1 VARCHAR        -- rag_embedding_cache 키 (동일 텍스트는 벡터 1벌 공유)
+    );
+    """)
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS rag_embedding_cache (
+      model_name VARCHAR,
+      text_sha1 VARCHAR,
+      dim INTEGER,
+      vector FLOAT[],          -- 정규화된 float32 임베딩 (FAISS 재구성 시 재인코딩 없이 load → add)
+      created_at TIMESTAMP,
+      PRIMARY KEY (model_name, text_sha1)
+    );
+    """)
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS rag_table_row_embeddings (
+      table_id VARCHAR,
+      row_idx INTEGER,
+      report_id VARCHAR,
+      vec_id BIGINT,
+      model_name VARCHAR,
+      dim INTEGER,
+      text_sha1 VARCHAR,       -- rag_embedding_cache 키
+      row_text VARCHAR,        -- "행 경로 | 헤더: 값 ; ..." 직렬화 텍스트
+      created_at TIMESTAMP,
+      PRIMARY KEY (model_name, table_id, row_idx)
+    );
+    """)
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS rag_vector_tombstones (
+      model_name VARCHAR,
+      vec_id BIGINT,           -- 삭제됐지만 FAISS 파일에 남아있는 id (compaction 대기)
+      deleted_at TIMESTAMP,
+      PRIMARY KEY (model_name, vec_id)
     );
     """)
 
@@ -169,7 +207,8 @@ def init_db(con: duckdb.DuckDBPyConnection):
       statement_type VARCHAR,
       ifrs_code VARCHAR,
       label_ko VARCHAR,
-      label_clean VARCHAR
+      label_clean VARCHAR,
+      label_norm VARCHAR       -- norm_label(label_clean), calc 뷰/매핑 조인 키
     );
     """)
 
@@ -187,6 +226,8 @@ def init_db(con: duckdb.DuckDBPyConnection):
       col_idx INTEGER,
       note_refs_raw VARCHAR,
       note_nos INTEGER[],
+      value_won DOUBLE,        -- value * unit_multiplier (ingest 시점 1회 계산)
+      decimals INTEGER,        -- 셀 adecimal (XBRL 반올림 자릿수, 예: -6 = 백만원 단위)
       PRIMARY KEY (report_id, line_item_id, period_end, col_idx)
     );
     """)
@@ -206,6 +247,11 @@ def init_db(con: duckdb.DuckDBPyConnection):
 def ensure_table_schema(con: duckdb.DuckDBPyConnection):
     init_db(con)
 
+    if _table_exists(con, "reports"):
+        cols = set(_get_existing_cols(con, "reports"))
+        if "ingested_at" not in cols:
+            con.execute("ALTER TABLE reports ADD COLUMN ingested_at TIMESTAMP")
+
     if _table_exists(con, "report_sections"):
         cols = set(_get_existing_cols(con, "report_sections"))
         if "note_no" not in cols:
@@ -225,16 +271,106 @@ def ensure_table_schema(con: duckdb.DuckDBPyConnection):
         if "note_nos" not in cols:
             con.execute("ALTER TABLE rag_table_rows ADD COLUMN note_nos INTEGER[]")
 
+    if _table_exists(con, "fs_line_items"):
+        cols = set(_get_existing_cols(con, "fs_line_items"))
+        if "label_norm" not in cols:
+            con.execute("ALTER TABLE fs_line_items ADD COLUMN label_norm VARCHAR")
+
     if _table_exists(con, "fs_facts"):
         cols = set(_get_existing_cols(con, "fs_facts"))
         if "note_nos" not in cols:
             con.execute("ALTER TABLE fs_facts ADD COLUMN note_nos INTEGER[]")
+        if "value_won" not in cols:
+            con.execute("ALTER TABLE fs_facts ADD COLUMN value_won DOUBLE")
+        if "decimals" not in cols:
+            con.execute("ALTER TABLE fs_facts ADD COLUMN decimals INTEGER")
 
     if _table_exists(con, "rag_text_chunks"):
         cols = set(_get_existing_cols(con, "rag_text_chunks"))
         if "text_for_embed" not in cols:
             con.execute("ALTER TABLE rag_text_chunks ADD COLUMN text_for_embed VARCHAR")
 
+    if _table_exists(con, "rag_text_embeddings"):
+        cols = set(_get_existing_cols(con, "rag_text_embeddings"))
+        if "text_sha1" not in cols:
+            con.execute("ALTER TABLE rag_text_embeddings ADD COLUMN text_sha1 VARCHAR")
+
+
+def backfill_label_norm(con: duckdb.DuckDBPyConnection, only_missing: bool = True) -> int:
+    """
+    fs_line_items.label_norm 백필 (컬럼 추가 이전에 ingest된 DB용).
+    - only_missing=True : label_norm IS NULL 인 행만 채움
+    - only_missing=False: norm_label 규칙 변경 시 전체 재계산
+    반환: 갱신한 행 수
+    """
+    ensure_table_schema(con)
+
+    where = "WHERE label_norm IS NULL" if only_missing else ""
+    rows = con.execute(f"SELECT line_item_id, label_clean FROM fs_line_items {where}").fetchall()
+    if not rows:
+        return 0
+
+    df = pd.DataFrame(
+        [(lid, norm_label(lab)) for (lid, lab) in rows],
+        columns=["line_item_id", "label_norm"],
+    )
+    con.register("tmp_label_norm", df)
+    try:
+        con.execute("""
+          UPDATE fs_line_items li
+          SET label_norm = t.label_norm
+          FROM tmp_label_norm t
+          WHERE li.line_item_id = t.line_item_id
+        """)
+    finally:
+        con.unregister("tmp_label_norm")
+    return len(rows)
+
+
+def backfill_value_won(con: duckdb.DuckDBPyConnection, only_missing: bool = True) -> int:
+    """
+    fs_facts.value_won / decimals 백필 (컬럼 추가 이전에 ingest된 DB용).
+    - value_won = value * unit_multiplier
+    - decimals  = rag_table_cells.decimals (같은 table_id/row_idx/col_idx 셀)
+    - only_missing=True : value_won IS NULL 인 행만
+    반환: 갱신한 행 수
+    """
+    ensure_table_schema(con)
+
+    missing = "AND f.value_won IS NULL" if only_missing else ""
+    n = con.execute(f"""
+      SELECT COUNT(*)
+      FROM fs_facts f
+      WHERE f.value IS NOT NULL
+        AND f.unit_multiplier IS NOT NULL
+        {missing}
+    """).fetchone()[0]
+    if not n:
+        return 0
+
+    con.execute(f"""
+      UPDATE fs_facts f
+      SET
+        value_won = f.value * f.unit_multiplier,
+        decimals = COALESCE(f.decimals, c.decimals)
+      FROM (
+        SELECT f2.report_id, f2.line_item_id, f2.period_end, f2.col_idx, rc.decimals
+        FROM fs_facts f2
+        LEFT JOIN rag_table_cells rc
+          ON rc.table_id = f2.table_id
+         AND rc.row_idx  = f2.row_idx
+         AND rc.col_idx  = f2.col_idx
+      ) c
+      WHERE c.report_id = f.report_id
+        AND c.line_item_id = f.line_item_id
+        AND c.period_end IS NOT DISTINCT FROM f.period_end
+        AND c.col_idx = f.col_idx
+        AND f.value IS NOT NULL
+        AND f.unit_multiplier IS NOT NULL
+        {missing}
+    """)
+    return int(n)
+
 
 # ============================
 # Text chunk upsert
@@ -625,14 +761,17 @@ def upsert_tables_common(
         # FS facts
         if table_parser == "fin":
             col_lookup = {c[1]: (c[4], c[5]) for c in col_rows if c[2] == "period"}
-            cell_dict = {(ri, ci): (tv, nv) for (ri, ci, tv, nv, dec, actx) in t["cells"]}
+            cell_dict = {(ri, ci): (tv, nv, dec) for (ri, ci, tv, nv, dec, actx) in t["cells"]}
 
             line_item_rows = []
             facts_rows = []
 
             for r in rows:
                 line_item_id = stable_id(report_id, statement_type, (r.get("ifrs_code") or ""), r["label_clean"])
-                line_item_rows.append((line_item_id, statement_type, r.get("ifrs_code"), r["label_ko"], r["label_clean"]))
+                line_item_rows.append((
+                    line_item_id, statement_type, r.get("ifrs_code"),
+                    r["label_ko"], r["label_clean"], norm_label(r["label_clean"]),
+                ))
 
                 rolled_note_nos = r.get("note_nos") or []
                 note_refs_raw = r.get("note_refs_raw")
@@ -640,22 +779,25 @@ def upsert_tables_common(
                 for col_idx, (period_end, fiscal_year) in col_lookup.items():
                     if period_end is None:
                         continue
-                    tv, nv = cell_dict.get((r["row_idx"], col_idx), (None, None))
+                    tv, nv, dec = cell_dict.get((r["row_idx"], col_idx), (None, None, None))
 
                     if (tv is None and nv is None) and not rolled_note_nos:
                         continue
 
+                    # 원 단위 환산은 여기서 1회 (calc 뷰는 value_won을 그대로 읽음)
+                    value_won = nv * unit_mult if (nv is not None and unit_mult is not None) else None
+
                     facts_rows.append((
                         report_id, line_item_id, period_end, fiscal_year, nv,
                         unit_mult, currency, table_id, r["row_idx"], col_idx,
-                        note_refs_raw, rolled_note_nos
+                        note_refs_raw, rolled_note_nos, value_won, dec
                     ))
 
             if line_item_rows:
                 con.executemany("""
                   INSERT OR REPLACE INTO fs_line_items
-                  (line_item_id, statement_type, ifrs_code, label_ko, label_clean)
-                  VALUES (?, ?, ?, ?, ?)
+                  (line_item_id, statement_type, ifrs_code, label_ko, label_clean, label_norm)
+                  VALUES (?, ?, ?, ?, ?, ?)
                 """, line_item_rows)
 
             if facts_rows:
@@ -663,8 +805,8 @@ def upsert_tables_common(
                   INSERT OR REPLACE INTO fs_facts
                   (report_id, line_item_id, period_end, fiscal_year, value,
                   unit_multiplier, currency, table_id, row_idx, col_idx,
-                  note_refs_raw, note_nos)
-                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                  note_refs_raw, note_nos, value_won, decimals)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, facts_rows)
 
 
@@ -1234,8 +1376,8 @@ def ingest_one_report_xml(
 
         con.execute("""
             INSERT OR REPLACE INTO reports
-            (report_id, corp_code, corp_name, bsns_year, rcept_no, report_date, source_url)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            (report_id, corp_code, corp_name, bsns_year, rcept_no, report_date, source_url, ingested_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
         """, (report_id, corp_code, corp_name, bsns_year, rcept_no, None, None))
 
         # ✅ I/II 추출
@@ -1386,6 +1528,10 @@ def delete_report(con: duckdb.DuckDBPyConnection, report_id: str):
           WHERE rs.report_id = ?
         """, [report_id]).fetchall()]
 
+    if _table_exists(con, "rag_table_row_embeddings"):
+        # 표 row index의 잔여 id는 다음 build_or_update_table_row_faiss에서 한 번에 제거
+        con.execute("DELETE FROM rag_table_row_embeddings WHERE report_id = ?", [report_id])
+
     if table_ids:
         con.executemany("DELETE FROM rag_table_cells WHERE table_id = ?", [(tid,) for tid in table_ids])
         con.executemany("DELETE FROM rag_table_rows  WHERE table_id = ?", [(tid,) for tid in table_ids])
@@ -1394,7 +1540,12 @@ def delete_report(con: duckdb.DuckDBPyConnection, report_id: str):
 
     chunk_ids = [r[0] for r in con.execute("SELECT chunk_id FROM rag_text_chunks WHERE report_id=?", [report_id]).fetchall()]
     if chunk_ids:
-        con.execute("DELETE FROM rag_text_embeddings WHERE chunk_id IN (SELECT UNNEST(?))", [chunk_ids])
+        # 임베딩이 있으면 vec_id를 tombstone으로 (FAISS에서는 다음 update의 compaction 때 제거)
+        if _table_exists(con, "rag_text_embeddings") and con.execute(
+            "SELECT COUNT(*) FROM rag_text_embeddings WHERE chunk_id IN (SELECT UNNEST(?))", [chunk_ids]
+        ).fetchone()[0]:
+            from .embed import delete_vectors
+            delete_vectors(con, report_id)
         con.execute("DELETE FROM rag_text_chunks     WHERE chunk_id IN (SELECT UNNEST(?))", [chunk_ids])
 
     con.execute("DELETE FROM fs_facts        WHERE report_id = ?", [report_id])
@@ -3,6 +3,7 @@
 # 1. 텍스트 검색 (FAISS) : 질문 → embedding  -> FAISS에서 top-k chunk_id 검색  
 # -> chunk_id로 DuckDB에서:원문 텍스트, section_code, note_no 등을 가져옴. 
 # 2. 주석 표 검색 (DuckDB SQL) : 입력: 사용자 질문 (키워드) -> “주석 12번 표에서 매출채권이 ○○로 구성됨” 같은 정량 근거
+# 3. 주석 표 row 벡터 검색 : row를 "행 경로 | 헤더: 값"으로 임베딩한 별도 index → search_table_rows
 
 from __future__ import annotations
 from typing import Any, Dict, List, Optional, Tuple
@@ -216,6 +217,194 @@ def build_notes_table_context(
 
     return "\n".join(chunks).strip()
 
+# ============================================================
+# 텍스트 검색 (FAISS / 저장 벡터) : report 범위로 제한된 top-k chunk
+# ============================================================
+def encode_query(query: str, model_name: str, encoder_backend: Optional[str] = None):
+    """
+    질문 → 정규화된 float32 벡터 (encoder는 프로세스 내 1회 로드)
+    - EMBED_SERVICE_URL이 설정돼 있으면 embed_service로 (모델 로드 없음)
+    """
+    from .encoders import get_encoder
+
+    return get_encoder(model_name, encoder_backend).encode([query], bucketed=False)[0]
+
+
+def search_text_chunks(
+    con: duckdb.DuckDBPyConnection,
+    report_id,
+    query: str,
+    model_name: str,
+    topk: int = 8,
+    index=None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    encoder_backend: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    report_id(1개 또는 list) 범위 안에서만 벡터 검색 → chunk 원문/섹션 정보
+    - index: faiss index (None이면 저장 벡터로 정확 검색)
+    """
+    from .embed import search_reports
+
+    q = normalize_space(query or "")
+    if not q:
+        return []
+    report_ids = [report_id] if isinstance(report_id, str) else list(report_id)
+
+    hits = search_reports(
+        con, encode_query(q, model_name, encoder_backend), report_ids, model_name,
+        k=topk, index=index, nprobe=nprobe, ef_search=ef_search,
+    )
+    if not hits:
+        return []
+
+    rows = con.execute("""
+      SELECT chunk_id, report_id, section_id, section_code, note_no, chunk_idx, text
+      FROM rag_text_chunks
+      WHERE chunk_id IN (SELECT UNNEST(?))
+    """, [[cid for cid, _ in hits]]).fetchall()
+    by_id = {r[0]: r for r in rows}
+
+    out = []
+    for cid, score in hits:
+        r = by_id.get(cid)
+        if r is None:
+            continue
+        _cid, rid, sid, scode, note_no, chunk_idx, text = r
+        out.append({
+            "chunk_id": str(cid),
+            "report_id": str(rid),
+            "section_id": str(sid),
+            "section_code": str(scode),
+            "note_no": int(note_no) if note_no is not None else None,
+            "chunk_idx": int(chunk_idx) if chunk_idx is not None else None,
+            "score": float(score),
+            "text": text or "",
+        })
+    return out
+
+
+def build_text_context(hits: List[Dict[str, Any]], max_chars: int = 1200) -> str:
+    lines = []
+    for h in hits:
+        head = f"[{h['section_code']}" + (f" 주석{h['note_no']}" if h.get("note_no") is not None else "") + f"] score={h['score']:.3f}"
+        lines.append(head)
+        lines.append(normalize_space(h["text"])[:max_chars])
+    return "\n".join(lines).strip()
+
+
+# ============================================================
+# 주석 표 row 벡터 검색 : row를 "행 경로 | 헤더: 값" 텍스트로 직렬화해 임베딩 (embed.build_or_update_table_row_faiss)
+# → ILIKE 전체 셀 스캔 대신 index 조회
+# ============================================================
+def serialize_table_row(row_path: str, row_items: List[Tuple[int, str, Optional[float]]], col_headers: Dict[int, str]) -> str:
+    """표 row 1개 → '행 경로 | 헤더: 값 ; 헤더: 값' (빈 셀 제외, 값이 하나도 없으면 '')"""
+    kvs = []
+    for (col_idx, tv, _nv) in row_items:
+        # col 0 = 행 라벨 열 (ingest가 label_ko로 저장, row_path에 이미 포함)
+        if int(col_idx) == 0:
+            continue
+        tv2 = normalize_space(tv or "")
+        if tv2 == "":
+            continue
+        kvs.append(f"{col_headers.get(int(col_idx), f'COL_{col_idx}')}: {tv2}")
+    if not kvs:
+        return ""
+    return f"{row_path} | " + " ; ".join(kvs)
+
+
+def notes_table_row_texts(con: duckdb.DuckDBPyConnection, table_ids: List[str]) -> List[Tuple[str, int, str]]:
+    """table_ids의 모든 row → [(table_id, row_idx, 직렬화 텍스트)] (값 없는 row 제외)"""
+    if not table_ids:
+        return []
+    cells = con.execute("""
+      SELECT table_id, row_idx, col_idx, coalesce(text_value,'') AS tv, num_value
+      FROM rag_table_cells
+      WHERE table_id IN (SELECT UNNEST(?))
+      ORDER BY table_id, row_idx, col_idx
+    """, [list(table_ids)]).fetchall()
+
+    by_row: Dict[Tuple[str, int], List[Tuple[int, str, Optional[float]]]] = {}
+    for table_id, row_idx, col_idx, tv, nv in cells:
+        by_row.setdefault((table_id, int(row_idx)), []).append(
+            (int(col_idx), tv, float(nv) if nv is not None else None)
+        )
+
+    out = []
+    cur_table = None
+    col_headers: Dict[int, str] = {}
+    row_paths: Dict[int, str] = {}
+    for (table_id, row_idx), items in by_row.items():
+        if table_id != cur_table:
+            cur_table = table_id
+            col_headers = _build_table_header_paths(con, table_id)
+            row_paths = _build_row_label_paths(con, table_id)
+        txt = serialize_table_row(row_paths.get(row_idx, f"ROW_{row_idx}"), items, col_headers)
+        if txt:
+            out.append((table_id, row_idx, txt))
+    return out
+
+
+def search_table_rows(
+    con: duckdb.DuckDBPyConnection,
+    report_id,
+    query: str,
+    model_name: str,
+    topk: int = 8,
+    index=None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    encoder_backend: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    report_id(1개 또는 list) 범위의 주석 표 row 벡터 검색
+    - index: 표 row faiss index (None이면 저장 벡터로 정확 검색)
+    """
+    from .embed import search_table_row_vectors
+
+    q = normalize_space(query or "")
+    if not q:
+        return []
+    report_ids = [report_id] if isinstance(report_id, str) else list(report_id)
+
+    hits = search_table_row_vectors(
+        con, encode_query(q, model_name, encoder_backend), report_ids, model_name,
+        k=topk, index=index, nprobe=nprobe, ef_search=ef_search,
+    )
+    if not hits:
+        return []
+
+    rows = con.execute("""
+      SELECT e.table_id, e.row_idx, e.row_text, rt.table_title, rs.section_id, rs.section_code, rs.title_ko, rs.note_no
+      FROM rag_table_row_embeddings e
+      JOIN rag_tables rt ON rt.table_id = e.table_id
+      JOIN report_sections rs ON rs.section_id = rt.section_id
+      WHERE e.model_name = ?
+        AND e.table_id IN (SELECT UNNEST(?))
+    """, [model_name, sorted({t for (t, _r), _s in hits})]).fetchall()
+    by_key = {(r[0], int(r[1])): r for r in rows}
+
+    out = []
+    for key, score in hits:
+        r = by_key.get(key)
+        if r is None:
+            continue
+        table_id, row_idx, row_text, table_title, sid, scode, title_ko, note_no = r
+        out.append({
+            "table_id": str(table_id),
+            "row_idx": int(row_idx),
+            "section_id": str(sid),
+            "section_code": str(scode),
+            "section_title": str(title_ko) if title_ko is not None else "",
+            "note_no": int(note_no) if note_no is not None else None,
+            "table_title": str(table_title) if table_title is not None else "",
+            "score": float(score),
+            "row_text": row_text or "",
+        })
+    return out
+
+
 def build_context_with_notes_tables(
     con: duckdb.DuckDBPyConnection,
     report_id: str,
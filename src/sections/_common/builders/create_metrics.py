@@ -155,8 +155,57 @@ def build_metrics_for_section(
             "periods": periods_out,
         })
 
+    _attach_lineage(con, report_id, out_rows)
     return {"report_id": report_id, "statement_type": stype, "rows": out_rows}
 
+def _attach_lineage(
+    con: duckdb.DuckDBPyConnection,
+    report_id: str,
+    out_rows: List[Dict[str, Any]],
+) -> None:
+    """
+    metric_lineage(run_calc 적재 시 생성)에서 이 report의 원천 셀/주석 번호를 row["lineage"]로 붙임
+    - key가 metric_key와 같거나, line_item_id가 self 행과 같으면 매칭
+    - metric_lineage가 없으면(run_calc 전) 아무것도 하지 않음
+    """
+    exists = con.execute("""
+      SELECT 1 FROM information_schema.tables WHERE table_name='metric_lineage' LIMIT 1
+    """).fetchone()
+    if not exists or not out_rows:
+        return
+
+    keys = [r["key"] for r in out_rows]
+    line_item_ids = [r["line_item_id"] for r in out_rows if r.get("line_item_id")]
+    rows = con.execute("""
+      SELECT l.metric_key, l.role, l.via_key, l.std_key, l.line_item_id,
+             l.table_id, l.row_idx, l.col_idx, l.note_nos
+      FROM metric_lineage l
+      JOIN reports r
+        ON r.corp_code = l.corp_code
+       AND r.bsns_year = l.bsns_year
+      WHERE r.report_id = ?
+        AND l.report_id = ?
+        AND (
+          l.metric_key IN (SELECT UNNEST(?))
+          OR (l.role = 'self' AND l.line_item_id IN (SELECT UNNEST(?)))
+        )
+      ORDER BY l.metric_key, l.role, l.std_key, l.table_id, l.row_idx, l.col_idx
+    """, [report_id, report_id, keys, line_item_ids]).fetchall()
+
+    for r in out_rows:
+        r["lineage"] = []
+        for (metric_key, role, via_key, std_key, line_item_id, table_id, row_idx, col_idx, note_nos) in rows:
+            if metric_key != r["key"] and not (role == "self" and line_item_id == r.get("line_item_id")):
+                continue
+            r["lineage"].append({
+                "std_key": std_key,
+                "role": role,
+                "via_key": via_key,
+                "line_item_id": line_item_id,
+                "trace": {"table_id": table_id, "row_idx": row_idx, "col_idx": col_idx},
+                "note_nos": [int(n) for n in (note_nos or [])],
+            })
+
 def save_metrics_json(obj: Dict[str, Any], out_path: Path) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
     out_path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
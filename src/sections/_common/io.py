@@ -171,3 +171,43 @@ def pack_evidence(
             for t in (c.get("table_refs") or [])[:3]:
                 out.append(f"  - [TABLE] {t.get('caption','')}\n{t.get('table_md','')}")
     return "\n".join(out)
+
+
+def build_trace_items(
+    metric_rows: Dict[str, Dict[str, Any]],
+    evidence_rows: List[Dict[str, Any]],
+    metric_keys: List[str],
+    per_item: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    render_T3_TRACE 입력 생성:
+    metric_rows[key]["lineage"][].note_nos (create_metrics가 metric_lineage에서 붙임)
+    → 같은 note_no의 evidence chunk (note_no당 첫 chunk)
+    """
+    first_chunk: Dict[int, Dict[str, Any]] = {}
+    for c in evidence_rows:
+        no = c.get("note_no")
+        if no is not None and c.get("chunk_id") and int(no) not in first_chunk:
+            first_chunk[int(no)] = c
+
+    out: List[Dict[str, Any]] = []
+    for k in metric_keys:
+        r = metric_rows.get(k)
+        if not r:
+            continue
+        note_nos: List[int] = []
+        for l in r.get("lineage") or []:
+            for no in l.get("note_nos") or []:
+                if no in first_chunk and no not in note_nos:
+                    note_nos.append(no)
+        for no in note_nos[:per_item]:
+            c = first_chunk[no]
+            text = " ".join(str(c.get("text", "")).split())
+            out.append({
+                "item": k,
+                "note_no": no,
+                "chunk_id": c["chunk_id"],
+                "section_code": c.get("section_code", ""),
+                "point": text[:80] + ("…" if len(text) > 80 else ""),
+            })
+    return out
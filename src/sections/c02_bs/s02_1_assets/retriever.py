@@ -3,7 +3,7 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Any, Dict, List
 
-from src.sections._common.io import load_inputs, pack_evidence
+from src.sections._common.io import load_inputs, pack_evidence, build_trace_items
 from src.sections._common.table_templates import render_T1_YOY, render_T_SIMPLE, render_T3_TRACE
 
 
@@ -13,8 +13,8 @@ def build_ctx(workdir: Path, spec: Dict[str, Any]) -> Dict[str, Any]:
     - 표: 자산 항목 YoY (T1)
     - 표: 회전율 지표 (T_SIMPLE)
     - 주석근거: evidence_rows -> pack_evidence
-    - trace: (현재는 데이터/매핑 미확정이므로 기본은 빈 trace로 제공)
-      -> prompt.md에 {note_trace_assets}가 있으므로 키는 항상 제공해야 함.
+    - trace: metrics rows의 lineage(note_nos) → evidence chunk (build_trace_items)
+      -> prompt.md에 {note_trace_assets}가 있으므로 키는 항상 제공해야 함 (lineage 없으면 빈 문자열).
     """
     inputs = load_inputs(workdir, spec_id=spec["id"], allow_missing_evidence=True)
     meta = inputs["meta"]
@@ -48,12 +48,22 @@ def build_ctx(workdir: Path, spec: Dict[str, Any]) -> Dict[str, Any]:
     # -------------------------
     # 3) 지표 → 주석 연결(trace)
     # -------------------------
-    # 현재 evidence_rows에 "어떤 항목(item)과 연결되는지" 구조가 확실치 않으므로
-    # 우선 빈 trace를 제공해서 KeyError를 방지한다.
-    #
-    # 나중에 evidence_rows에 item/metric_key 같은 필드가 들어오면 아래 trace_items를 구성해
-    # render_T3_TRACE(trace_items)로 문자열을 채우면 됨.
-    trace_items: List[Dict[str, Any]] = []
+    # create_metrics가 metric_lineage에서 붙인 lineage(note_nos)를 evidence chunk와 연결
+    trace_items: List[Dict[str, Any]] = build_trace_items(
+        metric_rows,
+        evidence_rows,
+        [
+            "TOTAL_ASSETS",
+            "CURRENT_ASSETS",
+            "NON_CURRENT_ASSETS",
+            "CASH_AND_CASH_EQUIVALENTS",
+            "ACCOUNTS_RECEIVABLE",
+            "INVENTORIES",
+            "PROPERTY_PLANT_EQUIPMENT",
+            "ar_turnover",
+            "inventory_turnover",
+        ],
+    )
     note_trace_assets = render_T3_TRACE(trace_items) if trace_items else ""
 
     # -------------------------
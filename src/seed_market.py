@@ -152,11 +152,24 @@ def seed_market_from_csv(db_path: str, csv_path: str, overwrite: bool = True) ->
 
         con.register("tmp_market", all_market)
         con.execute("INSERT INTO market_data SELECT * FROM tmp_market")
-        con.unregister("tmp_market")
 
         con.register("tmp_benchmap", bench_map_df)
         con.execute("INSERT INTO benchmark_map SELECT * FROM tmp_benchmap")
+
+        # 이번 seed가 건드린 (corp_code, year) → validate_market_tables(only_touched=True) 증분 QC 범위
+        con.execute("""
+          CREATE OR REPLACE TABLE market_seed_touched AS
+          SELECT DISTINCT CAST(corp_code AS VARCHAR) AS corp_code, CAST(year AS INTEGER) AS year,
+                 CAST(CURRENT_TIMESTAMP AS TIMESTAMP) AS seeded_at
+          FROM (
+            SELECT corp_code, year FROM tmp_market
+            UNION ALL
+            SELECT corp_code, year FROM tmp_benchmap
+          )
+          WHERE corp_code IS NOT NULL AND year IS NOT NULL
+        """)
         con.unregister("tmp_benchmap")
+        con.unregister("tmp_market")
 
     finally:
         con.close()
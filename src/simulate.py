@@ -0,0 +1,193 @@
+# src/simulate.py
+# What-if 시나리오: 기준 항목(v_value_augmented)을 가정 변경 → derived 항목/ratio 재계산
+# - DB는 읽기만 함 (fact_metrics / 뷰 체인에 쓰지 않음)
+# - 시나리오 N개를 NumPy 배열 한 번에 계산 (민감도 그리드 등)
+# - derived 규칙은 calc.py v_value_augmented, ratio 규칙은 ratio_requirements(role/required)와 동일
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .calc import AUGMENTED_INPUT_KEYS
+
+DERIVED_KEYS = ["TAX_RATE", "NOPAT", "INVESTED_CAPITAL", "EPS", "BPS", "SPS", "CFPS"]
+
+# "INTEREST_EXP +20%" / "INVENTORIES -10%" / "STOCK_PRICE =50000" / "NET_INCOME +1e9"
+_ADJ_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*([+\-=])\s*([0-9.eE+\-]+)\s*(%?)\s*$")
+
+Adjustments = Union[Sequence[str], Dict[str, object]]
+
+
+def parse_adjustment(spec: str) -> tuple:
+    """
+    문자열 가정 1개 → (std_key, kind, value)
+    - kind: 'pct' (상대 변화, 0.2 = +20%) / 'add' (절대 증감) / 'set' (값 지정)
+    """
+    m = _ADJ_RE.match(spec or "")
+    if not m:
+        raise ValueError(f"adjustment 형식 오류: {spec!r} (예: 'INTEREST_EXP +20%')")
+    key, op, num, pct = m.groups()
+    v = float(num)
+    if op == "=":
+        if pct:
+            raise ValueError(f"'=' 에는 % 를 쓸 수 없습니다: {spec!r}")
+        return key, "set", v
+    if op == "-":
+        v = -v
+    return (key, "pct", v / 100.0) if pct else (key, "add", v)
+
+
+def _normalize_adjustments(adjustments: Adjustments) -> List[tuple]:
+    """
+    - list[str]         : 시나리오 1개 (parse_adjustment)
+    - dict[key -> 값]   : 상대 변화(0.2 = +20%). 값이 배열이면 시나리오 축 (길이 N, 다른 배열과 broadcast)
+    반환: [(std_key, kind, np.ndarray)]
+    """
+    if isinstance(adjustments, dict):
+        return [(k, "pct", np.atleast_1d(np.asarray(v, dtype=float))) for k, v in adjustments.items()]
+    out = []
+    for spec in adjustments or []:
+        k, kind, v = parse_adjustment(spec)
+        out.append((k, kind, np.atleast_1d(np.asarray(v, dtype=float))))
+    return out
+
+
+def fetch_base_values(con, corp_code: str, bsns_year: int, keys: List[str]) -> Dict[str, float]:
+    """v_value_augmented 기준값 (report_id 중복은 fact_metrics 적재와 같은 규칙으로 dedup)"""
+    rows = con.execute("""
+      SELECT std_key, value_won
+      FROM v_value_augmented
+      WHERE corp_code = ?
+        AND bsns_year = ?
+        AND std_key IN (SELECT UNNEST(?))
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY std_key
+        ORDER BY (value_won IS NOT NULL) DESC, abs(value_won) DESC, report_id DESC
+      ) = 1
+    """, [corp_code, int(bsns_year), keys]).fetchall()
+    base = {k: np.nan for k in keys}
+    for k, v in rows:
+        base[k] = np.nan if v is None else float(v)
+    return base
+
+
+def _safe_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    out = np.full(np.broadcast(a, b).shape, np.nan)
+    ok = ~np.isnan(a) & ~np.isnan(b) & (b != 0)
+    np.divide(a, b, out=out, where=ok)
+    return out
+
+
+def _coalesce(*arrs: np.ndarray) -> np.ndarray:
+    out = arrs[0].copy()
+    for a in arrs[1:]:
+        out = np.where(np.isnan(out), a, out)
+    return out
+
+
+def _derive(v: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """calc.py v_value_augmented의 derived CTE를 배열 연산으로"""
+    tax_rate = np.clip(_safe_div(v["TAX_EXP"], v["PRE_TAX_INCOME"]), 0, 1)
+    nopat = v["OP_PROFIT"] * (1 - tax_rate)
+
+    long_debt = _coalesce(
+        v["LONG_TERM_DEBT"],
+        v["NON_CURRENT_LIABILITIES"],
+        v["TOTAL_LIABILITIES"] - v["CURRENT_LIABILITIES"],
+    )
+    invested_capital = long_debt + v["EQUITY"]
+
+    shares = v["SHARES_OUTSTANDING"]
+    depreciation = np.where(np.isnan(v["DEPRECIATION"]), 0.0, v["DEPRECIATION"])
+    return {
+        "TAX_RATE": tax_rate,
+        "NOPAT": nopat,
+        "INVESTED_CAPITAL": invested_capital,
+        "EPS": _safe_div(v["NET_INCOME"], shares),
+        "BPS": _safe_div(v["EQUITY"], shares),
+        "SPS": _safe_div(v["REVENUE"], shares),
+        "CFPS": _safe_div(v["NET_INCOME"] + depreciation, shares),
+    }
+
+
+def _ratios(v: Dict[str, np.ndarray], ratio_req: pd.DataFrame, n: int) -> Dict[str, np.ndarray]:
+    """ratio_requirements(role/required) → ratio 배열 (v_financial_ratios와 같은 NULL/0 규칙)"""
+    sign = {"numerator": 1.0, "add": 1.0, "subtract": -1.0}
+    out = {}
+    for ratio_key, g in ratio_req.groupby("ratio_key", sort=False):
+        num = np.zeros(n)
+        den = np.zeros(n)
+        complete = np.ones(n, dtype=bool)
+        for _, r in g.iterrows():
+            x = v.get(r["item_key"], np.full(n, np.nan))
+            if bool(r["required"]):
+                complete &= ~np.isnan(x)
+            x0 = np.where(np.isnan(x), 0.0, x)
+            if r["role"] == "denominator":
+                den += x0
+            else:
+                num += sign[r["role"]] * x0
+        ok = complete & (den != 0)
+        res = np.full(n, np.nan)
+        np.divide(num, den, out=res, where=ok)
+        out[ratio_key] = res
+    return out
+
+
+def simulate(
+    con,
+    corp_code: str,
+    bsns_year: int,
+    adjustments: Adjustments,
+    metrics: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    가정 변경 후 derived 항목/ratio 재계산 (시나리오당 1행)
+
+    adjustments:
+      - ["INTEREST_EXP +20%", "INVENTORIES -10%"]           → 시나리오 1개
+      - {"INTEREST_EXP": np.linspace(-0.5, 0.5, 1000)}      → 시나리오 1000개 (상대 변화)
+    metrics: 반환 컬럼 제한 (None이면 입력/derived/ratio 전체)
+    """
+    ratio_req = con.execute("""
+      SELECT ratio_key, item_key, role, required
+      FROM ratio_requirements
+    """).df()
+
+    derived = set(DERIVED_KEYS)
+    input_keys = sorted(
+        set(AUGMENTED_INPUT_KEYS) | {k for k in ratio_req["item_key"].tolist() if k not in derived}
+    )
+    base = fetch_base_values(con, corp_code, bsns_year, input_keys)
+
+    adj = _normalize_adjustments(adjustments)
+    for k, _, _ in adj:
+        if k in derived:
+            raise ValueError(f"derived 항목은 직접 조정할 수 없습니다: {k} (기준 항목을 조정하세요)")
+        if k not in base:
+            base[k] = np.nan
+    n = int(np.broadcast_shapes(*[a.shape for _, _, a in adj])[0]) if adj else 1
+
+    v = {k: np.full(n, b, dtype=float) for k, b in base.items()}
+    params = {}
+    for k, kind, a in adj:
+        if kind == "pct":
+            v[k] = v[k] * (1.0 + a)
+        elif kind == "add":
+            v[k] = v[k] + a
+        else:
+            v[k] = np.broadcast_to(a, (n,)).astype(float)
+        params[f"adj_{k}"] = np.broadcast_to(a, (n,))
+
+    v.update(_derive(v))
+    ratios = _ratios(v, ratio_req, n)
+
+    df = pd.DataFrame({**params, **v, **ratios})
+    df.insert(0, "scenario", np.arange(n))
+    if metrics:
+        keep = ["scenario", *params.keys(), *[m for m in metrics if m in df.columns]]
+        df = df[keep]
+    return df
@@ -0,0 +1,70 @@
+# src/utils/account_matcher.py
+# account_map_rules(EXACT/REGEX/LIKE) → label_norm 매칭기
+# - EXACT : (scope, pattern) dict 조회
+# - REGEX/LIKE : scope별로 priority 순 alternation 하나로 컴파일 → 라벨당 re.match 1회
+# 매칭은 calc 초기화(run_calc / refresh_calc_tables) 때 신규 line_item 단위로 1번만 수행하고 결과는 line_item_std_map에 저장 (calc 뷰는 등호 조인)
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (scope, std_key, match_type, pattern, pattern_raw, priority)
+Rule = Tuple[str, str, str, str, str, int]
+
+
+def like_to_regex(pattern: str) -> str:
+    """SQL LIKE ('%', '_') → 전체 일치 정규식"""
+    out = []
+    for ch in pattern:
+        if ch == "%":
+            out.append(".*")
+        elif ch == "_":
+            out.append(".")
+        else:
+            out.append(re.escape(ch))
+    return "".join(out) + r"\Z"
+
+
+class AccountMatcher:
+    def __init__(self, rules: Iterable[Rule]):
+        # priority ASC → std_key → pattern 순으로 고정 (동률일 때도 결과가 매번 같도록)
+        rules = sorted(rules, key=lambda r: (r[5], r[1], r[2], r[3]))
+
+        self._exact: Dict[Tuple[str, str], Rule] = {}
+        by_scope: Dict[str, List[Tuple[str, Rule]]] = {}
+
+        for r in rules:
+            scope, std_key, match_type, pattern, pattern_raw, priority = r
+            if match_type == "EXACT":
+                self._exact.setdefault((scope, pattern), r)
+            elif match_type in ("REGEX", "LIKE"):
+                expr = like_to_regex(pattern) if match_type == "LIKE" else f".*?(?:{pattern})"
+                try:
+                    re.compile(expr)
+                except re.error as e:
+                    raise ValueError(f"account_map_rules 패턴 컴파일 실패: {r}") from e
+                by_scope.setdefault(scope, []).append((expr, r))
+            else:
+                raise ValueError(f"unknown match_type: {match_type}")
+
+        # scope별 단일 정규식: (?P<_r0>...)|(?P<_r1>...) — 앞쪽(=priority 높은) 대안이 먼저 매칭
+        self._patterns: Dict[str, Tuple[re.Pattern, List[Tuple[str, Rule]]]] = {}
+        for scope, items in by_scope.items():
+            named = [(f"_r{i}", r) for i, (_, r) in enumerate(items)]
+            expr = "|".join(f"(?P<{g}>{e})" for (g, _), (e, _) in zip(named, items))
+            self._patterns[scope] = (re.compile(expr), named)
+
+    def match(self, scope: str, label_norm: Optional[str]) -> Optional[Rule]:
+        if not label_norm:
+            return None
+
+        best = self._exact.get((scope, label_norm))
+
+        compiled = self._patterns.get(scope)
+        if compiled is not None:
+            rx, named = compiled
+            m = rx.match(label_norm)
+            if m is not None:
+                hit = next(r for g, r in named if m.group(g) is not None)
+                if best is None or hit[5] < best[5]:
+                    best = hit
+
+        return best
@@ -11,6 +11,17 @@ NBSP = "\u00A0"
 def normalize_space(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "")).strip()
 
+# label 정규화 규칙 (ACCOUNT_MAP / account_map_rules / fs_line_items.label_norm 공통)
+# SQL 쪽 정합성 검사(validate.check_label_norm_consistency)도 같은 패턴을 사용
+LABEL_NORM_PATTERN = r"[\s\.\,\-\(\)\/\[\]·•:;]+"
+_LABEL_NORM_RE = re.compile(LABEL_NORM_PATTERN)
+
+def norm_label(s: str) -> str:
+    s = "" if s is None else str(s)
+    s = s.lower()
+    s = _LABEL_NORM_RE.sub("", s)
+    return s
+
 def normalize_corp_code(x) -> str:
     if pd.isna(x):
         return ""
@@ -5,115 +5,187 @@ from __future__ import annotations
 import duckdb
 import pandas as pd
 
+from .utils.normalize import LABEL_NORM_PATTERN
+
+
+# market_data / benchmark_map QC
+# - 예전: 체크마다 full scan + DataFrame 변환(~10회) → market_data, benchmark_map 각 1회 scan(MATERIALIZED CTE)
+# - 위반만 market_qc(check_name, corp_code, year, ...)에 1행씩 저장, 반환은 check별 건수 요약
+# - only_touched=True: 마지막 seed_market_from_csv가 건드린 (corp_code, year)만 재검사 (market_seed_touched)
+#   + 더 이상 market_data / benchmark_map에 없는 key의 QC 행은 삭제
+MARKET_QC_CHECKS = [
+    "dup_market",
+    "null_required",
+    "invalid_price_shares",
+    "bad_asof_date",
+    "asof_year_mismatch",
+    "dup_map",
+    "self_benchmark",
+    "multi_benchmark",
+    "missing_bench_in_market_data",
+]
+
+# benchmark_map 행에서 나오는 check (나머지는 market_data 행)
+BENCHMARK_MAP_CHECKS = ("dup_map", "self_benchmark", "multi_benchmark", "missing_bench_in_market_data")
+
+
+def create_market_qc_table(con: duckdb.DuckDBPyConnection):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS market_qc (
+      check_name VARCHAR,
+      corp_code VARCHAR,
+      year INTEGER,
+      corp_role VARCHAR,
+      detail VARCHAR,
+      checked_at TIMESTAMP
+    );
+    """)
+
+
+def validate_market_tables(con: duckdb.DuckDBPyConnection, only_touched: bool = False) -> dict:
+    create_market_qc_table(con)
+
+    has_touched = con.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_name='market_seed_touched'"
+    ).fetchone()
+    incremental = bool(only_touched and has_touched)
+    scope = (
+        "AND (x.corp_code, x.year) IN (SELECT (corp_code, year) FROM market_seed_touched)"
+        if incremental else ""
+    )
 
-def validate_market_tables(con: duckdb.DuckDBPyConnection) -> dict:
-    out: dict = {}
-
-    out["market_data_rows"] = con.execute("SELECT COUNT(*) FROM market_data").fetchone()[0]
-    out["benchmark_map_rows"] = con.execute("SELECT COUNT(*) FROM benchmark_map").fetchone()[0]
-
-    # corp_code+year+corp_role 로 중복 체크
-    dup_market = con.execute("""
-    SELECT corp_code, year, corp_role, COUNT(*) AS cnt
-    FROM market_data
-    GROUP BY corp_code, year, corp_role
-    HAVING COUNT(*) > 1
-    ORDER BY cnt DESC
-    """).df()
-    out["dup_market"] = dup_market
-
-    dup_map = con.execute("""
-    SELECT corp_code, year, COUNT(*) AS cnt
-    FROM benchmark_map
-    GROUP BY corp_code, year
-    HAVING COUNT(*) > 1
-    ORDER BY cnt DESC
-    """).df()
-    out["dup_map"] = dup_map
-
-    # benchmark_map의 bench_corp_code는 market_data에 'benchmark' role로 존재하는지 확인하는 게 정확함
-    missing_bench = con.execute("""
-    SELECT bm.corp_code, bm.year, bm.bench_corp_code
-    FROM benchmark_map bm
-    LEFT JOIN market_data m
-      ON m.corp_code = bm.bench_corp_code
-     AND m.year = bm.year
-     AND m.corp_role = 'benchmark'
-    WHERE m.corp_code IS NULL
-    """).df()
-    out["missing_bench_in_market_data"] = missing_bench
-
-    required_cols = [
-        "corp_code", "year", "stock_code", "asof_date",
-        "stock_price", "shares_outstanding", "corp_role"
-    ]
-    null_stats = con.execute(f"""
-    SELECT
-      {", ".join([f"AVG(CASE WHEN {c} IS NULL THEN 1 ELSE 0 END) AS null_{c}" for c in required_cols])}
-    FROM market_data
-    """).df()
-    out["null_stats"] = null_stats
-
-    invalid_vals = con.execute("""
-    SELECT corp_code, year, corp_role, stock_price, shares_outstanding, asof_date
-    FROM market_data
-    WHERE stock_price IS NULL
-       OR shares_outstanding IS NULL
-       OR stock_price <= 0
-       OR shares_outstanding <= 0
-    LIMIT 50
-    """).df()
-    out["invalid_price_shares"] = invalid_vals
-
-    bad_date = con.execute("""
-    SELECT corp_code, year, corp_role, asof_date
-    FROM market_data
-    WHERE try_cast(asof_date AS DATE) IS NULL
-    LIMIT 50
-    """).df()
-    out["bad_asof_date"] = bad_date
-
-    year_mismatch = con.execute("""
-    SELECT corp_code, year, corp_role, asof_date, try_cast(asof_date AS DATE) AS asof_dt
-    FROM market_data
-    WHERE try_cast(asof_date AS DATE) IS NOT NULL
-      AND EXTRACT(YEAR FROM try_cast(asof_date AS DATE)) <> year
-    LIMIT 50
-    """).df()
-    out["asof_year_mismatch"] = year_mismatch
-
-    self_bench = con.execute("""
-    SELECT corp_code, year, bench_corp_code, benchmark_name_kr
-    FROM benchmark_map
-    WHERE corp_code = bench_corp_code
-    LIMIT 50
-    """).df()
-    out["self_benchmark"] = self_bench
-
-    bench_cnt = con.execute("""
-    SELECT corp_code, year, COUNT(DISTINCT bench_corp_code) AS bench_n
-    FROM benchmark_map
-    GROUP BY corp_code, year
-    ORDER BY bench_n DESC
-    LIMIT 20
-    """).df()
-    out["bench_cnt_top"] = bench_cnt
-
-    multi_bench = con.execute("""
-    SELECT *
-    FROM (
-      SELECT corp_code, year, COUNT(DISTINCT bench_corp_code) AS bench_n
-      FROM benchmark_map
-      GROUP BY corp_code, year
+    if incremental:
+        con.execute("""
+        DELETE FROM market_qc
+        WHERE (corp_code, year) IN (SELECT (corp_code, year) FROM market_seed_touched);
+        """)
+        # overwrite seed로 사라진 key의 QC 행 (touched에는 새 seed의 key만 있음)
+        # - market_data 기반 check는 market_data, benchmark_map 기반 check는 benchmark_map 기준
+        con.execute(f"""
+        DELETE FROM market_qc q
+        WHERE CASE
+          WHEN q.check_name IN ({", ".join(f"'{c}'" for c in BENCHMARK_MAP_CHECKS)}) THEN NOT EXISTS (
+            SELECT 1 FROM benchmark_map x
+            WHERE x.corp_code IS NOT DISTINCT FROM q.corp_code AND x.year IS NOT DISTINCT FROM q.year
+          )
+          ELSE NOT EXISTS (
+            SELECT 1 FROM market_data x
+            WHERE x.corp_code IS NOT DISTINCT FROM q.corp_code AND x.year IS NOT DISTINCT FROM q.year
+          )
+        END;
+        """)
+    else:
+        con.execute("DELETE FROM market_qc;")
+
+    # asof_date: BIGINT(yyyymmdd) 또는 날짜 문자열
+    con.execute(f"""
+    INSERT INTO market_qc
+    WITH m AS MATERIALIZED (
+      SELECT
+        x.*,
+        COALESCE(
+          try_strptime(CAST(x.asof_date AS VARCHAR), '%Y%m%d'),
+          try_cast(CAST(x.asof_date AS VARCHAR) AS TIMESTAMP)
+        )::DATE AS asof_dt,
+        COUNT(*) OVER (PARTITION BY x.corp_code, x.year, x.corp_role)        AS dup_n,
+        ROW_NUMBER() OVER (PARTITION BY x.corp_code, x.year, x.corp_role)    AS rn
+      FROM market_data x
+      WHERE TRUE {scope}
+    ),
+    b AS MATERIALIZED (
+      SELECT
+        x.*,
+        COUNT(*) OVER (PARTITION BY x.corp_code, x.year)                        AS dup_n,
+        COUNT(DISTINCT x.bench_corp_code) OVER (PARTITION BY x.corp_code, x.year) AS bench_n,
+        ROW_NUMBER() OVER (PARTITION BY x.corp_code, x.year)                    AS rn
+      FROM benchmark_map x
+      WHERE TRUE {scope}
+    ),
+    bench_market AS (
+      SELECT DISTINCT corp_code, year
+      FROM market_data
+      WHERE corp_role = 'benchmark'
+    ),
+    issues AS (
+      SELECT 'dup_market' AS check_name, corp_code, year, corp_role, 'cnt=' || dup_n AS detail
+      FROM m WHERE dup_n > 1 AND rn = 1
+
+      UNION ALL
+      SELECT 'null_required', corp_code, year, corp_role,
+        concat_ws(',',
+          CASE WHEN corp_code IS NULL THEN 'corp_code' END,
+          CASE WHEN year IS NULL THEN 'year' END,
+          CASE WHEN stock_code IS NULL THEN 'stock_code' END,
+          CASE WHEN asof_date IS NULL THEN 'asof_date' END,
+          CASE WHEN stock_price IS NULL THEN 'stock_price' END,
+          CASE WHEN shares_outstanding IS NULL THEN 'shares_outstanding' END,
+          CASE WHEN corp_role IS NULL THEN 'corp_role' END
+        )
+      FROM m
+      WHERE corp_code IS NULL OR year IS NULL OR stock_code IS NULL OR asof_date IS NULL
+         OR stock_price IS NULL OR shares_outstanding IS NULL OR corp_role IS NULL
+
+      UNION ALL
+      SELECT 'invalid_price_shares', corp_code, year, corp_role,
+        'stock_price=' || COALESCE(CAST(stock_price AS VARCHAR), 'NULL')
+        || ', shares_outstanding=' || COALESCE(CAST(shares_outstanding AS VARCHAR), 'NULL')
+      FROM m
+      WHERE stock_price IS NULL OR shares_outstanding IS NULL
+         OR stock_price <= 0 OR shares_outstanding <= 0
+
+      UNION ALL
+      SELECT 'bad_asof_date', corp_code, year, corp_role, 'asof_date=' || CAST(asof_date AS VARCHAR)
+      FROM m WHERE asof_date IS NOT NULL AND asof_dt IS NULL
+
+      UNION ALL
+      SELECT 'asof_year_mismatch', corp_code, year, corp_role, 'asof_date=' || CAST(asof_dt AS VARCHAR)
+      FROM m WHERE asof_dt IS NOT NULL AND EXTRACT(YEAR FROM asof_dt) <> year
+
+      UNION ALL
+      SELECT 'dup_map', corp_code, year, NULL, 'cnt=' || dup_n
+      FROM b WHERE dup_n > 1 AND rn = 1
+
+      UNION ALL
+      SELECT 'self_benchmark', corp_code, year, NULL, 'bench_corp_code=' || bench_corp_code
+      FROM b WHERE corp_code = bench_corp_code
+
+      UNION ALL
+      SELECT 'multi_benchmark', corp_code, year, NULL, 'bench_n=' || bench_n
+      FROM b WHERE bench_n > 1 AND rn = 1
+
+      UNION ALL
+      -- bench_corp_code는 market_data에 'benchmark' role로 있어야 함
+      SELECT 'missing_bench_in_market_data', b.corp_code, b.year, NULL, 'bench_corp_code=' || b.bench_corp_code
+      FROM b
+      LEFT JOIN bench_market bm
+        ON bm.corp_code = b.bench_corp_code
+       AND bm.year = b.year
+      WHERE bm.corp_code IS NULL
     )
-    WHERE bench_n > 1
-    LIMIT 50
-    """).df()
-    out["multi_benchmark"] = multi_bench
+    SELECT *, CURRENT_TIMESTAMP AS checked_at
+    FROM issues;
+    """)
 
+    out: dict = {}
+    out["market_data_rows"], out["benchmark_map_rows"] = con.execute("""
+      SELECT (SELECT COUNT(*) FROM market_data), (SELECT COUNT(*) FROM benchmark_map)
+    """).fetchone()
+    out["incremental"] = incremental
+    counts = dict(con.execute("SELECT check_name, COUNT(*) FROM market_qc GROUP BY 1").fetchall())
+    out["issues"] = {c: int(counts.get(c, 0)) for c in MARKET_QC_CHECKS}
     return out
 
 
+def fetch_market_qc(con: duckdb.DuckDBPyConnection, check_name: str = None, limit: int = 50) -> pd.DataFrame:
+    return con.execute("""
+      SELECT check_name, corp_code, year, corp_role, detail
+      FROM market_qc
+      WHERE (CAST(? AS VARCHAR) IS NULL OR check_name = ?)
+      ORDER BY check_name, corp_code, year, corp_role
+      LIMIT ?
+    """, [check_name, check_name, int(limit)]).df()
+
+
 def validate_ingest_report(con: duckdb.DuckDBPyConnection, report_id: str) -> dict:
     """
     ingest 결과 QC: section/table/chunk/fact/link 개수 체크.
@@ -158,6 +230,43 @@ def validate_ingest_report(con: duckdb.DuckDBPyConnection, report_id: str) -> di
     return out
 
 
+def check_label_norm_consistency(con: duckdb.DuckDBPyConnection, limit: int = 50) -> dict:
+    """
+    fs_line_items.label_norm(파이썬 norm_label로 적재) vs SQL regexp_replace 정규화 결과 비교.
+    - RE2의 \\s는 NBSP/전각공백을 포함하지 않는 등 두 엔진 규칙이 어긋날 수 있어 주기적으로 확인
+    - missing_cnt: label_norm 미적재(NULL) 행 수 → ingest.backfill_label_norm 필요
+    """
+    out: dict = {}
+
+    out["missing_cnt"] = con.execute(
+        "SELECT COUNT(*) FROM fs_line_items WHERE label_norm IS NULL"
+    ).fetchone()[0]
+
+    mismatch_sql = """
+    WITH n AS (
+      SELECT
+        line_item_id,
+        statement_type,
+        label_clean,
+        label_norm,
+        regexp_replace(lower(coalesce(label_clean, '')), ?, '', 'g') AS label_norm_sql
+      FROM fs_line_items
+      WHERE label_norm IS NOT NULL
+    )
+    SELECT *
+    FROM n
+    WHERE label_norm <> label_norm_sql
+    """
+    out["mismatch_cnt"] = con.execute(
+        f"SELECT COUNT(*) FROM ({mismatch_sql})", [LABEL_NORM_PATTERN]
+    ).fetchone()[0]
+    out["mismatch"] = con.execute(
+        f"{mismatch_sql} LIMIT ?", [LABEL_NORM_PATTERN, int(limit)]
+    ).df()
+
+    return out
+
+
 #------------------------------
 # 계산 검증 파이프라인
 #------------------------------
@@ -165,7 +274,7 @@ def validate_ingest_report(con: duckdb.DuckDBPyConnection, report_id: str) -> di
 import argparse
 import math
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 
 import duckdb
 import pandas as pd
@@ -214,150 +323,447 @@ def fetch_fact_metrics(con, corp_code: str, bsns_year: int, metrics_spec: List[s
     return con.execute(q, [corp_code, bsns_year, *metrics_spec]).df()
 
 
-def fetch_metric_catalog(con) -> pd.DataFrame:
-    return con.execute("""
-      SELECT metric_key, metric_type, unit, polarity
-      FROM metric_catalog
-    """).df()
+def fetch_peer_stats(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> pd.DataFrame:
+    # fact_metrics_peer (build_fact_metrics_peer) 중 요청 metric만
+    placeholders = ",".join(["?"] * len(metrics_spec))
+    q = f"""
+    SELECT
+      metric_key, peer_group, peer_n, pct_rank,
+      peer_median, peer_q1, peer_q3, peer_iqr, z_score
+    FROM fact_metrics_peer
+    WHERE corp_code = ?
+      AND bsns_year = ?
+      AND metric_key IN ({placeholders})
+    ORDER BY metric_key, peer_group;
+    """
+    return con.execute(q, [corp_code, bsns_year, *metrics_spec]).df()
 
 
-def fetch_ratio_requirements(con) -> pd.DataFrame:
-    return con.execute("""
-      SELECT ratio_key, item_key, role, required
-      FROM ratio_requirements
-    """).df()
+def fetch_metric_lineage(con, corp_code: str, bsns_year: int, metrics_spec: List[str]) -> pd.DataFrame:
+    # metric_lineage (fact_metrics 적재 시 함께 채워짐) 중 요청 metric만
+    placeholders = ",".join(["?"] * len(metrics_spec))
+    q = f"""
+    SELECT
+      metric_key, role, via_key, std_key, source,
+      report_id, statement_type, line_item_id, table_id, row_idx, col_idx,
+      label_clean, value_won, note_nos
+    FROM metric_lineage
+    WHERE corp_code = ?
+      AND bsns_year = ?
+      AND metric_key IN ({placeholders})
+    ORDER BY metric_key, role, std_key, table_id, row_idx, col_idx;
+    """
+    return con.execute(q, [corp_code, bsns_year, *metrics_spec]).df()
 
 
-def fetch_value_augmented(con, corp_code: str, bsns_year: int) -> pd.DataFrame:
-    # ratio 검증용 원천값 로드
+def fetch_metric_catalog(con) -> pd.DataFrame:
     return con.execute("""
-      SELECT std_key, value_won
-      FROM v_value_augmented
-      WHERE corp_code = ?
-        AND bsns_year = ?
-    """, [corp_code, bsns_year]).df()
-
-
-def recompute_yoy(value: Optional[float], value_prev: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
-    if value is None:
-        return None, None
-    if value_prev is None:
-        return None, None
-    yoy_abs = value - value_prev
-    if value_prev == 0:
-        yoy_pct = None
-    else:
-        yoy_pct = (value - value_prev) / abs(value_prev)
-    return yoy_abs, yoy_pct
+      SELECT metric_key, metric_type, unit, polarity
+      FROM metric_catalog
+    """).df()
 
 
-def validate_raw_rows(df: pd.DataFrame) -> List[CheckResult]:
-    results: List[CheckResult] = []
-    raw_df = df[df["metric_type"] == "raw"].copy()
+#------------------------------
+# SQL 검증 엔진 (validation_results)
+#------------------------------
+# raw yoy 재계산 / ratio 재계산(ratio_requirements) / required 입력 NULL 규칙 / 범위 경고를
+# fact_metrics 전체에 대해 set-based SQL 1회로 계산 → validation_results 테이블
+# - 범위: corp_code / bsns_year / metric_keys (None이면 전체) → 매핑룰 변경 후 전 기업 QC 가능
+# - ratio 입력값: v_value_augmented를 (corp, year, std_key)로 dedup (fact_metrics 적재와 같은 규칙)
+
+ASSET_LIKE_KEYS = ("TOTAL_ASSETS", "CURRENT_ASSETS", "NON_CURRENT_ASSETS", "CASH_EQ")
+RANGE_WARN_RATIOS = ("roe", "roa", "net_margin")
+
+
+def create_validation_results_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS validation_results (
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      metric_key VARCHAR,
+      check_name VARCHAR,
+      level VARCHAR,           -- PASS / WARN / FAIL
+      message VARCHAR,
+      db_value DOUBLE,
+      expected_value DOUBLE,
+      checked_at TIMESTAMP
+    );
+    """)
+
+
+def _close_sql(a: str, b: str, eps: float = EPS) -> str:
+    """is_close()의 SQL 버전 (둘 다 NULL이면 TRUE, 하나만 NULL이면 FALSE)"""
+    return (
+        f"COALESCE(({a} IS NULL AND {b} IS NULL) "
+        f"OR abs({a} - {b}) <= {eps} "
+        f"OR abs({a} - {b}) <= {eps} * greatest(1.0, abs({a}), abs({b})), FALSE)"
+    )
 
-    for _, r in raw_df.iterrows():
-        key = r["metric_key"]
-        value = to_py_float(r["value"])
-        prev = to_py_float(r["value_prev"])
-        yoy_abs = to_py_float(r["yoy_abs"])
-        yoy_pct = to_py_float(r["yoy_pct"])
 
-        exp_abs, exp_pct = recompute_yoy(value, prev)
+def _str_sql(x: str) -> str:
+    return f"COALESCE(CAST({x} AS VARCHAR), 'None')"
 
-        if not is_close(yoy_abs, exp_abs):
-            results.append(CheckResult("FAIL", key, f"[raw] yoy_abs mismatch: db={yoy_abs} expected={exp_abs}"))
-        else:
-            results.append(CheckResult("PASS", key, f"[raw] yoy_abs OK"))
 
-        if not is_close(yoy_pct, exp_pct):
-            results.append(CheckResult("FAIL", key, f"[raw] yoy_pct mismatch: db={yoy_pct} expected={exp_pct}"))
-        else:
-            results.append(CheckResult("PASS", key, f"[raw] yoy_pct OK"))
-
-        # 상식검증(옵션)
-        if key in ("TOTAL_ASSETS", "CURRENT_ASSETS", "NON_CURRENT_ASSETS", "CASH_EQ") and value is not None and value < 0:
-            results.append(CheckResult("WARN", key, f"[raw] value is negative for asset-like metric: {value}"))
-
-    return results
+def run_sql_validation(
+    con,
+    corp_code: Optional[str] = None,
+    bsns_year: Optional[int] = None,
+    metric_keys: Optional[List[str]] = None,
+) -> dict:
+    """
+    범위(corp_code/bsns_year/metric_keys, None = 전체)의 validation_results를 DELETE 후 재계산.
+    반환: {"PASS": n, "WARN": n, "FAIL": n}
+    """
+    create_validation_results_table(con)
 
+    scope_sql = """
+      (CAST(? AS VARCHAR) IS NULL OR corp_code = ?)
+      AND (CAST(? AS INTEGER) IS NULL OR bsns_year = ?)
+      AND (CAST(? AS VARCHAR[]) IS NULL OR metric_key IN (SELECT UNNEST(?)))
+    """
+    params = [corp_code, corp_code, bsns_year, bsns_year, metric_keys, metric_keys]
+
+    con.execute(f"DELETE FROM validation_results WHERE {scope_sql};", params)
+
+    asset_keys = ", ".join(f"'{k}'" for k in ASSET_LIKE_KEYS)
+    range_keys = ", ".join(f"'{k}'" for k in RANGE_WARN_RATIOS)
+    con.execute(f"""
+    INSERT INTO validation_results
+    WITH f AS (
+      SELECT *
+      FROM fact_metrics
+      WHERE {scope_sql}
+    ),
+    raw AS (
+      SELECT
+        corp_code, bsns_year, metric_key, value, yoy_abs, yoy_pct,
+        CASE WHEN value IS NULL OR value_prev IS NULL THEN NULL
+             ELSE value - value_prev END AS exp_abs,
+        CASE WHEN value IS NULL OR value_prev IS NULL OR value_prev = 0 THEN NULL
+             ELSE (value - value_prev) / abs(value_prev) END AS exp_pct
+      FROM f
+      WHERE metric_type = 'raw'
+    ),
+    vals AS (
+      SELECT x.corp_code, x.bsns_year, x.std_key, x.value_won
+      FROM v_value_augmented x
+      JOIN (SELECT DISTINCT corp_code, bsns_year FROM f WHERE metric_type = 'ratio') s
+        ON s.corp_code = x.corp_code
+       AND s.bsns_year = x.bsns_year
+      QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY x.corp_code, x.bsns_year, x.std_key
+        ORDER BY (x.value_won IS NOT NULL) DESC, abs(x.value_won) DESC, x.report_id DESC
+      ) = 1
+    ),
+    ratio_in AS (
+      SELECT
+        f.corp_code, f.bsns_year, f.metric_key, f.value,
+        COUNT(rq.ratio_key) AS n_req,
+        COALESCE(
+          list(rq.item_key ORDER BY rq.item_key) FILTER (WHERE rq.required AND v.value_won IS NULL),
+          []
+        ) AS missing,
+        COALESCE(SUM(CASE
+          WHEN rq.role IN ('numerator', 'add') THEN v.value_won
+          WHEN rq.role = 'subtract'            THEN -v.value_won
+        END), 0) AS num,
+        COALESCE(SUM(CASE WHEN rq.role = 'denominator' THEN v.value_won END), 0) AS den
+      FROM f
+      LEFT JOIN ratio_requirements rq
+        ON rq.ratio_key = f.metric_key
+      LEFT JOIN vals v
+        ON v.corp_code = f.corp_code
+       AND v.bsns_year = f.bsns_year
+       AND v.std_key   = rq.item_key
+      WHERE f.metric_type = 'ratio'
+      GROUP BY 1, 2, 3, 4
+    ),
+    ratio AS (
+      SELECT *, CASE WHEN den <> 0 THEN num / den END AS exp_ratio
+      FROM ratio_in
+    ),
+    checks AS (
+      SELECT corp_code, bsns_year, metric_key, 'raw_yoy_abs' AS check_name,
+        CASE WHEN {_close_sql("yoy_abs", "exp_abs")} THEN 'PASS' ELSE 'FAIL' END AS level,
+        CASE WHEN {_close_sql("yoy_abs", "exp_abs")} THEN '[raw] yoy_abs OK'
+             ELSE '[raw] yoy_abs mismatch: db=' || {_str_sql("yoy_abs")} || ' expected=' || {_str_sql("exp_abs")} END AS message,
+        yoy_abs AS db_value, exp_abs AS expected_value
+      FROM raw
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'raw_yoy_pct',
+        CASE WHEN {_close_sql("yoy_pct", "exp_pct")} THEN 'PASS' ELSE 'FAIL' END,
+        CASE WHEN {_close_sql("yoy_pct", "exp_pct")} THEN '[raw] yoy_pct OK'
+             ELSE '[raw] yoy_pct mismatch: db=' || {_str_sql("yoy_pct")} || ' expected=' || {_str_sql("exp_pct")} END,
+        yoy_pct, exp_pct
+      FROM raw
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'raw_negative_asset', 'WARN',
+        '[raw] value is negative for asset-like metric: ' || {_str_sql("value")},
+        value, NULL
+      FROM raw
+      WHERE metric_key IN ({asset_keys}) AND value < 0
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'ratio_requirements', 'FAIL',
+        '[ratio] ratio_requirements missing for ' || metric_key,
+        value, NULL
+      FROM ratio
+      WHERE n_req = 0
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'ratio_required_null',
+        CASE WHEN value IS NULL THEN 'PASS' ELSE 'FAIL' END,
+        CASE WHEN value IS NULL THEN '[ratio] correctly NULL (missing required=' || {_str_sql("missing")} || ')'
+             ELSE '[ratio] should be NULL but has value. missing=' || {_str_sql("missing")} END,
+        value, NULL
+      FROM ratio
+      WHERE n_req > 0 AND len(missing) > 0
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'ratio_recompute',
+        CASE WHEN {_close_sql("value", "exp_ratio")} THEN 'PASS' ELSE 'FAIL' END,
+        CASE WHEN {_close_sql("value", "exp_ratio")} THEN '[ratio] ratio OK'
+             ELSE '[ratio] ratio mismatch: db=' || {_str_sql("value")} || ' expected=' || {_str_sql("exp_ratio")}
+                  || ' (num=' || {_str_sql("num")} || ', den=' || {_str_sql("den")} || ')' END,
+        value, exp_ratio
+      FROM ratio
+      WHERE n_req > 0 AND len(missing) = 0
+
+      UNION ALL
+      SELECT corp_code, bsns_year, metric_key, 'ratio_range', 'WARN',
+        '[ratio] unusually large ratio (>|5|): ' || {_str_sql("exp_ratio")},
+        value, exp_ratio
+      FROM ratio
+      WHERE n_req > 0 AND len(missing) = 0
+        AND metric_key IN ({range_keys}) AND abs(exp_ratio) > 5
+    )
+    SELECT *, CURRENT_TIMESTAMP AS checked_at
+    FROM checks;
+    """, params)
 
-def validate_ratio_rows(
-    df_fact: pd.DataFrame,
-    ratio_req: pd.DataFrame,
-    value_aug: pd.DataFrame,
+    summary = {"PASS": 0, "WARN": 0, "FAIL": 0}
+    for level, n in con.execute(
+        f"SELECT level, COUNT(*) FROM validation_results WHERE {scope_sql} GROUP BY 1", params
+    ).fetchall():
+        summary[level] = int(n)
+    return summary
+
+
+def fetch_validation_results(
+    con,
+    corp_code: Optional[str] = None,
+    bsns_year: Optional[int] = None,
+    metric_keys: Optional[List[str]] = None,
 ) -> List[CheckResult]:
-    results: List[CheckResult] = []
-    ratio_df = df_fact[df_fact["metric_type"] == "ratio"].copy()
-    if ratio_df.empty:
-        return results
+    rows = con.execute("""
+      SELECT level, metric_key, message
+      FROM validation_results
+      WHERE (CAST(? AS VARCHAR) IS NULL OR corp_code = ?)
+        AND (CAST(? AS INTEGER) IS NULL OR bsns_year = ?)
+        AND (CAST(? AS VARCHAR[]) IS NULL OR metric_key IN (SELECT UNNEST(?)))
+      ORDER BY corp_code, bsns_year, metric_key, check_name
+    """, [corp_code, corp_code, bsns_year, bsns_year, metric_keys, metric_keys]).fetchall()
+    return [CheckResult(level, metric_key, message) for (level, metric_key, message) in rows]
 
-    # std_key -> value_won map
-    val_map = {row["std_key"]: to_py_float(row["value_won"]) for _, row in value_aug.iterrows()}
 
-    # ratio_requirements를 ratio_key별로 묶어서 numerator/denominator 재구성
-    grouped = ratio_req.groupby("ratio_key")
+#------------------------------
+# 회계 항등식 QC (accounting_qc)
+#------------------------------
+# report × fiscal_year 단위로 BS/IS/CF 항등식을 SQL 1회로 검사 → 파싱 오류 report를 LLM 전에 걸러냄
+# - 입력: v_fin_long_mapped (v_summary_all_years와 같은 max_by(abs) 선택, 단 report_id/unit_multiplier 유지)
+# - 허용오차: 항 개수 × unit_multiplier (표시 단위 반올림) + rel_tol × max(|lhs|, |rhs|)
+# - 입력 항목이 하나라도 없으면 해당 항등식은 건너뜀 (검사 수에 포함하지 않음)
+
+# (identity, lhs 항, rhs 항, rel_tol) / 항 = (부호, std_key, lag 연도)
+ACCOUNTING_IDENTITIES = [
+    ("BS_TOTAL",        [(1, "TOTAL_ASSETS", 0)],      [(1, "TOTAL_LIABILITIES", 0), (1, "EQUITY", 0)],                0.0),
+    ("BS_ASSETS_SPLIT", [(1, "TOTAL_ASSETS", 0)],      [(1, "CURRENT_ASSETS", 0), (1, "NON_CURRENT_ASSETS", 0)],       0.0),
+    ("BS_LIAB_SPLIT",   [(1, "TOTAL_LIABILITIES", 0)], [(1, "CURRENT_LIABILITIES", 0), (1, "NON_CURRENT_LIABILITIES", 0)], 0.0),
+    ("IS_GROSS_PROFIT", [(1, "GROSS_PROFIT", 0)],      [(1, "REVENUE", 0), (-1, "COGS", 0)],                           0.0),
+    # 환율변동효과 등 별도 라인이 있어 현금 증감과 정확히 같지 않음 → 상대 허용오차
+    ("CF_CASH_CHANGE",  [(1, "OCF", 0), (1, "ICF", 0), (1, "FCF_FIN", 0)], [(1, "CASH_EQ", 0), (-1, "CASH_EQ", 1)],  0.05),
+]
+
+
+def _identity_col(key: str, lag: int) -> str:
+    return f'"{key}"' if lag == 0 else f'"{key}@{lag}"'
+
+
+def _identity_sum(terms) -> str:
+    expr = ""
+    for i, (sign, key, lag) in enumerate(terms):
+        op = ("" if sign > 0 else "-") if i == 0 else (" + " if sign > 0 else " - ")
+        expr += f"{op}{_identity_col(key, lag)}"
+    return f"CAST({expr} AS DOUBLE)"
+
+
+def create_accounting_qc_tables(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS accounting_qc (
+      report_id VARCHAR,
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      fiscal_year INTEGER,
+      identity VARCHAR,
+      lhs DOUBLE,
+      rhs DOUBLE,
+      diff DOUBLE,
+      tol DOUBLE,
+      rel_err DOUBLE,          -- |diff| / max(|lhs|, |rhs|, tol)
+      is_violation BOOLEAN,
+      checked_at TIMESTAMP
+    );
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS accounting_qc_report (
+      report_id VARCHAR PRIMARY KEY,
+      corp_code VARCHAR,
+      bsns_year INTEGER,
+      n_checks INTEGER,
+      n_violations INTEGER,
+      violation_score DOUBLE,  -- 위반 항등식 중 최대 rel_err (위반 없으면 0)
+      worst_identity VARCHAR,
+      checked_at TIMESTAMP
+    );
+    """)
+
+
+def run_accounting_qc(con, report_ids: Optional[List[str]] = None) -> dict:
+    """
+    report_ids(None = 전체 report)의 accounting_qc / accounting_qc_report를 DELETE 후 재계산.
+    반환: {"reports": n, "checks": n, "violations": n, "flagged_reports": n}
+    """
+    create_accounting_qc_tables(con)
 
-    for _, r in ratio_df.iterrows():
-        ratio_key = r["metric_key"]
-        db_ratio = to_py_float(r["value"])
+    scope_sql = "(CAST(? AS VARCHAR[]) IS NULL OR report_id IN (SELECT UNNEST(?)))"
+    params = [report_ids, report_ids]
 
-        if ratio_key not in grouped.groups:
-            results.append(CheckResult("FAIL", ratio_key, f"[ratio] ratio_requirements missing for {ratio_key}"))
-            continue
+    keys = sorted({k for _, lhs, rhs, _ in ACCOUNTING_IDENTITIES for _, k, _ in lhs + rhs})
+    lagged = sorted({(k, lag) for _, lhs, rhs, _ in ACCOUNTING_IDENTITIES for _, k, lag in lhs + rhs if lag})
 
-        req_rows = ratio_req[ratio_req["ratio_key"] == ratio_key]
-
-        # required 체크
-        required_items = req_rows[req_rows["required"] == True]
-        missing_required = []
-        for _, rr in required_items.iterrows():
-            item = rr["item_key"]
-            if val_map.get(item) is None:
-                missing_required.append(item)
-
-        if missing_required:
-            # DB ratio가 NULL이면 정상(계산불가), NULL이 아니면 문제
-            if db_ratio is not None:
-                results.append(CheckResult("FAIL", ratio_key, f"[ratio] should be NULL but has value. missing={missing_required}"))
-            else:
-                results.append(CheckResult("PASS", ratio_key, f"[ratio] correctly NULL (missing required={missing_required})"))
-            continue
+    pivot = ",\n        ".join(f"MAX(val) FILTER (WHERE std_key='{k}') AS \"{k}\"" for k in keys)
+    lag_cols = "".join(
+        f",\n        p{lag}.\"{k}\" AS {_identity_col(k, lag)}" for k, lag in lagged
+    )
+    lag_joins = "".join(
+        f"""
+      LEFT JOIN wide p{lag}
+        ON p{lag}.report_id = c.report_id
+       AND p{lag}.fiscal_year = c.fiscal_year - {lag}"""
+        for lag in sorted({lag for _, lag in lagged})
+    )
 
-        # numerator/denominator 구성
-        num = 0.0
-        den = 0.0
-
-        for _, rr in req_rows.iterrows():
-            item = rr["item_key"]
-            role = rr["role"]
-            v = val_map.get(item)
-
-            if v is None:
-                continue
-
-            if role == "numerator":
-                num += v
-            elif role == "denominator":
-                den += v
-            elif role == "add":
-                num += v
-            elif role == "subtract":
-                num -= v
-
-        exp_ratio = None
-        if den is not None and den != 0:
-            exp_ratio = num / den
-
-        if not is_close(db_ratio, exp_ratio):
-            results.append(CheckResult("FAIL", ratio_key, f"[ratio] ratio mismatch: db={db_ratio} expected={exp_ratio} (num={num}, den={den})"))
-        else:
-            results.append(CheckResult("PASS", ratio_key, f"[ratio] ratio OK"))
+    rows = []
+    for name, lhs, rhs, rel_tol in ACCOUNTING_IDENTITIES:
+        terms = lhs + rhs
+        complete = " AND ".join(f"{_identity_col(k, lag)} IS NOT NULL" for _, k, lag in terms)
+        rows.append(
+            "{"
+            f"'identity': '{name}', "
+            f"'lhs': {_identity_sum(lhs)}, "
+            f"'rhs': {_identity_sum(rhs)}, "
+            f"'n_terms': {len(terms)}, "
+            f"'rel_tol': CAST({rel_tol} AS DOUBLE), "
+            f"'complete': ({complete})"
+            "}"
+        )
+    identity_rows = ",\n          ".join(rows)
+
+    con.execute(f"DELETE FROM accounting_qc WHERE {scope_sql};", params)
+    con.execute(f"DELETE FROM accounting_qc_report WHERE {scope_sql};", params)
+
+    con.execute(f"""
+    INSERT INTO accounting_qc
+    WITH picked AS (
+      SELECT
+        report_id, corp_code, bsns_year, fiscal_year, std_key,
+        max_by(value_won, abs(value_won)) AS val,
+        MAX(unit_multiplier)              AS unit
+      FROM v_fin_long_mapped
+      WHERE std_key IN ({", ".join(f"'{k}'" for k in keys)})
+        AND {scope_sql}
+      GROUP BY 1, 2, 3, 4, 5
+    ),
+    wide AS (
+      SELECT
+        report_id, corp_code, bsns_year, fiscal_year,
+        COALESCE(MAX(unit), 1) AS unit,
+        {pivot}
+      FROM picked
+      GROUP BY 1, 2, 3, 4
+    ),
+    wide_lag AS (
+      SELECT c.*{lag_cols}
+      FROM wide c{lag_joins}
+    ),
+    ids AS (
+      SELECT
+        report_id, corp_code, bsns_year, fiscal_year, unit,
+        UNNEST([
+          {identity_rows}
+        ]) AS r
+      FROM wide_lag
+    ),
+    checked AS (
+      SELECT
+        report_id, corp_code, bsns_year, fiscal_year,
+        r.identity,
+        r.lhs,
+        r.rhs,
+        r.lhs - r.rhs AS diff,
+        r.n_terms * unit + r.rel_tol * greatest(abs(r.lhs), abs(r.rhs)) AS tol
+      FROM ids
+      WHERE r.complete
+    )
+    SELECT
+      report_id, corp_code, bsns_year, fiscal_year, identity,
+      lhs, rhs, diff, tol,
+      abs(diff) / greatest(abs(lhs), abs(rhs), tol) AS rel_err,
+      abs(diff) > tol AS is_violation,
+      CURRENT_TIMESTAMP AS checked_at
+    FROM checked;
+    """, params)
+
+    con.execute(f"""
+    INSERT INTO accounting_qc_report
+    SELECT
+      report_id,
+      MIN(corp_code),
+      MIN(bsns_year),
+      COUNT(*) AS n_checks,
+      COUNT(*) FILTER (WHERE is_violation) AS n_violations,
+      COALESCE(MAX(rel_err) FILTER (WHERE is_violation), 0) AS violation_score,
+      arg_max(identity || '@' || fiscal_year, rel_err) FILTER (WHERE is_violation) AS worst_identity,
+      CURRENT_TIMESTAMP
+    FROM accounting_qc
+    WHERE {scope_sql}
+    GROUP BY report_id;
+    """, params)
+
+    n_reports, n_checks, n_viol, n_flagged = con.execute(f"""
+      SELECT COUNT(*), COALESCE(SUM(n_checks), 0), COALESCE(SUM(n_violations), 0),
+             COUNT(*) FILTER (WHERE n_violations > 0)
+      FROM accounting_qc_report
+      WHERE {scope_sql}
+    """, params).fetchone()
+    return {
+        "reports": int(n_reports),
+        "checks": int(n_checks),
+        "violations": int(n_viol),
+        "flagged_reports": int(n_flagged),
+    }
 
-        # 범위 경고(옵션)
-        if exp_ratio is not None and ratio_key in ("roe", "roa", "net_margin") and abs(exp_ratio) > 5:
-            results.append(CheckResult("WARN", ratio_key, f"[ratio] unusually large ratio (>|5|): {exp_ratio}"))
 
-    return results
+def fetch_accounting_violations(con, report_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    return con.execute("""
+      SELECT report_id, corp_code, bsns_year, fiscal_year, identity, lhs, rhs, diff, tol, rel_err
+      FROM accounting_qc
+      WHERE is_violation
+        AND (CAST(? AS VARCHAR[]) IS NULL OR report_id IN (SELECT UNNEST(?)))
+      ORDER BY rel_err DESC, report_id, fiscal_year, identity
+    """, [report_ids, report_ids]).df()
 
 
 def validate_coverage(df: pd.DataFrame, metrics_spec: List[str]) -> List[CheckResult]:
@@ -412,24 +818,25 @@ def validate_catalog_alignment(df: pd.DataFrame, catalog: pd.DataFrame) -> List[
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--db", required=True, help="duckdb file path (e.g., pipeline.duckdb)")
-    ap.add_argument("--corp_code", required=True)
-    ap.add_argument("--bsns_year", type=int, required=True)
-    ap.add_argument("--metrics_spec", nargs="+", required=True, help="metric keys list")
+    ap.add_argument("--corp_code", default=None, help="omit to validate every corp in fact_metrics")
+    ap.add_argument("--bsns_year", type=int, default=None)
+    ap.add_argument("--metrics_spec", nargs="+", default=None, help="metric keys list (omit = all loaded metrics)")
     ap.add_argument("--out", default="validation_report.json")
     args = ap.parse_args()
 
     con = duckdb.connect(args.db, read_only=False)
 
-    df = fetch_fact_metrics(con, args.corp_code, args.bsns_year, args.metrics_spec)
-    catalog = fetch_metric_catalog(con)
-    ratio_req = fetch_ratio_requirements(con)
-    value_aug = fetch_value_augmented(con, args.corp_code, args.bsns_year)
+    # raw/ratio 검증은 SQL 1회 (validation_results), 범위가 비어 있으면 전체 기업
+    run_sql_validation(con, args.corp_code, args.bsns_year, args.metrics_spec)
 
     checks: List[CheckResult] = []
-    checks += validate_coverage(df, args.metrics_spec)
-    checks += validate_catalog_alignment(df, catalog)
-    checks += validate_raw_rows(df)
-    checks += validate_ratio_rows(df, ratio_req, value_aug)
+    single = args.corp_code is not None and args.bsns_year is not None and args.metrics_spec
+    if single:
+        df = fetch_fact_metrics(con, args.corp_code, args.bsns_year, args.metrics_spec)
+        catalog = fetch_metric_catalog(con)
+        checks += validate_coverage(df, args.metrics_spec)
+        checks += validate_catalog_alignment(df, catalog)
+    checks += fetch_validation_results(con, args.corp_code, args.bsns_year, args.metrics_spec)
 
     # 요약
     summary = {"PASS": 0, "WARN": 0, "FAIL": 0}
@@ -446,6 +853,33 @@ def main():
             for c in checks
         ],
     }
+    if not single:
+        # 전체 QC: 기업·연도별 FAIL/WARN 집계
+        report["by_pair"] = con.execute("""
+          SELECT corp_code, bsns_year,
+                 COUNT(*) FILTER (WHERE level = 'FAIL') AS fail,
+                 COUNT(*) FILTER (WHERE level = 'WARN') AS warn
+          FROM validation_results
+          WHERE (CAST(? AS VARCHAR) IS NULL OR corp_code = ?)
+            AND (CAST(? AS INTEGER) IS NULL OR bsns_year = ?)
+          GROUP BY 1, 2
+          HAVING fail > 0 OR warn > 0
+          ORDER BY fail DESC, warn DESC, 1, 2
+        """, [args.corp_code, args.corp_code, args.bsns_year, args.bsns_year]).df().to_dict("records")
+
+    if args.corp_code is None:
+        # 전체 QC: 회계 항등식 위반 점수 상위 report
+        acc = run_accounting_qc(con)
+        report["accounting"] = acc
+        report["accounting_top"] = con.execute("""
+          SELECT report_id, corp_code, bsns_year, n_checks, n_violations, violation_score, worst_identity
+          FROM accounting_qc_report
+          WHERE n_violations > 0
+          ORDER BY violation_score DESC
+          LIMIT 50
+        """).df().to_dict("records")
+        print("=== ACCOUNTING IDENTITY QC ===")
+        print(acc)
 
     import json
     with open(args.out, "w", encoding="utf-8") as f:
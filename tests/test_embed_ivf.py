@@ -0,0 +1,196 @@
+# tests/test_embed_ivf.py
+# IVF 계열 index의 remove_ids 회귀 테스트
+# - IVF는 IDMap2 없이 IVF 자체 id를 쓰므로 remove 후에도 검색 결과 vec_id가 맞아야 하고, 두 번째 remove도 가능해야 함
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from src.embed import create_index, index_kind_of, _index_ids
+
+IVF_KINDS = ("ivf_flat", "ivf_sq8", "ivf_pq")
+DIM = 32
+
+
+def _vectors(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, DIM)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    # vec_id는 chunk_id_to_int64처럼 부호 있는 64bit hash
+    ids = rng.choice(np.arange(-(1 << 40), 1 << 40, 7919, dtype=np.int64), size=n, replace=False)
+    return x, ids
+
+
+@pytest.mark.parametrize("kind", IVF_KINDS)
+def test_ivf_remove_search_remove(kind):
+    n = 10_000  # ivf_pq가 ivf_flat으로 내려가지 않는 크기
+    x, ids = _vectors(n)
+    index = create_index(kind, DIM, n, x)
+    index.add_with_ids(x, ids)
+    assert index_kind_of(index) == kind
+    assert not hasattr(index, "id_map")
+
+    index.remove_ids(ids[:100])
+    assert index.ntotal == n - 100
+    assert set(_index_ids(index).tolist()) == set(ids[100:].tolist())
+
+    index.nprobe = index.nlist
+    _, I = index.search(x[100:300], 1)
+    hit = (I[:, 0] == ids[100:300]).mean()
+    assert hit >= (0.99 if kind != "ivf_pq" else 0.5)
+    assert not np.isin(I, ids[:100]).any()
+
+    index.remove_ids(ids[100:200])
+    assert index.ntotal == n - 200
+    assert set(_index_ids(index).tolist()) == set(ids[200:].tolist())
+
+
+# ------------------------------------------------------------
+# DB 경로: delete_report → 재-ingest → update (_drop_stale_ids remove + compaction remove)
+# ------------------------------------------------------------
+import duckdb
+
+from src import embed
+from src.encoders import Encoder
+from src.ingest import delete_report, init_db
+from src.utils.ids import sha1_hex, stable_id
+
+
+class HashEncoder(Encoder):
+    """텍스트 sha1로 시드한 결정적 벡터 (모델 로드 없이 index 동작만 검증)"""
+    backend = "hash"
+
+    @property
+    def dim(self) -> int:
+        return DIM
+
+    def _encode_batch(self, texts):
+        return np.stack([
+            np.random.default_rng(int(sha1_hex(t)[:15], 16)).standard_normal(DIM).astype(np.float32)
+            for t in texts
+        ])
+
+
+def _ingest_chunks(con, report_id: str, n: int = 100) -> None:
+    con.execute("INSERT OR IGNORE INTO reports (report_id) VALUES (?)", [report_id])
+    con.executemany(
+        "INSERT OR REPLACE INTO rag_text_chunks (chunk_id, report_id, section_code, chunk_idx, text_for_embed) VALUES (?, ?, 'S', ?, ?)",
+        [(stable_id(report_id, str(i)), report_id, i, f"{report_id} 본문 {i}") for i in range(n)],
+    )
+
+
+def _assert_consistent(con, index_path):
+    out = embed.check_faiss_consistency(con, index_path, "m")
+    assert (out["missing_in_index"], out["orphan_in_index"], out["tombstoned"], out["duplicate_ids"]) == (0, 0, 0, 0)
+
+
+@pytest.mark.parametrize("kind", IVF_KINDS)
+def test_ivf_delete_reingest_compact(tmp_path, kind):
+    con = duckdb.connect()
+    init_db(con)
+    for r in ("R0", "R1", "R2", "R3", "R4"):
+        _ingest_chunks(con, r)
+    index_path = str(tmp_path / "text.index")
+    enc = HashEncoder("m")
+
+    embed.build_or_update_faiss_from_db(con, index_path, "m", rebuild=True, index_kind=kind, encoder=enc)
+    assert embed.index_kind_of(faiss.read_index(index_path)) in (kind, "ivf_flat")
+
+    delete_report(con, "R0")
+    delete_report(con, "R1")
+    _ingest_chunks(con, "R0")
+    # R0: 재연결된 id remove (_drop_stale_ids) → R1 tombstone remove (maybe_compact)
+    embed.build_or_update_faiss_from_db(con, index_path, "m", encoder=enc)
+
+    index = faiss.read_index(index_path)
+    assert index.ntotal == 400
+    _assert_consistent(con, index_path)
+
+    # index 경로(IDSelector) 검색 결과가 저장 벡터 정확 검색과 같아야 함
+    q = enc.encode(["R0 본문 7"])[0]
+    exact = embed.search_reports(con, q, ["R0"], "m", k=5)
+    via_index = embed.search_reports(con, q, ["R0"], "m", k=5, index=index, nprobe=index.nlist, exact_max=0)
+    assert [c for c, _ in via_index][:1] == [c for c, _ in exact][:1] == [stable_id("R0", "7")]
+
+    # 한 번 더 삭제 + consistency fix (세 번째 remove)
+    delete_report(con, "R2")
+    out = embed.check_faiss_consistency(con, index_path, "m", fix=True)
+    assert out["fixed"] and out["index_ntotal"] == 300
+    _assert_consistent(con, index_path)
+
+
+def test_legacy_idmap_ivf_is_rebuilt_not_removed(tmp_path):
+    """예전 형식(IDMap2,IVF…) 파일은 remove 대신 같은 종류로 재구성"""
+    con = duckdb.connect()
+    init_db(con)
+    for r in ("R0", "R1", "R2", "R3"):
+        _ingest_chunks(con, r)
+    index_path = str(tmp_path / "text.index")
+    enc = HashEncoder("m")
+    embed.build_or_update_faiss_from_db(con, index_path, "m", rebuild=True, index_kind="ivf_flat", encoder=enc)
+
+    # 같은 벡터로 IDMap2,IVF 파일을 만들어 덮어씀
+    ids, x = zip(*embed.iter_stored_vectors(con, "m"))
+    ids, x = np.concatenate(ids), np.concatenate(x)
+    legacy = faiss.index_factory(DIM, "IDMap2,IVF8,Flat", faiss.METRIC_INNER_PRODUCT)
+    legacy.train(x)
+    legacy.add_with_ids(x, ids)
+    faiss.write_index(legacy, index_path)
+
+    delete_report(con, "R0")
+    embed.build_or_update_faiss_from_db(con, index_path, "m", compact_ratio=0.0, encoder=enc)
+    delete_report(con, "R1")
+    embed.build_or_update_faiss_from_db(con, index_path, "m", compact_ratio=0.0, encoder=enc)
+
+    index = faiss.read_index(index_path)
+    assert embed.index_kind_of(index) == "ivf_flat" and not hasattr(index, "id_map")
+    assert index.ntotal == 200
+    _assert_consistent(con, index_path)
+
+
+# ------------------------------------------------------------
+# 주석 표 row index: delete_report / 재-ingest 후 update
+# ------------------------------------------------------------
+def _ingest_notes_table(con, report_id: str, n_rows: int = 100) -> None:
+    sid, tid = f"{report_id}-s", f"{report_id}-t"
+    con.execute("INSERT OR IGNORE INTO reports (report_id) VALUES (?)", [report_id])
+    con.execute(
+        "INSERT OR REPLACE INTO report_sections (section_id, report_id, section_type, section_code, note_no, title_ko) "
+        "VALUES (?, ?, 'notes', 'N7', 7, '매출채권')", [sid, report_id])
+    con.execute("INSERT OR REPLACE INTO rag_tables (table_id, section_id, table_title) VALUES (?, ?, '매출채권 내역')", [tid, sid])
+    con.execute("INSERT OR REPLACE INTO rag_table_cols VALUES (?, 0, NULL, '구분', NULL, NULL), (?, 1, NULL, '당기말', NULL, NULL)", [tid, tid])
+    con.executemany("INSERT OR REPLACE INTO rag_table_rows (table_id, row_idx, label_ko, parent_row_idx) VALUES (?, ?, ?, NULL)",
+                    [(tid, i, f"{report_id} 항목{i}") for i in range(n_rows)])
+    con.executemany("INSERT OR REPLACE INTO rag_table_cells (table_id, row_idx, col_idx, text_value, num_value) VALUES (?, ?, ?, ?, ?)",
+                    [c for i in range(n_rows) for c in ((tid, i, 0, f"{report_id} 항목{i}", None), (tid, i, 1, f"{i * 10:,}", i * 10))])
+
+
+@pytest.mark.parametrize("kind", ("ivf_flat", "ivf_sq8"))
+def test_table_row_ivf_update_after_delete_report(tmp_path, kind):
+    con = duckdb.connect()
+    init_db(con)
+    for r in ("R0", "R1", "R2", "R3", "R4"):
+        _ingest_notes_table(con, r)
+    index_path = str(tmp_path / "rows.index")
+    enc = HashEncoder("m")
+    embed.build_or_update_table_row_faiss(con, index_path, "m", rebuild=True, index_kind=kind, encoder=enc)
+    assert embed.index_kind_of(faiss.read_index(index_path)) == kind
+
+    # 삭제 → update (1번째 remove), 삭제 + 재-ingest → update (2번째 remove)
+    delete_report(con, "R0")
+    embed.build_or_update_table_row_faiss(con, index_path, "m", encoder=enc)
+    delete_report(con, "R1")
+    _ingest_notes_table(con, "R0")
+    embed.build_or_update_table_row_faiss(con, index_path, "m", encoder=enc)
+
+    index = faiss.read_index(index_path)
+    db_ids = embed.stored_vec_ids(con, "m", "table_row")
+    assert index.ntotal == len(db_ids) == 400
+    assert set(embed._index_ids(index).tolist()) == set(db_ids.tolist())
+
+    row_text = con.execute(
+        "SELECT row_text FROM rag_table_row_embeddings WHERE table_id = 'R0-t' AND row_idx = 7").fetchone()[0]
+    assert row_text == "R0 항목7 | 당기말: 70"  # 행 라벨 열(col 0)은 row_path에만
+    q = enc.encode([row_text])[0]
+    hits = embed.search_table_row_vectors(con, q, ["R0"], "m", k=3, index=index, nprobe=index.nlist, exact_max=0)
+    assert hits[0][0] == ("R0-t", 7)
@@ -0,0 +1,31 @@
+# tests/test_embed_serving.py
+# load_index_for_serving: 모든 index 종류가 mmap(IO_FLAG_MMAP_IFC)으로 열리고 메모리 로드와 같은 결과를 내야 함
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from src.embed import INDEX_KINDS, _MMAP_FLAG, create_index, load_index_for_serving
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+def test_serving_mmap_matches_in_memory(tmp_path, kind):
+    n, dim = 5_000, 32
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    ids = np.arange(n, dtype=np.int64) * 7919 - (1 << 40)
+
+    index = create_index(kind, dim, n, x)
+    index.add_with_ids(x, ids)
+    path = str(tmp_path / f"{kind}.index")
+    faiss.write_index(index, path)
+
+    # fallback 없이 mmap 플래그로 직접 열려야 함
+    faiss.read_index(path, _MMAP_FLAG | faiss.IO_FLAG_READ_ONLY)
+
+    served = load_index_for_serving(path)
+    assert load_index_for_serving(path) is served
+    _, I_mem = faiss.read_index(path).search(x[:50], 5)
+    _, I_srv = served.search(x[:50], 5)
+    np.testing.assert_array_equal(I_srv, I_mem)